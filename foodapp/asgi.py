@@ -3,6 +3,10 @@ ASGI config for foodapp project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Run with an ASGI server, e.g.:
+
+    uvicorn foodapp.asgi:application --workers 4
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -12,5 +16,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodapp.settings')
+# Under ASGI the hot cart/order endpoints run as native async views
+os.environ.setdefault('FOODAPP_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -22,6 +22,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its wall time covers the rest of the stack
+    'main.metrics.metrics_middleware',
+    # Before sessions/auth, so the writes they make pin the browser to the primary
+    'main.routing.replica_middleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -36,7 +40,8 @@ ROOT_URLCONF = 'foodapp.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates plus render timing for main.metrics
+        'BACKEND': 'main.metrics.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -49,14 +54,125 @@ TEMPLATES = [
     },
 ]
 
+# Per-view request metrics (main/metrics.py) on /metrics, for staff, scrapers
+# sending "Authorization: Bearer $FOODAPP_METRICS_TOKEN", or scrapers from
+# METRICS_ALLOWED_IPS. Empty by default: behind a local reverse proxy every
+# request comes from 127.0.0.1. METRICS_SERVER_TIMING also reports each
+# request's SQL/template/total time in a Server-Timing response header.
+METRICS_ALLOWED_IPS = []
+METRICS_TOKEN = os.environ.get('FOODAPP_METRICS_TOKEN', '')
+METRICS_SERVER_TIMING = DEBUG
+
 WSGI_APPLICATION = 'foodapp.wsgi.application'
+ASGI_APPLICATION = 'foodapp.asgi.application'
+
+# Serve the native async cart/order views (orders/async_views.py,
+# restaurants/async_views.py). foodapp/asgi.py switches this on.
+ASYNC_VIEWS = os.environ.get('FOODAPP_ASYNC_VIEWS', '0') == '1'
 
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # File-backed test DB so threaded tests get real locking
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        # Keep connections (and their PRAGMAs, page cache and mmap) across requests
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# Applied to every new SQLite connection (main/sqlite.py). WAL lets readers
+# run alongside the one writer; synchronous=NORMAL only syncs at checkpoints
+# (a power cut can lose the last commits, never corrupt); busy_timeout (ms)
+# makes a writer wait for the lock rather than fail. Write paths also begin
+# with BEGIN IMMEDIATE (sqlite.write_atomic) and retry lock errors up to
+# SQLITE_LOCK_RETRIES times (sqlite.retry_on_lock).
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,
+}
+SQLITE_LOCK_RETRIES = 4
+
+# Catalog pages and read-only views read from a replica when there is one
+# (main/routing.py); writes, and a browser's reads for REPLICA_LAG_SECONDS
+# after it wrote, stay on the primary. FOODAPP_REPLICA=1 adds a local
+# stand-in: a second SQLite file that `manage.py replicate --interval 1`
+# keeps copying the primary into. Tests mirror it onto the primary.
+if os.environ.get('FOODAPP_REPLICA', '0') == '1':
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',
+        'OPTIONS': {'init_command': 'PRAGMA query_only = 1'},
+        'TEST': {'MIRROR': 'default'},
     }
+DATABASE_ROUTERS = ['main.routing.PrimaryReplicaRouter']
+REPLICA_LAG_SECONDS = 5
+
+# Catalog pages are cached per catalog version (main/catalog_cache.py). The
+# entries may be per process; the version is a database row all processes share.
+# Eviction is the backend's: locmem drops least-recently-used entries past
+# MAX_ENTRIES; file/db backends cull 1/CULL_FREQUENCY of entries when full.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalog': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'catalog',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 2000,
+            'CULL_FREQUENCY': 4,
+        },
+    },
+    # Live carts for CacheCartStore; entries never expire and an eviction
+    # drops unflushed clicks, so size this well above the active user count.
+    # Use a shared backend (Redis/Memcached) when running several processes.
+    'carts': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'carts',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
 }
+CATALOG_CACHE_ALIAS = 'catalog'
+
+# Where carts live (orders/cart.py): DBCartStore writes every click to the
+# PENDING order; CacheCartStore keeps carts in CART_CACHE_ALIAS and writes
+# them at checkout and every CART_FLUSH_INTERVAL seconds from a background
+# thread (0 disables it; `manage.py flush_carts` also flushes a shared cache).
+CART_STORE = 'orders.cart.DBCartStore'
+CART_CACHE_ALIAS = 'carts'
+CART_FLUSH_INTERVAL = 60
+
+# Finished orders older than this move to the archive tables when
+# `manage.py archive_orders` runs (orders/archive.py); order pages read both.
+ORDER_ARCHIVE_AFTER_DAYS = 90
+
+# Open order pages follow status changes over Server-Sent Events (ASGI
+# profile, orders/events.py); idle streams get a comment line this often.
+ORDER_EVENTS_KEEPALIVE = 15
+
+# `manage.py rollup_sales` (orders/rollups.py) leaves order changes younger
+# than this for its next run, so a write still committing isn't skipped.
+SALES_ROLLUP_LAG_SECONDS = 60
+
+# Home page trending foods and popular restaurants are ranked by order
+# volume decayed with this half-life, kept by `manage.py score_trending`
+# (main/trending.py), which likewise leaves the newest changes for later.
+TRENDING_HALF_LIFE_HOURS = 72
+TRENDING_LAG_SECONDS = 60
+
+# "Frequently ordered together" on the cart and menu pages: the top
+# neighbours kept per food by `manage.py build_recommendations`
+# (main/recommendations.py), which also lags behind the newest changes.
+RECOMMENDATIONS_PER_FOOD = 10
+RECOMMENDATIONS_LAG_SECONDS = 60
 
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -87,6 +203,13 @@ STATIC_ROOT = BASE_DIR / "staticfiles"
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Resized + WebP copies of uploaded images (main/renditions.py), made on a
+# background thread pool after each save; `manage.py build_renditions`
+# backfills existing media.
+IMAGE_RENDITION_WIDTHS = (320, 640, 960)
+IMAGE_RENDITION_WORKERS = 2
+IMAGE_RENDITIONS_BACKGROUND = True
+
 # Redirects for login/logout
 LOGIN_URL = '/users/login/'          # Where @login_required redirects if not logged in
 LOGIN_REDIRECT_URL = '/'             # Where user goes after login
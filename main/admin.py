@@ -1,14 +1,19 @@
 from django.contrib import admin
 from .models import FoodItem, Category, Offer, CartItem, Order, FavoriteItem
 
-class FoodItemAdmin(admin.ModelAdmin): list_display = ('name', 'category', 'price', 'is_trending')
+class FoodItemAdmin(admin.ModelAdmin): list_display = ('name', 'category', 'price', 'is_trending', 'trending_score')
 list_filter = ('is_trending',)
 search_fields = ('name',)
 
 
+class OfferAdmin(admin.ModelAdmin):
+    list_display = ('title', 'discount_amount', 'min_order_amount', 'is_active', 'valid_from', 'valid_until')
+    list_filter = ('is_active',)
+
+
 admin.site.register(FoodItem, FoodItemAdmin)
 admin.site.register(Category)
-admin.site.register(Offer)
+admin.site.register(Offer, OfferAdmin)
 admin.site.register(CartItem)
 admin.site.register(Order)
 admin.site.register(FavoriteItem)
\ No newline at end of file
@@ -0,0 +1,167 @@
+"""
+Versioned cache for catalog data (foods, restaurants, categories, offers).
+
+Entries are stored with Django's cache ``version`` set to a global catalog
+version.  Saving or deleting a FoodItem, Restaurant, Category or Offer bumps
+that version (see ``main.signals``), so every cached entry is superseded at
+once; stale entries are never read again and age out through the backend's
+own eviction, configured on ``CACHES['catalog']`` in settings.
+
+The entries may live in each process's own memory, but the version must not:
+a change saved by another worker or by a management command has to reach
+every process.  It is a ``CacheVersion`` row on the primary database, one
+indexed read per lookup.
+
+With a read replica (``main.routing``) a page built just after a change may
+come from rows that don't have it yet; such entries are only kept until the
+replica has had time to catch up since the version row's ``changed_at``.
+"""
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+from django.utils import timezone
+
+from . import routing
+from .models import CacheVersion
+
+VERSION_KEY = 'catalog:version'
+
+_MISSING = object()
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'catalog')]
+
+
+def _versions():
+    # Always the primary: a replica could hand back a version already superseded
+    return CacheVersion.objects.using(DEFAULT_DB_ALIAS)
+
+
+def _seed():
+    # From the clock, so a counter recreated (a fresh database, a test
+    # rolled back) never falls back onto a version cached entries still use
+    return {'value': time.time_ns() // 1000, 'changed_at': timezone.now()}
+
+
+def get_version_row(key=VERSION_KEY):
+    """
+    The ``CacheVersion`` row behind ``key``: the shared version and when it
+    last moved.
+    """
+    row = _versions().filter(name=key).first()
+    if row is None:
+        row = _versions().get_or_create(name=key, defaults=_seed())[0]
+    return row
+
+
+async def aget_version_row(key=VERSION_KEY):
+    row = await _versions().filter(name=key).afirst()
+    if row is None:
+        row = (await _versions().aget_or_create(name=key, defaults=_seed()))[0]
+    return row
+
+
+def get_version(key=VERSION_KEY):
+    """
+    Current catalog version (or another counter kept the same way under
+    ``key``), shared by every process through its ``CacheVersion`` row.
+    """
+    return get_version_row(key).value
+
+
+async def aget_version(key=VERSION_KEY):
+    return (await aget_version_row(key)).value
+
+
+def bump_version(key=VERSION_KEY):
+    """
+    Move ``key``'s version on, for every process.  Safe to call from
+    management commands: nothing here lives in the caller's memory.
+    """
+    if not _versions().filter(name=key).update(value=F('value') + 1, changed_at=timezone.now()):
+        get_version(key)
+        _versions().filter(name=key).update(value=F('value') + 1, changed_at=timezone.now())
+
+
+def _behind(row):
+    return timezone.now() - row.changed_at < timedelta(seconds=routing.lag_seconds())
+
+
+def replica_may_lag(row=None):
+    """
+    Whether this request reads the catalog from a replica that may not have
+    the last catalog change yet, made in any process.  ``row`` is the
+    catalog's ``CacheVersion`` if the caller has already read it.
+    """
+    return routing.uses_replica() and _behind(row or get_version_row())
+
+
+async def areplica_may_lag(row=None):
+    return routing.uses_replica() and _behind(row or await aget_version_row())
+
+
+def get_or_build(name, builder, *key_parts):
+    """
+    Return the cached value for ``name``/``key_parts`` at the current catalog
+    version, calling ``builder()`` and storing its result on a miss.
+    """
+    cache = get_cache()
+    key = ':'.join(['catalog', name, *map(str, key_parts)])
+    row = get_version_row()
+
+    value = cache.get(key, _MISSING, version=row.value)
+    with _stats_lock:
+        _stats[(name, 'hits' if value is not _MISSING else 'misses')] += 1
+
+    if value is _MISSING:
+        value = builder()
+        timeout = routing.lag_seconds() if replica_may_lag(row) else DEFAULT_TIMEOUT
+        cache.set(key, value, timeout, version=row.value)
+    return value
+
+
+async def aget_or_build(name, abuilder, *key_parts):
+    """
+    Async variant of ``get_or_build``; ``abuilder`` is a coroutine function.
+    """
+    cache = get_cache()
+    key = ':'.join(['catalog', name, *map(str, key_parts)])
+    row = await aget_version_row()
+
+    value = await cache.aget(key, _MISSING, version=row.value)
+    with _stats_lock:
+        _stats[(name, 'hits' if value is not _MISSING else 'misses')] += 1
+
+    if value is _MISSING:
+        value = await abuilder()
+        timeout = routing.lag_seconds() if await areplica_may_lag(row) else DEFAULT_TIMEOUT
+        await cache.aset(key, value, timeout, version=row.value)
+    return value
+
+
+def stats():
+    """
+    Hit/miss counters per cached view since process start:
+    ``{name: {'hits': int, 'misses': int}}``.
+    """
+    with _stats_lock:
+        snapshot = dict(_stats)
+    result = {}
+    for (name, outcome), count in snapshot.items():
+        result.setdefault(name, {'hits': 0, 'misses': 0})[outcome] = count
+    return result
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
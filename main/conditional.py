@@ -0,0 +1,125 @@
+"""
+Conditional GET (ETag / Last-Modified) for catalog pages.
+
+The validators come from values that are cheap to read and the same in
+every process: the shared catalog version, which every catalog write bumps
+(``main.signals``, or the management command that made it), and, for a
+signed-in user, their id, CSRF secret and shared favorites version.  A request
+whose ``If-None-Match`` matches gets a 304 before the view touches its
+querysets or renders a template.
+
+``Last-Modified`` is only sent to anonymous visitors: a signed-in user's page
+also changes with their favorites, which no timestamp records.  It comes from
+the view's ``last_modified`` function, or else the time the catalog version
+last moved.
+
+Responses vary on ``Cookie`` and must be revalidated (``no-cache``), and
+signed-in pages are ``private`` so shared caches never store them.  A page
+read from a replica that may not have the last catalog change yet gets no
+validators, since they would vouch for it until the next change.  Neither
+does a request with flash messages waiting (say "Dosa added to cart!" after
+a redirect): a 304 would leave them unseen until some later page.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from . import catalog_cache
+
+
+def favorites_version_key(user_id):
+    return f'favorites:version:{user_id}'
+
+
+def _etag(request, catalog_version, favorites_version):
+    parts = [request.get_full_path(), str(catalog_version)]
+    if request.user.is_authenticated:
+        # Signed-in pages render a CSRF token; get_token() makes sure the
+        # secret it derives from exists (and is set as a cookie) now
+        get_token(request)
+        parts += [str(request.user.pk), str(favorites_version), request.META['CSRF_COOKIE']]
+    digest = hashlib.blake2b('\n'.join(parts).encode(), digest_size=12).hexdigest()
+    # Weak: the CSRF token is masked differently on every render
+    return f'W/"{digest}"'
+
+
+def _has_messages(request):
+    # len() loads pending messages without marking them as shown
+    storage = getattr(request, '_messages', None)
+    return storage is not None and len(storage) > 0
+
+
+def _timestamp(modified):
+    return int(modified.timestamp()) if modified else None
+
+
+def _finish(request, response, etag, modified):
+    if etag and request.method in ('GET', 'HEAD') and response.status_code in (200, 304):
+        response.headers.setdefault('ETag', etag)
+        if modified and not response.has_header('Last-Modified'):
+            response.headers['Last-Modified'] = http_date(modified)
+    patch_vary_headers(response, ['Cookie'])
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+
+def catalog_conditional(last_modified=None):
+    """
+    Decorate a catalog view to answer conditional GETs.  ``last_modified``,
+    if given, is called like the view and returns an aware datetime (or
+    None); it only runs for anonymous requests.  Works on sync and async
+    views.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                user = request.user = await request.auser()
+                catalog = await catalog_cache.aget_version_row()
+                if (await catalog_cache.areplica_may_lag(catalog)
+                        or await sync_to_async(_has_messages)(request)):
+                    return _finish(request, await view(request, *args, **kwargs), None, None)
+                favorites_version = modified = None
+                if user.is_authenticated:
+                    favorites_version = await catalog_cache.aget_version(favorites_version_key(user.pk))
+                elif last_modified:
+                    modified = await sync_to_async(last_modified)(request, *args, **kwargs)
+                else:
+                    modified = catalog.changed_at
+                etag = _etag(request, catalog.value, favorites_version)
+                modified = _timestamp(modified)
+
+                response = get_conditional_response(request, etag=etag, last_modified=modified)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return _finish(request, response, etag, modified)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                user = request.user
+                catalog = catalog_cache.get_version_row()
+                if catalog_cache.replica_may_lag(catalog) or _has_messages(request):
+                    return _finish(request, view(request, *args, **kwargs), None, None)
+                favorites_version = modified = None
+                if user.is_authenticated:
+                    favorites_version = catalog_cache.get_version(favorites_version_key(user.pk))
+                elif last_modified:
+                    modified = last_modified(request, *args, **kwargs)
+                else:
+                    modified = catalog.changed_at
+                etag = _etag(request, catalog.value, favorites_version)
+                modified = _timestamp(modified)
+
+                response = get_conditional_response(request, etag=etag, last_modified=modified)
+                if response is None:
+                    response = view(request, *args, **kwargs)
+                return _finish(request, response, etag, modified)
+        return wrapper
+    return decorator
@@ -0,0 +1,55 @@
+"""
+Request-scoped favorites membership.
+
+The set of food ids a user has favorited is loaded with a single query and
+memoised on the ``User`` instance.  ``request.user`` lives exactly as long as
+the request, so every food card rendered for that request shares one lookup
+instead of issuing its own ``exists()`` query.
+"""
+from .models import FavoriteItem
+
+_CACHE_ATTR = '_favorite_food_ids'
+
+
+def favorite_food_ids(user):
+    """
+    Return a frozenset of ``FoodItem`` ids the user has favorited.
+    Anonymous users have no favorites.
+    """
+    if not getattr(user, 'is_authenticated', False):
+        return frozenset()
+
+    ids = getattr(user, _CACHE_ATTR, None)
+    if ids is None:
+        ids = frozenset(
+            FavoriteItem.objects.filter(user=user)
+            .values_list('food_item_id', flat=True)
+        )
+        setattr(user, _CACHE_ATTR, ids)
+    return ids
+
+
+async def afavorite_food_ids(user):
+    """
+    Async variant of ``favorite_food_ids``; fills the same memo, so the
+    template filter finds the set without touching the database.
+    """
+    if not getattr(user, 'is_authenticated', False):
+        return frozenset()
+
+    ids = getattr(user, _CACHE_ATTR, None)
+    if ids is None:
+        ids = frozenset([
+            food_id async for food_id in
+            FavoriteItem.objects.filter(user=user).values_list('food_item_id', flat=True)
+        ])
+        setattr(user, _CACHE_ATTR, ids)
+    return ids
+
+
+def forget_favorite_food_ids(user):
+    """
+    Drop the memoised set after the user's favorites change.
+    """
+    if hasattr(user, _CACHE_ATTR):
+        delattr(user, _CACHE_ATTR)
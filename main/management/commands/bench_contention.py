@@ -0,0 +1,155 @@
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections, transaction
+from django.test import override_settings
+
+from main import routing
+from main.models import FoodItem
+from main.sqlite import is_lock_error, retry_on_lock, write_atomic
+from orders.models import Order, OrderItem
+
+# Django's stock SQLite setup against the tuned one from settings
+PROFILES = {
+    'default': {
+        'pragmas': {'journal_mode': 'DELETE', 'synchronous': 'FULL', 'busy_timeout': 5000},
+        'immediate': False,
+        'retry': False,
+    },
+    'tuned': {
+        'pragmas': None,  # settings.SQLITE_PRAGMAS
+        'immediate': True,
+        'retry': True,
+    },
+}
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _worker_setup(path, pragmas):
+    # Forked workers inherit a configured Django; spawned ones need setup()
+    if multiprocessing.get_start_method() != 'fork':
+        django.setup()
+    connection.close()
+    connection.settings_dict['NAME'] = path
+    override_settings(SQLITE_PRAGMAS=pragmas).enable()
+
+
+def _warm_up(_):
+    connection.ensure_connection()
+    time.sleep(0.05)  # long enough for every worker to take one
+
+
+def _checkout(user_id, food_ids):
+    # Like checkout: read the cart's prices, then write the order
+    prices = dict(FoodItem.objects.filter(pk__in=food_ids).values_list('id', 'price'))
+    order = Order(user_id=user_id, status='PREPARING')
+    order.save()
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, food_id=food_id, quantity=1, price=price)
+        for food_id, price in prices.items()
+    ])
+    order.recalculate_total()
+
+
+def _run_worker(user_id, food_ids, transactions, immediate, retry, seed):
+    atomic = write_atomic if immediate else transaction.atomic
+    place = atomic()(_checkout)
+    if retry:
+        place = retry_on_lock(place)
+    rng = random.Random(seed)
+    latencies, locked = [], 0
+    for _ in range(transactions):
+        started = time.perf_counter()
+        try:
+            place(user_id, rng.sample(food_ids, min(3, len(food_ids))))
+        except OperationalError as e:
+            if not is_lock_error(e):
+                raise
+            locked += 1
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+    connection.close()
+    return latencies, locked
+
+
+class Command(BaseCommand):
+    help = (
+        "Multi-process write-contention benchmark: concurrent checkouts against a copy of "
+        "the database with Django's stock SQLite setup and with the tuned one"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', choices=sorted(PROFILES), action='append',
+                            help="Profile(s) to run; default both")
+        parser.add_argument('--processes', type=int, default=8)
+        parser.add_argument('--transactions', type=int, default=100, help="Checkouts per process")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("bench_contention compares SQLite setups; this database is "
+                               f"{connection.vendor}")
+        user_ids = list(User.objects.order_by('id').values_list('id', flat=True)[:options['processes']])
+        food_ids = list(FoodItem.objects.order_by('id').values_list('id', flat=True)[:200])
+        if not user_ids or not food_ids:
+            raise CommandError("No users or foods in the database; run seed_data first.")
+
+        self.stdout.write(f"{options['processes']} processes x {options['transactions']} checkouts\n")
+        tmp = tempfile.mkdtemp(prefix='bench_contention_')
+        try:
+            results = {}
+            for name in options['profile'] or ['default', 'tuned']:
+                results[name] = self._run(name, os.path.join(tmp, f'{name}.sqlite3'),
+                                          user_ids, food_ids, options)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self.stdout.write("\n----- SUMMARY -----")
+        for name, (latencies, locked, elapsed) in results.items():
+            if not latencies:
+                self.stdout.write(self.style.ERROR(f"{name:<8} no checkout committed ({locked} locked)"))
+                continue
+            self.stdout.write(
+                f"{name:<8} {len(latencies) / elapsed:8.1f} tx/s   "
+                f"p50 {_percentile(latencies, 50):7.1f} ms   "
+                f"p99 {_percentile(latencies, 99):7.1f} ms   "
+                f"mean {statistics.mean(latencies):7.1f} ms   "
+                f"committed {len(latencies)}   failed (locked) {locked}"
+            )
+        self.stdout.write("-------------------")
+
+    def _run(self, name, path, user_ids, food_ids, options):
+        profile = PROFILES[name]
+        pragmas = profile['pragmas']
+        if pragmas is None:
+            pragmas = settings.SQLITE_PRAGMAS
+        # Every profile starts from the same snapshot, in its own journal mode
+        routing.replicate(settings.DATABASES['default']['NAME'], path)
+        connections.close_all()  # nothing open to share with forked workers
+
+        processes = options['processes']
+        with multiprocessing.Pool(processes, initializer=_worker_setup, initargs=(path, pragmas)) as pool:
+            # Warm up: every worker connects (and sets its PRAGMAs) before timing
+            pool.map(_warm_up, range(processes), chunksize=1)
+            started = time.perf_counter()
+            runs = pool.starmap(_run_worker, [
+                (user_ids[n % len(user_ids)], food_ids, options['transactions'],
+                 profile['immediate'], profile['retry'], n)
+                for n in range(processes)
+            ], chunksize=1)
+            elapsed = time.perf_counter() - started
+
+        latencies = [ms for run, _ in runs for ms in run]
+        return latencies, sum(locked for _, locked in runs), elapsed
@@ -0,0 +1,78 @@
+import logging
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from main import metrics
+
+METRICS_MIDDLEWARE = 'main.metrics.metrics_middleware'
+TIMED_BACKEND = 'main.metrics.TimedDjangoTemplates'
+
+
+def _without_metrics():
+    templates = [
+        {**engine, 'BACKEND': 'django.template.backends.django.DjangoTemplates'}
+        if engine['BACKEND'] == TIMED_BACKEND else engine
+        for engine in settings.TEMPLATES
+    ]
+    return override_settings(
+        MIDDLEWARE=[m for m in settings.MIDDLEWARE if m != METRICS_MIDDLEWARE],
+        TEMPLATES=templates,
+    )
+
+
+class Command(BaseCommand):
+    help = "Measure the request metrics' overhead on a view (default: home) against the same stack without them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default=None, help="Path to request (default: the home page)")
+        parser.add_argument('--requests', type=int, default=300, help="Requests per round and setup")
+        parser.add_argument('--rounds', type=int, default=7,
+                            help="Alternating rounds; the median round is reported")
+        parser.add_argument('--max-overhead', type=float, default=0.05,
+                            help="Fail above this fractional slowdown")
+
+    def handle(self, *args, **options):
+        if METRICS_MIDDLEWARE not in settings.MIDDLEWARE:
+            raise CommandError(f"{METRICS_MIDDLEWARE} is not in MIDDLEWARE")
+        url = options['url'] or reverse('home')
+        hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        request_logger = logging.getLogger('django.request')
+        log_level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+
+        try:
+            with override_settings(ALLOWED_HOSTS=hosts):
+                # Alternate the two setups so drift (CPU frequency, caches
+                # warming) hits both alike
+                plain, timed = [], []
+                for _ in range(options['rounds']):
+                    with _without_metrics():
+                        plain.append(self._round(url, options['requests']))
+                    timed.append(self._round(url, options['requests']))
+        finally:
+            request_logger.setLevel(log_level)
+            metrics.reset()  # drop the benchmark's own samples
+
+        base, instrumented = statistics.median(plain), statistics.median(timed)
+        overhead = instrumented / base - 1
+        self.stdout.write(f"{url}: {options['requests']} requests x {options['rounds']} rounds")
+        self.stdout.write(f"without metrics  {base * 1e6:9.1f} µs/request")
+        self.stdout.write(f"with metrics     {instrumented * 1e6:9.1f} µs/request")
+        self.stdout.write(f"overhead         {overhead * 100:+9.2f} %  "
+                          f"({(instrumented - base) * 1e6:+.1f} µs/request)")
+        if overhead > options['max_overhead']:
+            raise CommandError(f"Metrics overhead {overhead:.1%} exceeds {options['max_overhead']:.0%}")
+
+    @staticmethod
+    def _round(url, count):
+        client = Client()
+        client.get(url)  # load the middleware chain, warm caches
+        started = time.perf_counter()
+        for _ in range(count):
+            client.get(url)
+        return (time.perf_counter() - started) / count
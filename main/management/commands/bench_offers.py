@@ -0,0 +1,107 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from main import offers
+from main.models import Offer
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = "Benchmark the in-memory best-offer index against per-request queries (rolled back afterwards)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--offers', type=int, default=5000)
+        parser.add_argument('--lookups', type=int, default=2000,
+                            help="Cart totals priced per engine")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        totals = [Decimal(rng.randint(50, 3000)) for _ in range(options['lookups'])]
+
+        with transaction.atomic():
+            self._seed(rng, options['offers'])
+            now = timezone.now()
+
+            started = time.perf_counter()
+            offers.invalidate()
+            index = offers.get_index()
+            self.stdout.write(
+                f"Index of {len(index)} live offers built in "
+                f"{(time.perf_counter() - started) * 1000:.1f} ms\n"
+            )
+
+            # The index must agree with the equivalent query on every total
+            for total in totals[:200]:
+                expected = self._best_query(total, now)
+                got = index.best_for(total)
+                if (expected and expected.discount_amount) != (got and got.discount_amount):
+                    raise CommandError(f"Index disagrees with the query at total {total}")
+
+            engines = {
+                'top-offer query': self._top_offer_query,
+                'best-offer query': lambda total: self._best_query(total, now),
+                'offer index': offers.price,
+            }
+            for name, run in engines.items():
+                samples = []
+                for total in totals:
+                    started = time.perf_counter()
+                    run(total)
+                    samples.append((time.perf_counter() - started) * 1_000_000)
+                self.stdout.write(
+                    f"{name:<17} mean {statistics.mean(samples):9.1f} µs   "
+                    f"p50 {_percentile(samples, 50):9.1f} µs   "
+                    f"p99 {_percentile(samples, 99):9.1f} µs"
+                )
+
+            # Leave the database exactly as it was
+            transaction.set_rollback(True)
+        offers.invalidate()
+
+    def _seed(self, rng, count):
+        now = timezone.now()
+        batch = []
+        for i in range(count):
+            offer = Offer(
+                title=f"Offer {i}",
+                min_order_amount=Decimal(rng.randint(0, 2500)),
+                discount_amount=Decimal(rng.randint(10, 400)),
+                is_active=rng.random() < 0.9,
+            )
+            # A third of the offers only run for a window around now
+            if rng.random() < 0.33:
+                offer.valid_from = now - timedelta(days=rng.randint(-3, 10))
+                offer.valid_until = offer.valid_from + timedelta(days=rng.randint(1, 14))
+            batch.append(offer)
+        Offer.objects.bulk_create(batch, batch_size=1000)
+        self.stdout.write(f"Seeded {count} offers\n")
+
+    @staticmethod
+    def _top_offer_query(total):
+        # The original pricing: one query, only ever the biggest offer
+        offer = Offer.objects.filter(is_active=True).order_by('-discount_amount').first()
+        return offer if offer and total >= offer.min_order_amount else None
+
+    @staticmethod
+    def _best_query(total, now):
+        # What a correct per-request query would have to do
+        return (
+            Offer.objects.filter(is_active=True, discount_amount__gt=0, min_order_amount__lte=total)
+            .filter(Q(valid_from__isnull=True) | Q(valid_from__lte=now))
+            .filter(Q(valid_until__isnull=True) | Q(valid_until__gt=now))
+            .order_by('-discount_amount', 'min_order_amount', 'id')
+            .first()
+        )
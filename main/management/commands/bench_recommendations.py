@@ -0,0 +1,123 @@
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from main import recommendations, routing
+from main.models import FoodItem, FoodRecommendation, JobWatermark
+from orders.management.commands.bench_dashboard import double_history
+from orders.models import Order, OrderItem
+
+
+def _median_time(fn, repeat=20):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+class Command(BaseCommand):
+    help = (
+        "Recommender benchmark on a copy of the database: doubles the order history a few "
+        "times and measures the full build (time and peak memory), an incremental refresh "
+        "and the page lookups"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doublings', type=int, default=4)
+        parser.add_argument('--changes', type=int, default=100,
+                            help="Orders changed before each incremental refresh")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("bench_recommendations works on a copy of the SQLite database; "
+                               f"this database is {connection.vendor}")
+        if not Order.objects.exclude(status='PENDING').exists():
+            raise CommandError("No orders in the database; run seed_data first.")
+
+        tmp = tempfile.mkdtemp(prefix='bench_recommendations_')
+        path = os.path.join(tmp, 'db.sqlite3')
+        routing.replicate(settings.DATABASES['default']['NAME'], path)
+        connection.close()
+        original = connection.settings_dict['NAME']
+        connection.settings_dict['NAME'] = path
+        try:
+            results = self._run(options)
+        finally:
+            connection.close()
+            connection.settings_dict['NAME'] = original
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self.stdout.write("\n----- SUMMARY -----")
+        self.stdout.write(f"{'items':>10} {'load':>8} {'build':>8} {'store':>8} {'peak mem':>9} "
+                          f"{'rows':>9} {'incremental':>12} {'cart':>8} {'menu':>8}")
+        for row in results:
+            self.stdout.write(
+                f"{row['items']:>10,} {row['load']:>7.2f}s {row['build']:>7.2f}s {row['store']:>7.2f}s "
+                f"{row['memory'] / 1024 / 1024:>7.1f}MB {row['rows']:>9,} {row['incremental']:>11.2f}s "
+                f"{row['cart'] * 1e3:>6.2f}ms {row['menu'] * 1e3:>6.2f}ms"
+            )
+        self.stdout.write(f"load: stream the order lines; build: the sparse products and top "
+                          f"{recommendations.per_food()}; peak mem: traced memory of load + build, rows streamed; "
+                          f"incremental: after changing {options['changes']} orders; cart/menu: "
+                          f"for_foods() of 3 foods, pairs() of a restaurant's menu")
+        self.stdout.write("-------------------")
+
+    def _run(self, options):
+        results = []
+        for step in range(options['doublings'] + 1):
+            if step:
+                double_history(step)
+
+            started = time.perf_counter()
+            baskets = recommendations.load_baskets()
+            load = time.perf_counter() - started
+            started = time.perf_counter()
+            rows = list(recommendations.neighbours(*baskets))
+            build = time.perf_counter() - started
+            del baskets
+            started = time.perf_counter()
+            recommendations.store(rows)
+            store = time.perf_counter() - started
+            del rows
+            # Again under tracemalloc, which slows the per-line Python loop
+            # several times over, for the peak memory
+            tracemalloc.start()
+            for _ in recommendations.neighbours(*recommendations.load_baskets()):
+                pass
+            memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            # What a full refresh() would leave: the doubled orders are all seen
+            JobWatermark.objects.update_or_create(
+                name=recommendations.WATERMARK, defaults={'value': timezone.now()})
+
+            changed = list(Order.objects.filter(status='PREPARING')
+                           .values_list('id', flat=True)[:options['changes']])
+            Order.objects.filter(pk__in=changed).update(status='CANCELLED', updated_at=timezone.now())
+            started = time.perf_counter()
+            recommendations.refresh(lag=0)
+            incremental = time.perf_counter() - started
+
+            cart = list(FoodRecommendation.objects.values_list('food_id', flat=True)
+                        .order_by('-orders')[:3])
+            menu = list(FoodItem.objects.filter(
+                restaurant_id=FoodItem.objects.get(pk=cart[0]).restaurant_id).values_list('id', flat=True))
+            row = {
+                'items': OrderItem.objects.count(), 'load': load, 'build': build, 'store': store,
+                'memory': memory, 'rows': FoodRecommendation.objects.count(), 'incremental': incremental,
+                'cart': _median_time(lambda: recommendations.for_foods(cart)),
+                'menu': _median_time(lambda: recommendations.pairs(menu)),
+            }
+            results.append(row)
+            self.stderr.write(f"... {row['items']:,} items: build {load + build + store:.2f}s, "
+                              f"incremental {incremental:.2f}s")
+        return results
@@ -0,0 +1,108 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from main.models import Category, FoodItem
+from main.search import FTS5Backend, InvertedIndexBackend
+from restaurants.models import Restaurant
+
+DISHES = [
+    'Paneer', 'Chicken', 'Mutton', 'Veg', 'Egg', 'Prawn', 'Fish', 'Mushroom',
+    'Aloo', 'Gobi', 'Dal', 'Masala', 'Butter', 'Tandoori', 'Schezwan', 'Malai',
+]
+STYLES = [
+    'Biryani', 'Tikka', 'Curry', 'Dosa', 'Roll', 'Burger', 'Pizza', 'Noodles',
+    'Fried Rice', 'Kebab', 'Korma', 'Paratha', 'Sandwich', 'Soup', 'Momos',
+]
+WORDS = ['spicy', 'creamy', 'crispy', 'smoky', 'tangy', 'fresh', 'home', 'style',
+         'served', 'with', 'chutney', 'raita', 'salad', 'gravy', 'special']
+# Broad queries match a large share of the catalog, narrow ones a handful
+BROAD_QUERIES = ['pan', 'chicken bir', 'butter', 'dosa', 'crispy roll', 'momos']
+SYLLABLES = ['ka', 'ri', 'mo', 'tha', 'lu', 'pe', 'sa', 'vi', 'do', 'ne', 'ra', 'gu']
+
+
+def _signature_words(rng, count):
+    # Restaurant-specific dish names ("kariluthi") give the catalog a long tail
+    return [''.join(rng.choice(SYLLABLES) for _ in range(4)) for _ in range(count)]
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = "Benchmark indexed food search against the old icontains scan (rolled back afterwards)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=100_000)
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Times each query is run per engine")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        with transaction.atomic():
+            signature = _signature_words(rng, max(100, options['items'] // 20))
+            self._seed(rng, options['items'], signature)
+            queries = BROAD_QUERIES + rng.sample(signature, 6) + [w[:5] for w in rng.sample(signature, 6)]
+
+            engines = {'icontains scan': self._scan}
+            if FTS5Backend.is_available():
+                fts = FTS5Backend()
+                self._time_build('fts5', fts)
+                engines['fts5'] = fts.search
+            python_index = InvertedIndexBackend()
+            self._time_build('python', python_index)
+            engines['python index'] = python_index.search
+
+            for name, run in engines.items():
+                samples = []
+                for _ in range(options['repeat']):
+                    for query in queries:
+                        started = time.perf_counter()
+                        run(query)
+                        samples.append((time.perf_counter() - started) * 1000)
+                self.stdout.write(
+                    f"{name:<15} mean {statistics.mean(samples):8.2f} ms   "
+                    f"p50 {_percentile(samples, 50):8.2f} ms   "
+                    f"p95 {_percentile(samples, 95):8.2f} ms"
+                )
+
+            # Leave the database exactly as it was
+            transaction.set_rollback(True)
+
+    def _seed(self, rng, items, signature):
+        started = time.perf_counter()
+        restaurants = Restaurant.objects.bulk_create(
+            Restaurant(name=f"{rng.choice(DISHES)} House {i}") for i in range(max(1, items // 500))
+        )
+        categories = Category.objects.bulk_create(Category(name=style) for style in STYLES)
+        batch = []
+        for _ in range(items):
+            batch.append(FoodItem(
+                restaurant=rng.choice(restaurants),
+                category=rng.choice(categories),
+                name=f"{rng.choice(DISHES)} {rng.choice(STYLES)} {rng.choice(signature).title()}",
+                description=' '.join(rng.sample(WORDS, 4) + [rng.choice(signature)]),
+                price=rng.randint(50, 500),
+            ))
+            if len(batch) == 5000:
+                FoodItem.objects.bulk_create(batch)
+                batch = []
+        FoodItem.objects.bulk_create(batch)
+        self.stdout.write(f"Seeded {items} food items in {time.perf_counter() - started:.1f}s\n")
+
+    def _time_build(self, name, backend):
+        started = time.perf_counter()
+        backend.rebuild()
+        self.stdout.write(f"{name} index built in {time.perf_counter() - started:.1f}s")
+
+    @staticmethod
+    def _scan(query):
+        # The pre-index implementation: unranked, unbounded substring scan
+        return list(FoodItem.objects.filter(name__icontains=query).values_list('id', flat=True))
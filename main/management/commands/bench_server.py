@@ -0,0 +1,155 @@
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from restaurants.models import Restaurant
+
+# Server command lines per deployment profile; same worker count for both
+PROFILES = {
+    'wsgi': [
+        'gunicorn', 'foodapp.wsgi:application',
+        '--workers', '{workers}', '--bind', '127.0.0.1:{port}', '--log-level', 'warning',
+    ],
+    'asgi': [
+        'uvicorn', 'foodapp.asgi:application',
+        '--workers', '{workers}', '--host', '127.0.0.1', '--port', '{port}',
+        '--log-level', 'warning', '--no-access-log',
+    ],
+}
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Command(BaseCommand):
+    help = "Load-test the WSGI and ASGI deployments at a fixed worker count (requests/sec, p50, p99)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', choices=sorted(PROFILES), action='append',
+                            help="Profile(s) to run; default both")
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--concurrency', type=int, default=32,
+                            help="Client threads issuing requests in parallel")
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds per profile")
+        parser.add_argument('--path', action='append',
+                            help="URL path to request (repeatable); default menu + my orders")
+
+    def handle(self, *args, **options):
+        restaurant = Restaurant.objects.order_by('id').first()
+        if restaurant is None:
+            raise CommandError("No restaurants in the database; seed some data first.")
+        paths = options['path'] or [f'/restaurants/{restaurant.id}/', '/orders/my-orders/']
+        cookie = self._session_cookie()
+
+        self.stdout.write(
+            f"{options['workers']} workers, {options['concurrency']} clients, "
+            f"{options['duration']:.0f}s each, paths: {', '.join(paths)}\n"
+        )
+        for profile in options['profile'] or ['wsgi', 'asgi']:
+            port = _free_port()
+            server = self._start(profile, port, options['workers'])
+            try:
+                latencies, errors = self._load(port, paths, cookie, options)
+            finally:
+                server.terminate()
+                server.wait(timeout=10)
+
+            if not latencies:
+                self.stdout.write(self.style.ERROR(f"{profile}: no successful requests"))
+                continue
+            self.stdout.write(
+                f"{profile:<5} {len(latencies) / options['duration']:8.1f} req/s   "
+                f"p50 {_percentile(latencies, 50):7.1f} ms   "
+                f"p99 {_percentile(latencies, 99):7.1f} ms   "
+                f"mean {statistics.mean(latencies):7.1f} ms   errors {errors}"
+            )
+
+    def _session_cookie(self):
+        # Logged-in session so the login_required endpoints do real work
+        user, created = User.objects.get_or_create(username='bench-user')
+        if created:
+            user.set_unusable_password()
+            user.save()
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = str(user.pk)
+        session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.save()
+        return f"{settings.SESSION_COOKIE_NAME}={session.session_key}"
+
+    def _start(self, profile, port, workers):
+        command = [part.format(port=port, workers=workers) for part in PROFILES[profile]]
+        env = dict(os.environ, FOODAPP_ASYNC_VIEWS='1' if profile == 'asgi' else '0')
+        try:
+            server = subprocess.Popen(command, env=env, cwd=settings.BASE_DIR,
+                                      stdout=subprocess.DEVNULL, stderr=sys.stderr)
+        except FileNotFoundError:
+            raise CommandError(f"{command[0]} is not installed (see requirements.txt)")
+
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"{profile} server exited with code {server.returncode}")
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError(f"{profile} server did not start listening on port {port}")
+
+    def _load(self, port, paths, cookie, options):
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+        stop_at = time.monotonic() + options['duration']
+
+        def client(offset):
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            own, failed, i = [], 0, offset
+            while time.monotonic() < stop_at:
+                path = paths[i % len(paths)]
+                i += 1
+                started = time.perf_counter()
+                try:
+                    conn.request('GET', path, headers={'Cookie': cookie})
+                    response = conn.getresponse()
+                    response.read()
+                    if response.status >= 400:
+                        failed += 1
+                        continue
+                    own.append((time.perf_counter() - started) * 1000)
+                except (OSError, http.client.HTTPException):
+                    failed += 1
+                    conn.close()
+                    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            conn.close()
+            with lock:
+                latencies.extend(own)
+                errors[0] += failed
+
+        threads = [threading.Thread(target=client, args=(n,)) for n in range(options['concurrency'])]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return latencies, errors[0]
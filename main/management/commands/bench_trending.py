@@ -0,0 +1,112 @@
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+
+from main import routing, trending
+from main.models import FoodItem
+from orders.management.commands.bench_dashboard import double_history
+from orders.models import Order, OrderItem
+from restaurants.models import Restaurant
+
+
+class Command(BaseCommand):
+    help = (
+        "Trending score benchmark on a copy of the database: doubles the order history "
+        "a few times and times the full scoring pass, an incremental run and the home "
+        "page's top-K reads"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doublings', type=int, default=4)
+        parser.add_argument('--half-life-hours', type=float,
+                            help="Default: settings.TRENDING_HALF_LIFE_HOURS.  A long one puts "
+                                 "all the history inside the scoring horizon")
+        parser.add_argument('--changes', type=int, default=100,
+                            help="Orders changed before each incremental run")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("bench_trending works on a copy of the SQLite database; this "
+                               f"database is {connection.vendor}")
+        if not Order.objects.exclude(status='PENDING').exists():
+            raise CommandError("No orders in the database; run seed_data first.")
+        half_life = options['half_life_hours'] or settings.TRENDING_HALF_LIFE_HOURS
+
+        tmp = tempfile.mkdtemp(prefix='bench_trending_')
+        path = os.path.join(tmp, 'db.sqlite3')
+        routing.replicate(settings.DATABASES['default']['NAME'], path)
+        connection.close()
+        original = connection.settings_dict['NAME']
+        connection.settings_dict['NAME'] = path
+        try:
+            with override_settings(TRENDING_HALF_LIFE_HOURS=half_life):
+                results = self._run(options)
+        finally:
+            connection.close()
+            connection.settings_dict['NAME'] = original
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self.stdout.write("\n----- SUMMARY -----")
+        self.stdout.write(f"Half-life: {half_life:g} h (horizon {half_life * trending.HORIZON_HALF_LIVES / 24:g} days)")
+        self.stdout.write(f"{'items':>10} {'scored':>10} {'foods':>8} {'full pass':>10} {'items/s':>10} "
+                          f"{'peak mem':>9} {'incremental':>12} {'top-K':>8}")
+        for row in results:
+            self.stdout.write(
+                f"{row['items']:>10,} {row['scored']:>10,} {row['foods']:>8,} {row['full']:>9.2f}s "
+                f"{row['scored'] / row['full']:>10,.0f} {row['memory'] / 1024 / 1024:>7.1f}MB "
+                f"{row['incremental']:>11.2f}s {row['top'] * 1e3:>6.2f}ms"
+            )
+        self.stdout.write(f"full pass: stream + store every score; peak mem: traced Python memory "
+                          f"of the pass; incremental: after changing {options['changes']} orders; "
+                          f"top-K: the home page's two reads")
+        self.stdout.write("-------------------")
+
+    def _run(self, options):
+        results = []
+        for step in range(options['doublings'] + 1):
+            if step:
+                double_history(step)
+            started = time.perf_counter()
+            trending.refresh(full=True, lag=0)
+            full = time.perf_counter() - started
+
+            since = timezone.now() - trending.HORIZON_HALF_LIVES * trending.half_life()
+            scored = OrderItem.objects.filter(order__created_at__gt=since).count()
+            tracemalloc.start()
+            trending.stream_scores(OrderItem.objects.all(), trending.get_epoch(), since)
+            memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            changed = list(Order.objects.filter(status='PREPARING')
+                           .values_list('id', flat=True)[:options['changes']])
+            Order.objects.filter(pk__in=changed).update(status='CANCELLED', updated_at=timezone.now())
+            started = time.perf_counter()
+            trending.refresh(lag=0)
+            incremental = time.perf_counter() - started
+
+            samples = []
+            for _ in range(20):
+                started = time.perf_counter()
+                list(FoodItem.objects.filter(trending_score__gt=0).order_by('-trending_score', '-id')[:6])
+                list(Restaurant.objects.filter(popularity_score__gt=0)
+                     .order_by('-popularity_score', '-id')[:6])
+                samples.append(time.perf_counter() - started)
+
+            row = {
+                'items': OrderItem.objects.count(), 'scored': scored, 'foods': FoodItem.objects.count(),
+                'full': full, 'memory': memory, 'incremental': incremental,
+                'top': statistics.median(samples),
+            }
+            results.append(row)
+            self.stderr.write(f"... {row['items']:,} items: full pass {full:.2f}s, "
+                              f"incremental {incremental:.2f}s")
+        return results
@@ -0,0 +1,219 @@
+import json
+import logging
+import platform
+import re
+import statistics
+import time
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLResolver, get_resolver
+from django.urls.resolvers import RoutePattern
+
+from main.models import Category, FoodItem, Offer
+from orders.cart import get_cart_store
+from orders.models import Order
+from restaurants.models import Restaurant
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'views.json'
+
+# URL namespaces not worth benchmarking
+SKIP_NAMESPACES = {'admin'}
+
+# Endpoints that only accept POST, with the body to send
+POST_BODIES = {
+    'cart_batch': lambda ctx: json.dumps([{'food_id': ctx['food_id'], 'delta': 1}]),
+}
+
+_PARAM_RE = re.compile(r'<(?:\w+:)?(\w+)>')
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def _routes(resolver, prefix=''):
+    """
+    Yield ``(route, name)`` for every path() below ``resolver``.
+    """
+    for pattern in resolver.url_patterns:
+        if not isinstance(pattern.pattern, RoutePattern):
+            continue  # regex patterns, e.g. static()/media serving
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            if pattern.namespace not in SKIP_NAMESPACES:
+                yield from _routes(pattern, route)
+        else:
+            yield '/' + route, pattern.name
+
+
+def url_context():
+    """
+    Values for URL parameters, taken from the existing data, plus the user
+    to request them as.
+    """
+    restaurant = Restaurant.objects.filter(foods__isnull=False).order_by('id').first()
+    if restaurant is None:
+        raise CommandError("No restaurants with food items; run `manage.py seed_data` first.")
+    food = restaurant.foods.order_by('id').first()
+    order = Order.objects.exclude(status='PENDING').order_by('-id').first()
+    user = order.user if order else User.objects.get_or_create(username='bench-user')[0]
+    category = food.category or Category.objects.order_by('id').first()
+    offer = food.offer or Offer.objects.order_by('id').first()
+
+    ctx = {'user': user, 'pk': restaurant.pk, 'food_id': food.pk}
+    if order:
+        ctx['order_id'] = order.pk
+    if category:
+        ctx['category_id'] = category.pk
+    if offer:
+        ctx['offer_id'] = offer.pk
+    return ctx
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every URL through the test client, record latency percentiles and "
+        "query counts, and compare against a JSON baseline (changes are rolled back)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE)
+        parser.add_argument('--update', action='store_true',
+                            help="Write this run as the new baseline instead of comparing")
+        parser.add_argument('--output', type=Path, help="Also write this run's results here")
+        parser.add_argument('--repeat', type=int, default=30, help="Timed requests per URL")
+        parser.add_argument('--warmup', type=int, default=3, help="Untimed requests per URL first")
+        parser.add_argument('--route', action='append',
+                            help="Only URLs whose route contains this text (repeatable)")
+        parser.add_argument('--max-slowdown', type=float, default=0.3,
+                            help="Allowed p50 increase over the baseline, as a fraction")
+        parser.add_argument('--noise-ms', type=float, default=2.0,
+                            help="p50 increases below this many ms never count as regressions")
+
+    def handle(self, *args, **options):
+        # Error responses show up in the report's status column; a traceback
+        # per request would bury it
+        request_logger = logging.getLogger('django.request')
+        log_level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            results = self._run(options)
+        finally:
+            request_logger.setLevel(log_level)
+
+        run = {
+            'meta': {
+                'repeat': options['repeat'],
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'views': results,
+        }
+        if options['output']:
+            self._write(options['output'], run)
+        if options['update']:
+            self._write(options['baseline'], run)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {options['baseline']}"))
+            return
+        if not options['baseline'].exists():
+            self.stdout.write(f"No baseline at {options['baseline']}; run with --update to create one.")
+            return
+        self._compare(json.loads(options['baseline'].read_text())['views'], results, options)
+
+    def _run(self, options):
+        # The test client's host, without setup_test_environment()'s
+        # template instrumentation skewing the timings
+        hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        with override_settings(ALLOWED_HOSTS=hosts), transaction.atomic():
+            ctx = url_context()
+            client = Client(raise_request_exception=False)
+            client.force_login(ctx['user'])
+            # Something in the cart so cart and checkout pages do real work
+            get_cart_store().add(ctx['user'], FoodItem.objects.get(pk=ctx['food_id']))
+
+            results = {}
+            for route, name in _routes(get_resolver()):
+                if options['route'] and not any(part in route for part in options['route']):
+                    continue
+                try:
+                    path = _PARAM_RE.sub(lambda m: str(ctx[m.group(1)]), route)
+                except KeyError as e:
+                    self.stdout.write(self.style.WARNING(f"skip {route}: no value for {e}"))
+                    continue
+                results[route] = self._measure(client, path, name, ctx, options)
+                self._print(route, results[route])
+
+            # Leave the database exactly as it was
+            transaction.set_rollback(True)
+        return results
+
+    def _measure(self, client, path, name, ctx, options):
+        body = POST_BODIES.get(name)
+        samples, queries = [], 0
+        for i in range(options['warmup'] + options['repeat']):
+            # Every request starts from the same data: undo its writes
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    if body:
+                        response = client.post(path, body(ctx), content_type='application/json')
+                    else:
+                        response = client.get(path)
+                    elapsed = (time.perf_counter() - started) * 1000
+                transaction.set_rollback(True)
+            if i >= options['warmup']:
+                samples.append(elapsed)
+                queries = max(queries, len(captured))
+        return {
+            'name': name,
+            'method': 'POST' if body else 'GET',
+            'status': response.status_code,
+            'queries': queries,
+            'mean_ms': round(statistics.mean(samples), 3),
+            'p50_ms': round(_percentile(samples, 50), 3),
+            'p95_ms': round(_percentile(samples, 95), 3),
+            'p99_ms': round(_percentile(samples, 99), 3),
+        }
+
+    def _print(self, route, result):
+        line = (
+            f"{route:<45} {result['status']:>3}  q={result['queries']:<3} "
+            f"p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+            f"p99 {result['p99_ms']:8.2f} ms"
+        )
+        self.stdout.write(self.style.ERROR(line) if result['status'] >= 500 else line)
+
+    @staticmethod
+    def _write(path, run):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(run, indent=2, sort_keys=True) + '\n')
+
+    def _compare(self, baseline, results, options):
+        regressions = []
+        for route, result in results.items():
+            base = baseline.get(route)
+            if base is None:
+                self.stdout.write(f"new: {route} (not in baseline)")
+                continue
+            if result['status'] != base['status']:
+                regressions.append(f"{route}: status {base['status']} -> {result['status']}")
+            if result['queries'] > base['queries']:
+                regressions.append(f"{route}: queries {base['queries']} -> {result['queries']}")
+            slower = result['p50_ms'] - base['p50_ms']
+            if slower > options['noise_ms'] and result['p50_ms'] > base['p50_ms'] * (1 + options['max_slowdown']):
+                regressions.append(f"{route}: p50 {base['p50_ms']:.2f} -> {result['p50_ms']:.2f} ms")
+
+        if regressions:
+            for line in regressions:
+                self.stdout.write(self.style.ERROR(line))
+            raise CommandError(f"{len(regressions)} regression(s) against {options['baseline']}")
+        self.stdout.write(self.style.SUCCESS(f"No regressions against {options['baseline']}"))
@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main import recommendations
+from main.models import FoodRecommendation
+
+
+class Command(BaseCommand):
+    help = (
+        "Update the \"frequently ordered together\" recommendations: rebuild the foods in "
+        "orders changed since the last run (every food on the first run, or with --full)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Rebuild every food's neighbours")
+        parser.add_argument('--lag', type=int,
+                            help="Leave changes younger than this many seconds for the next run "
+                                 "(default: settings.RECOMMENDATIONS_LAG_SECONDS)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        foods, written, watermark = recommendations.refresh(full=options['full'], lag=options['lag'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write("\n----- SUMMARY -----")
+        self.stdout.write(f"Foods rebuilt: {'all' if foods is None else len(foods)}")
+        self.stdout.write(f"Rows written: {written} ({FoodRecommendation.objects.count()} in total)")
+        self.stdout.write(f"Elapsed: {elapsed:.2f}s")
+        self.stdout.write(f"Watermark: {watermark:%Y-%m-%d %H:%M:%S}")
+        self.stdout.write("-------------------")
@@ -0,0 +1,62 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+
+from main import renditions
+from main.models import FoodItem
+from restaurants.models import Restaurant
+
+
+def _generate(name, force):
+    # Runs in a worker process; default_storage is what both image fields use
+    return name, renditions.generate(name, default_storage, force=force)
+
+
+class Command(BaseCommand):
+    help = "Create missing resized/WebP renditions of existing food and restaurant images, in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help="Worker processes (Pillow work is CPU-bound)")
+        parser.add_argument('--force', action='store_true', help="Rebuild renditions that already exist")
+
+    def handle(self, *args, **options):
+        names = set()
+        for model in (FoodItem, Restaurant):
+            names.update(model.objects.exclude(image='').exclude(image__isnull=True)
+                         .values_list('image', flat=True))
+        if not options['force']:
+            names = {name for name in names if not renditions.available(name)}
+        names = sorted(names)
+        self.stdout.write(f"{len(names)} image(s) to process with {options['workers']} worker(s)")
+
+        started = time.perf_counter()
+        processed = files = failed = 0
+        if names:
+            # Workers only read and write media storage, never the database.
+            # Forked workers inherit a configured Django; spawned ones need setup()
+            initializer = None if multiprocessing.get_start_method() == 'fork' else django.setup
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=initializer) as pool:
+                results = pool.map(_generate, names, [options['force']] * len(names),
+                                   chunksize=max(1, len(names) // (options['workers'] * 4)))
+                for name, written in results:
+                    processed += 1
+                    files += written
+                    if not written:
+                        failed += 1
+                        self.stdout.write(self.style.WARNING(f"⚠ Skipped {name} (missing or not an image)"))
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f"  {name}: {written} file(s)")
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write("\n----- SUMMARY -----")
+        self.stdout.write(f"Images processed: {processed}")
+        self.stdout.write(f"Renditions written: {files}")
+        self.stdout.write(f"Skipped: {failed}")
+        self.stdout.write(f"Elapsed: {elapsed:.2f}s ({processed / max(elapsed, 1e-9):,.1f} images/sec)")
+        self.stdout.write("-------------------")
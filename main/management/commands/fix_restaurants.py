@@ -1,38 +1,109 @@
+import time
+
 from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from main import catalog_cache
 from main.models import FoodItem
+from main.search import get_backend
 from restaurants.models import Restaurant
 
 
+def _key(name):
+    return ' '.join(name.split()).casefold()
+
+
 class Command(BaseCommand):
-    help = "Fix FoodItem.restaurant values that are strings instead of Restaurant objects"
-
-    def handle(self, *args, **kwargs):
-        fixed = 0
-        not_found = 0
-
-        for f in FoodItem.objects.all():
-            value = f.restaurant
-
-            # Case 1: restaurant stored incorrectly as a string
-            if isinstance(value, str):
-                try:
-                    r = Restaurant.objects.get(name=value)
-                    f.restaurant = r
-                    f.save()
-                    fixed += 1
-                    self.stdout.write(self.style.SUCCESS(f"✔ Updated: {f.name} -> {r.name}"))
-                except Restaurant.DoesNotExist:
+    help = (
+        "Fix FoodItem.restaurant values that are restaurant names (left over from "
+        "before the foreign key) instead of Restaurant ids"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help="Rows read per query / fixes per bulk update")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Report what would be fixed without writing")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+
+        # Resolve names from one in-memory map instead of a query per row;
+        # exact names first, then case/whitespace-insensitive (lowest id wins)
+        valid_ids = set()
+        exact, loose = {}, {}
+        for pk, name in Restaurant.objects.order_by('-id').values_list('id', 'name'):
+            valid_ids.add(pk)
+            exact[name] = pk
+            loose[_key(name)] = pk
+
+        fixed = not_found = scanned = 0
+        pending = []
+        started = last_report = time.perf_counter()
+        last_id = 0
+        while True:
+            # Keyset chunks: no cursor stays open across the writes below, and
+            # values_list() skips model instances and lazy restaurant loads
+            rows = list(
+                FoodItem.objects.filter(id__gt=last_id).order_by('id')
+                .values_list('id', 'name', 'restaurant_id')[:batch_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            scanned += len(rows)
+
+            for pk, food_name, value in rows:
+                if value in valid_ids:
+                    continue
+                target = None
+                if isinstance(value, str):
+                    value = value.strip()
+                    if value.isdigit() and int(value) in valid_ids:
+                        target = int(value)
+                    else:
+                        target = exact.get(value, loose.get(_key(value)))
+                if target is None:
                     not_found += 1
-                    self.stdout.write(self.style.WARNING(f"⚠ No Restaurant found for '{value}' (Food: {f.name})"))
+                    self.stdout.write(self.style.WARNING(
+                        f"⚠ No Restaurant found for {value!r} (Food: {food_name})"
+                    ))
+                    continue
+                fixed += 1
+                if options['verbosity'] > 1:
+                    self.stdout.write(self.style.SUCCESS(f"✔ Updated: {food_name} -> {target}"))
+                pending.append(FoodItem(pk=pk, restaurant_id=target, updated_at=timezone.now()))
 
-            # Case 2: invalid type (neither string nor Restaurant)
-            elif not isinstance(value, Restaurant):
-                not_found += 1
-                self.stdout.write(self.style.WARNING(
-                    f"⚠ Invalid type for {f.name}: {value}"
-                ))
+            if len(pending) >= batch_size:
+                self._write(pending, dry_run)
+                pending = []
 
-        self.stdout.write("\n----- SUMMARY -----")
+            now = time.perf_counter()
+            if now - last_report >= 5:
+                last_report = now
+                self.stderr.write(f"... {scanned} rows, {fixed} fixed, "
+                                  f"{scanned / (now - started):,.0f} rows/sec")
+
+        self._write(pending, dry_run)
+        if fixed and not dry_run:
+            catalog_cache.bump_version()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write("\n----- SUMMARY -----" + (" (dry run, nothing written)" if dry_run else ""))
+        self.stdout.write(f"Scanned: {scanned}")
         self.stdout.write(f"Fixed: {fixed}")
         self.stdout.write(f"Not Fixed (Errors): {not_found}")
-        self.stdout.write("-------------------")
\ No newline at end of file
+        self.stdout.write(f"Elapsed: {elapsed:.2f}s ({scanned / max(elapsed, 1e-9):,.0f} rows/sec)")
+        self.stdout.write("-------------------")
+
+    @staticmethod
+    def _write(pending, dry_run):
+        if pending and not dry_run:
+            with transaction.atomic():
+                FoodItem.objects.bulk_update(pending, ['restaurant', 'updated_at'])
+                Restaurant.objects.filter(pk__in={food.restaurant_id for food in pending}).update(
+                    updated_at=timezone.now())
+            # bulk_update skips the post_save signal; the index holds restaurant names
+            get_backend().index(FoodItem.objects.filter(pk__in=[food.pk for food in pending]))
@@ -0,0 +1,183 @@
+import logging
+import re
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver
+
+from main.models import Category, FoodItem
+from orders.cart import get_cart_store
+from orders.models import Order
+from restaurants.models import Restaurant
+from .bench_views import POST_BODIES, _PARAM_RE, _routes, url_context
+
+# Plan steps worth a look: a table read start to finish, or a sort/dedupe
+# the query can't get from an index
+_SCAN_RE = re.compile(r'^SCAN (\w+)$')
+_TEMP_BTREE = 'USE TEMP B-TREE'
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r'IN \((?:\?, )*\?\)')
+
+
+def _shape(sql):
+    """
+    The statement with its literals replaced, so one query run with
+    different parameters (or IN lists of different lengths) groups together.
+    """
+    return _IN_LIST_RE.sub('IN (...)', _LITERAL_RE.sub('?', sql))
+
+
+class Command(BaseCommand):
+    help = (
+        "Request every URL like bench_views, run EXPLAIN QUERY PLAN on each distinct SQL "
+        "statement and flag full table scans and temp B-tree sorts (changes are rolled back)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--route', action='append',
+                            help="Only URLs whose route contains this text (repeatable)")
+        parser.add_argument('--min-rows', type=int, default=1000,
+                            help="Ignore full scans of tables smaller than this")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Timed runs of each SELECT")
+        parser.add_argument('--all', action='store_true', help="List every statement, not just flagged ones")
+        parser.add_argument('--fail', action='store_true', help="Exit with an error if anything is flagged")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("index_advisor reads SQLite's EXPLAIN QUERY PLAN output; "
+                               f"this database is {connection.vendor}")
+        request_logger = logging.getLogger('django.request')
+        log_level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        hosts = [*settings.ALLOWED_HOSTS, 'testserver']
+        self._tables = set(connection.introspection.table_names())
+        self._rows = {}
+        try:
+            with override_settings(ALLOWED_HOSTS=hosts), transaction.atomic():
+                statements = self._capture(options)
+                # Explained inside the same transaction, so rows the run
+                # relies on (the benchmark cart) are still there
+                report = [self._explain(entry, options) for entry in statements.values()]
+                transaction.set_rollback(True)
+        finally:
+            request_logger.setLevel(log_level)
+
+        flagged = [entry for entry in report if entry['issues']]
+        for entry in sorted(report, key=lambda e: (not e['issues'], -e['p50_ms'])):
+            if entry['issues'] or options['all']:
+                self._print(entry)
+
+        self.stdout.write("\n----- SUMMARY -----")
+        self.stdout.write(f"Distinct statements: {len(report)} "
+                          f"({sum(entry['count'] for entry in report)} executed)")
+        self.stdout.write(f"Flagged: {len(flagged)}")
+        self.stdout.write("-------------------")
+        if flagged and options['fail']:
+            raise CommandError(f"{len(flagged)} statement(s) scan or sort without an index")
+
+    def _context(self):
+        """
+        bench_views' URL values, swapped for the restaurant, category and user
+        with the most rows behind them: plans matter most at the heavy end.
+        """
+        ctx = url_context()
+        heaviest = {
+            'pk': Restaurant.objects.annotate(n=Count('foods')).order_by('-n').first(),
+            'category_id': Category.objects.annotate(n=Count('fooditem')).order_by('-n').first(),
+        }
+        for key, obj in heaviest.items():
+            if obj is not None:
+                ctx[key] = obj.pk
+        user = User.objects.annotate(n=Count('orders')).order_by('-n').first()
+        order = user and Order.objects.filter(user=user).exclude(status='PENDING').first()
+        if order:
+            ctx.update(user=user, order_id=order.pk)
+        return ctx
+
+    def _capture(self, options):
+        ctx = self._context()
+        client = Client(raise_request_exception=False)
+        client.force_login(ctx['user'])
+        get_cart_store().add(ctx['user'], FoodItem.objects.get(pk=ctx['food_id']))
+
+        statements = {}
+        for route, name in _routes(get_resolver()):
+            if options['route'] and not any(part in route for part in options['route']):
+                continue
+            try:
+                path = _PARAM_RE.sub(lambda m: str(ctx[m.group(1)]), route)
+            except KeyError:
+                continue
+            body = POST_BODIES.get(name)
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as captured:
+                    if body:
+                        client.post(path, body(ctx), content_type='application/json')
+                    else:
+                        client.get(path)
+                transaction.set_rollback(True)
+
+            for query in captured.captured_queries:
+                sql = query['sql']
+                if not sql.startswith(('SELECT', 'UPDATE', 'DELETE')):
+                    continue  # inserts, savepoints
+                entry = statements.setdefault(_shape(sql), {'sql': sql, 'views': set(), 'count': 0})
+                entry['views'].add(name or route)
+                entry['count'] += 1
+        return statements
+
+    def _explain(self, entry, options):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + entry['sql'])
+            plan = [row[3] for row in cursor.fetchall()]
+
+        issues = []
+        for step in plan:
+            scan = _SCAN_RE.match(step)
+            if scan:
+                rows = self._table_rows(scan.group(1))
+                if rows is not None and rows >= options['min_rows']:
+                    issues.append(f"{step} ({rows:,} rows)")
+            elif step.startswith(_TEMP_BTREE):
+                issues.append(step)
+
+        samples = []
+        if entry['sql'].startswith('SELECT'):
+            with connection.cursor() as cursor:
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    cursor.execute(entry['sql'])
+                    cursor.fetchall()
+                    samples.append((time.perf_counter() - started) * 1000)
+        return {**entry, 'plan': plan, 'issues': issues,
+                'p50_ms': statistics.median(samples) if samples else 0.0}
+
+    def _table_rows(self, table):
+        # Only real tables: not subqueries, CTEs or FTS shadow scans
+        if table not in self._tables:
+            return None
+        if table not in self._rows:
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT COUNT(*) FROM "{table}"')
+                self._rows[table] = cursor.fetchone()[0]
+        return self._rows[table]
+
+    def _print(self, entry):
+        views = ', '.join(sorted(entry['views']))
+        timing = f"p50 {entry['p50_ms']:.2f} ms  " if entry['p50_ms'] else ''
+        header = f"\n{'FLAGGED' if entry['issues'] else 'ok'}  {timing}x{entry['count']}  [{views}]"
+        self.stdout.write(self.style.WARNING(header) if entry['issues'] else header)
+        sql = entry['sql']
+        self.stdout.write(f"  {sql[:300]}{'...' if len(sql) > 300 else ''}")
+        for step in entry['plan']:
+            style = self.style.ERROR if any(step in issue for issue in entry['issues']) else str
+            self.stdout.write(style(f"    {step}"))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.models import FoodItem
+from main.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Rebuild the food search index from scratch"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        backend = get_backend(options['database'])
+        started = time.perf_counter()
+        backend.rebuild()
+        elapsed = time.perf_counter() - started
+
+        count = FoodItem.objects.using(options['database']).count()
+        self.stdout.write(self.style.SUCCESS(
+            f"✔ Indexed {count} food items with {type(backend).__name__} in {elapsed:.2f}s"
+        ))
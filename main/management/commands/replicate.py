@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from main import routing
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database onto the replica file (a local stand-in for "
+        "replication), once or every --interval seconds"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Keep copying, this many seconds apart (0: copy once)")
+
+    def handle(self, *args, **options):
+        if routing.replica_alias() is None:
+            raise CommandError("No replica database is configured (set FOODAPP_REPLICA=1), "
+                               "or it is the primary itself")
+        primary = connections[DEFAULT_DB_ALIAS].settings_dict
+        replica = connections[routing.REPLICA_DATABASE_ALIAS].settings_dict
+        if {primary['ENGINE'], replica['ENGINE']} != {'django.db.backends.sqlite3'}:
+            raise CommandError("replicate copies SQLite files; use the database's own replication")
+
+        interval = options['interval']
+        if interval >= routing.lag_seconds():
+            self.stdout.write(self.style.WARNING(
+                f"⚠ --interval {interval:g}s is not below REPLICA_LAG_SECONDS ({routing.lag_seconds()}s): "
+                "browsers may be unpinned before the replica has their writes"
+            ))
+        while True:
+            elapsed = routing.replicate(primary['NAME'], replica['NAME'])
+            self.stdout.write(f"Copied {primary['NAME']} -> {replica['NAME']} in {elapsed * 1000:.1f} ms")
+            if not interval:
+                break
+            time.sleep(max(0.0, interval - elapsed))
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from main import trending
+from main.models import FoodItem
+from restaurants.models import Restaurant
+
+
+class Command(BaseCommand):
+    help = (
+        "Update the trending/popularity scores the home page ranks by: rescore the foods "
+        "in orders changed since the last run (every food on the first run, or with --full)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Rescore every food in one pass")
+        parser.add_argument('--lag', type=int,
+                            help="Leave changes younger than this many seconds for the next run "
+                                 "(default: settings.TRENDING_LAG_SECONDS)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rescored, watermark = trending.refresh(full=options['full'], lag=options['lag'])
+        elapsed = time.perf_counter() - started
+
+        epoch, now = trending.get_epoch(), timezone.now()
+        self.stdout.write("\n----- SUMMARY -----")
+        self.stdout.write(f"Foods rescored: {rescored}")
+        self.stdout.write(f"Elapsed: {elapsed:.2f}s")
+        self.stdout.write(f"Watermark: {watermark:%Y-%m-%d %H:%M:%S}")
+        foods = FoodItem.objects.filter(trending_score__gt=0).order_by('-trending_score', '-id')[:5]
+        self.stdout.write("Trending: " + (", ".join(
+            f"{food.name} ({trending.current(food.trending_score, epoch, now):.1f})" for food in foods
+        ) or "-"))
+        restaurants = (Restaurant.objects.filter(popularity_score__gt=0)
+                       .order_by('-popularity_score', '-id')[:5])
+        self.stdout.write("Popular: " + (", ".join(
+            f"{r.name} ({trending.current(r.popularity_score, epoch, now):.1f})" for r in restaurants
+        ) or "-"))
+        self.stdout.write("-------------------")
@@ -0,0 +1,187 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from main import catalog_cache, offers
+from main.models import Category, FavoriteItem, FoodItem, Offer
+from main.search import get_backend
+from orders.models import Order, OrderItem, allocate_order_number
+from restaurants.models import Restaurant
+from .bench_search import DISHES, STYLES, WORDS
+
+CITIES = ['Indiranagar', 'Koramangala', 'Jayanagar', 'Whitefield', 'HSR Layout', 'Malleshwaram']
+HISTORY_STATUSES = ['DELIVERED'] * 6 + ['COMPLETED'] * 2 + ['CANCELLED', 'PREPARING', 'OUT']
+
+
+class Command(BaseCommand):
+    help = "Seed a synthetic catalog, users and order history at a configurable scale"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurants', type=int, default=50)
+        parser.add_argument('--foods-per-restaurant', type=int, default=40)
+        parser.add_argument('--categories', type=int, default=len(STYLES))
+        parser.add_argument('--offers', type=int, default=20)
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--orders-per-user', type=int, default=10)
+        parser.add_argument('--favorites-per-user', type=int, default=5)
+        parser.add_argument('--password', default='password',
+                            help="Password set on every seeded user")
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help="Rows per bulk_create batch")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.chunk = options['chunk_size']
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            categories = self._categories(options['categories'])
+            offer_list = self._offers(options['offers'])
+            restaurants = self._restaurants(options['restaurants'])
+            foods = self._foods(restaurants, categories, offer_list, options['foods_per_restaurant'])
+            users = self._users(options['users'], options['password'])
+            self._favorites(users, foods, options['favorites_per_user'])
+            self._orders(users, foods, options['orders_per_user'])
+
+        # bulk_create skips the signals that keep these in step
+        get_backend().rebuild()
+        catalog_cache.bump_version()
+        offers.invalidate()
+        self.stdout.write(self.style.SUCCESS(f"Seeded in {time.perf_counter() - started:.1f}s."))
+
+    def _bulk_create(self, model, objs, **kwargs):
+        """
+        Insert ``objs`` (any iterable) ``chunk`` rows at a time.  Later steps
+        need the new pks, which bulk_create sets on PostgreSQL and SQLite.
+        """
+        created, batch = [], []
+        for obj in objs:
+            batch.append(obj)
+            if len(batch) >= self.chunk:
+                created += model.objects.bulk_create(batch, **kwargs)
+                batch = []
+        created += model.objects.bulk_create(batch, **kwargs)
+        self.stdout.write(f"  {model.__name__}: {len(created)}")
+        return created
+
+    def _categories(self, count):
+        names = [STYLES[i % len(STYLES)] + (f" {i // len(STYLES) + 1}" if i >= len(STYLES) else '')
+                 for i in range(count)]
+        return self._bulk_create(Category, (Category(name=name) for name in names))
+
+    def _offers(self, count):
+        rng = self.rng
+        now = timezone.now()
+
+        def build(i):
+            offer = Offer(
+                title=f"Flat ₹{i * 10 + 20} off",
+                description="Seeded offer",
+                min_order_amount=Decimal(rng.randrange(0, 2000, 50)),
+                discount_amount=Decimal(i * 10 + 20),
+                is_active=rng.random() < 0.9,
+            )
+            if rng.random() < 0.3:
+                offer.valid_from = now - timedelta(days=rng.randint(0, 30))
+                offer.valid_until = now + timedelta(days=rng.randint(1, 30))
+            return offer
+
+        return self._bulk_create(Offer, (build(i) for i in range(count)))
+
+    def _restaurants(self, count):
+        rng = self.rng
+        return self._bulk_create(Restaurant, (
+            Restaurant(
+                name=f"{rng.choice(DISHES)} {rng.choice(['House', 'Kitchen', 'Corner', 'Express'])} {i}",
+                location=rng.choice(CITIES),
+                is_popular=rng.random() < 0.1,
+            )
+            for i in range(count)
+        ))
+
+    def _foods(self, restaurants, categories, offer_list, per_restaurant):
+        rng = self.rng
+
+        def build():
+            for restaurant in restaurants:
+                for _ in range(per_restaurant):
+                    yield FoodItem(
+                        restaurant=restaurant,
+                        category=rng.choice(categories) if categories else None,
+                        offer=rng.choice(offer_list) if offer_list and rng.random() < 0.1 else None,
+                        name=f"{rng.choice(DISHES)} {rng.choice(STYLES)}",
+                        description=' '.join(rng.sample(WORDS, 5)),
+                        price=Decimal(rng.randrange(60, 600, 10)),
+                        is_trending=rng.random() < 0.05,
+                    )
+
+        return self._bulk_create(FoodItem, build())
+
+    def _users(self, count, password):
+        # Hash once: hashing per user would dominate the run
+        hashed = make_password(password)
+        start = User.objects.filter(username__startswith='seed-user-').count()
+        return self._bulk_create(User, (
+            User(username=f"seed-user-{start + i}", password=hashed) for i in range(count)
+        ))
+
+    def _favorites(self, users, foods, per_user):
+        rng = self.rng
+        per_user = min(per_user, len(foods))
+        self._bulk_create(FavoriteItem, (
+            FavoriteItem(user=user, food_item=food)
+            for user in users
+            for food in rng.sample(foods, per_user)
+        ), ignore_conflicts=True)
+
+    def _orders(self, users, foods, per_user):
+        rng = self.rng
+        if not foods or not per_user:
+            return
+        menus = {}
+        for food in foods:
+            menus.setdefault(food.restaurant_id, []).append(food)
+        menus = list(menus.values())
+
+        count = len(users) * per_user
+        number = allocate_order_number(count=count) - count
+        now = timezone.now()
+        orders, lines = [], []
+        for user in users:
+            for _ in range(per_user):
+                number += 1
+                menu = rng.choice(menus)
+                picked = rng.sample(menu, min(len(menu), rng.randint(1, 4)))
+                items = [(food, rng.randint(1, 3)) for food in picked]
+                orders.append(Order(
+                    user=user,
+                    order_number=number,
+                    status=rng.choice(HISTORY_STATUSES),
+                    total_price=sum(food.price * quantity for food, quantity in items),
+                    customer_name=user.username,
+                    customer_phone='9000000000',
+                    customer_address=rng.choice(CITIES),
+                ))
+                lines.append(items)
+
+        orders = self._bulk_create(Order, orders)
+
+        # created_at is auto_now_add, so spread the history afterwards
+        for order in orders:
+            order.created_at = now - timedelta(minutes=rng.randint(10, 60 * 24 * 180))
+        for i in range(0, len(orders), self.chunk):
+            Order.objects.bulk_update(orders[i:i + self.chunk], ['created_at'])
+
+        self._bulk_create(OrderItem, (
+            OrderItem(order=order, food=food, quantity=quantity, price=food.price)
+            for order, items in zip(orders, lines)
+            for food, quantity in items
+        ))
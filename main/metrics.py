@@ -0,0 +1,196 @@
+"""
+Per-view request metrics, served in Prometheus text format on ``/metrics``.
+
+``metrics_middleware`` times each request and, through a database
+``execute_wrapper`` and the ``TimedDjangoTemplates`` template backend, the
+SQL queries and template rendering done on its behalf.  The numbers go into
+histograms labelled by view function, held in this process behind one lock:
+with several workers, each reports its own (scrape every worker).
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+from django.utils.decorators import sync_and_async_middleware
+
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_current = ContextVar('request_metrics', default=None)
+_lock = threading.Lock()
+
+
+class Histogram:
+    """
+    Prometheus-style histogram with one series per view.  Not thread-safe
+    by itself: callers hold the module lock.
+    """
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}  # view -> [count per bucket..., count above the last, sum]
+
+    def observe(self, view, value):
+        series = self.series.get(view)
+        if series is None:
+            series = self.series[view] = [0] * (len(self.buckets) + 1) + [0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for view, series in sorted(self.series.items()):
+            label = 'view="%s"' % view.replace('\\', '\\\\').replace('"', '\\"')
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label}}} {series[-1]:.6g}')
+            lines.append(f'{self.name}_count{{{label}}} {cumulative}')
+        return lines
+
+
+REQUEST_SECONDS = Histogram('foodapp_request_duration_seconds',
+                            "Wall time to produce the response.", TIME_BUCKETS)
+SQL_QUERIES = Histogram('foodapp_request_sql_queries',
+                        "SQL queries run per request.", QUERY_BUCKETS)
+SQL_SECONDS = Histogram('foodapp_request_sql_duration_seconds',
+                        "Time spent executing SQL per request.", TIME_BUCKETS)
+TEMPLATE_SECONDS = Histogram('foodapp_request_template_duration_seconds',
+                             "Time spent rendering templates per request.", TIME_BUCKETS)
+HISTOGRAMS = (REQUEST_SECONDS, SQL_QUERIES, SQL_SECONDS, TEMPLATE_SECONDS)
+
+
+class RequestStats:
+    __slots__ = ('started', 'queries', 'sql_time', 'template_time', 'rendering')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.rendering = False
+
+
+def render():
+    with _lock:
+        lines = [line for histogram in HISTOGRAMS for line in histogram.render()]
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with _lock:
+        for histogram in HISTOGRAMS:
+            histogram.series.clear()
+
+
+def _record(view, stats, elapsed):
+    with _lock:
+        REQUEST_SECONDS.observe(view, elapsed)
+        SQL_QUERIES.observe(view, stats.queries)
+        SQL_SECONDS.observe(view, stats.sql_time)
+        TEMPLATE_SECONDS.observe(view, stats.template_time)
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'  # 404s from the resolver, static files
+    func = getattr(match.func, 'view_class', match.func)
+    return f"{func.__module__}.{func.__qualname__}"
+
+
+def _time_sql(execute, sql, params, many, context):
+    stats = _current.get()
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if stats is not None:
+            stats.queries += 1
+            stats.sql_time += time.perf_counter() - started
+
+
+def _sql_timing():
+    stack = ExitStack()
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(_time_sql))
+    return stack
+
+
+def _finish(request, response, stats):
+    elapsed = time.perf_counter() - stats.started
+    _record(_view_name(request), stats, elapsed)
+    if getattr(settings, 'METRICS_SERVER_TIMING', False):
+        response['Server-Timing'] = (
+            f'db;dur={stats.sql_time * 1000:.1f};desc="{stats.queries} queries", '
+            f'tpl;dur={stats.template_time * 1000:.1f}, '
+            f'total;dur={elapsed * 1000:.1f}'
+        )
+    return response
+
+
+@sync_and_async_middleware
+def metrics_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            stats = RequestStats()
+            token = _current.set(stats)
+            try:
+                with _sql_timing():
+                    response = await get_response(request)
+            finally:
+                _current.reset(token)
+            return _finish(request, response, stats)
+    else:
+        def middleware(request):
+            stats = RequestStats()
+            token = _current.set(stats)
+            try:
+                with _sql_timing():
+                    response = get_response(request)
+            finally:
+                _current.reset(token)
+            return _finish(request, response, stats)
+    return middleware
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = _current.get()
+        # Only the outermost render: templates rendered from inside another
+        # (render_to_string in a tag) are already within its time
+        if stats is None or stats.rendering:
+            return super().render(context, request)
+        stats.rendering = True
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.template_time += time.perf_counter() - started
+            stats.rendering = False
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend, with render time added to the current
+    request's metrics.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
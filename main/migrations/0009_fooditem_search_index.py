@@ -0,0 +1,47 @@
+from django.db import migrations, OperationalError
+
+FTS_TABLE = 'main_fooditem_search'
+
+
+def create_search_table(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+
+    try:
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            "name, description, restaurant, category, "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+    except OperationalError:
+        # SQLite built without FTS5: search falls back to the Python index
+        return
+
+    FoodItem = apps.get_model('main', 'FoodItem')
+    rows = FoodItem.objects.using(connection.alias).values_list(
+        'id', 'name', 'description', 'restaurant__name', 'category__name'
+    )
+    with connection.cursor() as cursor:
+        for food_id, name, description, restaurant, category in rows.iterator():
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, name, description, restaurant, category) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                [food_id, name, description or '', restaurant or '', category or ''],
+            )
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_remove_offer_discount_amount_remove_offer_is_active_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
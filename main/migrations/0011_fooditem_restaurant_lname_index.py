@@ -0,0 +1,19 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:59
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_offer_pricing_fields'),
+        ('restaurants', '0003_restaurant_is_popular'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fooditem',
+            index=models.Index(models.F('restaurant'), django.db.models.functions.text.Lower('name'), name='fooditem_restaurant_lname'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_fooditem_restaurant_lname_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fooditem',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_fooditem_updated_at'),
+        ('restaurants', '0005_restaurant_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fooditem',
+            index=models.Index(fields=['restaurant', 'name'], name='fooditem_restaurant_name'),
+        ),
+        migrations.AddIndex(
+            model_name='fooditem',
+            index=models.Index(fields=['category', 'name', 'id'], name='fooditem_category_name'),
+        ),
+        migrations.AddIndex(
+            model_name='fooditem',
+            index=models.Index(fields=['offer', 'name', 'id'], name='fooditem_offer_name'),
+        ),
+        migrations.AddIndex(
+            model_name='fooditem',
+            index=models.Index(condition=models.Q(('is_trending', True)), fields=['id'], name='fooditem_trending'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_jobwatermark'),
+        ('restaurants', '0006_trending_scores'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='fooditem',
+            name='fooditem_trending',
+        ),
+        migrations.AddField(
+            model_name='fooditem',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='fooditem',
+            index=models.Index(fields=['-trending_score', '-id'], name='fooditem_trending_score'),
+        ),
+    ]
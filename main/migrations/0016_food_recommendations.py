@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0015_trending_scores'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodRecommendation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveSmallIntegerField()),
+                ('orders', models.PositiveIntegerField()),
+                ('score', models.FloatField()),
+                ('food', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='recommendations', to='main.fooditem')),
+                ('recommended', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.fooditem')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('food', 'rank'), name='foodrecommendation_food_rank')],
+            },
+        ),
+    ]
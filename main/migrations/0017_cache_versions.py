@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-18 18:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0016_food_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CacheVersion',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('value', models.PositiveBigIntegerField()),
+                ('changed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
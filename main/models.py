@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Lower
 from django.contrib.auth.models import User
 from restaurants.models import Restaurant
 
@@ -17,6 +18,13 @@ class Offer(models.Model):
     title = models.CharField(max_length=100)
     description = models.TextField(blank=True)
 
+    # Cart pricing: flat discount once the cart reaches min_order_amount,
+    # inside the optional [valid_from, valid_until) window
+    discount_amount = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    min_order_amount = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    is_active = models.BooleanField(default=True)
+    valid_from = models.DateTimeField(null=True, blank=True)
+    valid_until = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return self.title
@@ -42,6 +50,21 @@ class FoodItem(models.Model):
         Offer, on_delete=models.SET_NULL, null=True, blank=True
     )
     is_trending = models.BooleanField(default=False)
+    # Time-decayed order velocity, kept by `manage.py score_trending` (main/trending.py)
+    trending_score = models.FloatField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Case-insensitive lookup of a restaurant's dish by name (menu imports)
+            models.Index('restaurant', Lower('name'), name='fooditem_restaurant_lname'),
+            # Menu and listing pages: filter by parent, ordered by name (keyset on name, id)
+            models.Index(fields=['restaurant', 'name'], name='fooditem_restaurant_name'),
+            models.Index(fields=['category', 'name', 'id'], name='fooditem_category_name'),
+            models.Index(fields=['offer', 'name', 'id'], name='fooditem_offer_name'),
+            # Home page: the top foods by score, read off the end of the index
+            models.Index(fields=['-trending_score', '-id'], name='fooditem_trending_score'),
+        ]
 
     def __str__(self):
         return f"{self.name} ({self.restaurant.name})"
@@ -107,4 +130,62 @@ class FavoriteItem(models.Model):
         unique_together = ('user', 'food_item')
 
     def __str__(self):
-        return f"{self.user.username} - {self.food_item.name}"
\ No newline at end of file
+        return f"{self.user.username} - {self.food_item.name}"
+
+
+# --------------------------
+# Recommendations
+# --------------------------
+class FoodRecommendation(models.Model):
+    """
+    One of a food's top "frequently ordered together" neighbours, kept by
+    `manage.py build_recommendations` (main/recommendations.py): ``score``
+    is the share of the food's orders that also had ``recommended``.
+    """
+    # Indexed by the (food, rank) constraint
+    food = models.ForeignKey(FoodItem, on_delete=models.CASCADE, related_name='recommendations',
+                             db_index=False)
+    recommended = models.ForeignKey(FoodItem, on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField()
+    orders = models.PositiveIntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['food', 'rank'], name='foodrecommendation_food_rank'),
+        ]
+
+    def __str__(self):
+        return f"{self.food_id} -> {self.recommended_id} ({self.score:.0%})"
+
+
+# --------------------------
+# Incremental job state
+# --------------------------
+class JobWatermark(models.Model):
+    """
+    How far an incremental job has got, e.g. the ``Order.updated_at`` the
+    sales rollups have seen every change up to.
+    """
+    name = models.CharField(max_length=50, primary_key=True)
+    value = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} @ {self.value:%Y-%m-%d %H:%M:%S}"
+
+
+# --------------------------
+# Shared cache versions
+# --------------------------
+class CacheVersion(models.Model):
+    """
+    A cache version counter every process reads, e.g. the catalog version
+    (main/catalog_cache.py), and when it last moved.  Kept in the database
+    because the caches themselves are per process.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    value = models.PositiveBigIntegerField()
+    changed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} v{self.value}"
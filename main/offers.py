@@ -0,0 +1,141 @@
+"""
+Best-offer lookup for cart pricing.
+
+Each process keeps an ``OfferIndex`` of the offers live right now, sorted by
+``min_order_amount`` with a running maximum of ``discount_amount``.  The best
+applicable offer for a cart total is then one binary search: the largest
+discount among all offers whose threshold the total reaches.
+
+The index is rebuilt when:
+
+* an Offer is saved or deleted, in any process: ``main.signals`` bumps
+  ``OFFERS_VERSION_KEY``, a ``CacheVersion`` row in the database (see
+  ``main.catalog_cache``), which every process reads on lookup, or
+* the clock passes the next ``valid_from``/``valid_until`` boundary of any
+  loaded offer.
+"""
+import threading
+from bisect import bisect_right
+from collections import namedtuple
+from decimal import Decimal
+
+from django.db.models import Q
+from django.utils import timezone
+
+from . import catalog_cache
+from .models import Offer
+
+OFFERS_VERSION_KEY = 'offers:version'
+
+Pricing = namedtuple('Pricing', 'offer discount amount_due')
+
+
+class OfferIndex:
+    """
+    Immutable snapshot of the offers valid at ``now``.
+    """
+
+    def __init__(self, offers, now):
+        live = []
+        expires_at = None
+        for offer in offers:
+            # The index is only good until the next window opens or closes
+            for boundary in (offer.valid_from, offer.valid_until):
+                if boundary is not None and boundary > now:
+                    expires_at = boundary if expires_at is None else min(expires_at, boundary)
+            if (offer.discount_amount > 0
+                    and (offer.valid_from is None or offer.valid_from <= now)
+                    and (offer.valid_until is None or offer.valid_until > now)):
+                live.append(offer)
+
+        live.sort(key=lambda o: (o.min_order_amount, -o.discount_amount, o.pk))
+        self.thresholds = [offer.min_order_amount for offer in live]
+        # best[i]: the biggest discount among live[0..i]; ties keep the lower threshold
+        self.best = []
+        for offer in live:
+            if not self.best or offer.discount_amount > self.best[-1].discount_amount:
+                self.best.append(offer)
+            else:
+                self.best.append(self.best[-1])
+        self.expires_at = expires_at
+
+    def __len__(self):
+        return len(self.thresholds)
+
+    def best_for(self, amount):
+        """
+        Offer with the largest discount whose minimum ``amount`` reaches.
+        """
+        i = bisect_right(self.thresholds, amount)
+        return self.best[i - 1] if i else None
+
+    def is_current(self, now):
+        return self.expires_at is None or now < self.expires_at
+
+
+def _candidates(now):
+    # Active and not yet over; upcoming offers are kept for their start time
+    return Offer.objects.filter(is_active=True).filter(
+        Q(valid_until__isnull=True) | Q(valid_until__gt=now)
+    )
+
+
+_index = None
+_index_version = None
+_lock = threading.Lock()
+
+
+def get_index():
+    """
+    This process's index, rebuilt if offers changed or a window boundary passed.
+    """
+    global _index, _index_version
+    version = catalog_cache.get_version(OFFERS_VERSION_KEY)
+    now = timezone.now()
+    index = _index
+    if index is not None and _index_version == version and index.is_current(now):
+        return index
+    with _lock:
+        if _index is None or _index_version != version or not _index.is_current(now):
+            _index = OfferIndex(_candidates(now), now)
+            _index_version = version
+        return _index
+
+
+async def aget_index():
+    global _index, _index_version
+    version = await catalog_cache.aget_version(OFFERS_VERSION_KEY)
+    now = timezone.now()
+    index = _index
+    if index is not None and _index_version == version and index.is_current(now):
+        return index
+    # Two coroutines may both rebuild; the results are interchangeable
+    index = OfferIndex([offer async for offer in _candidates(now)], now)
+    _index, _index_version = index, version
+    return index
+
+
+def invalidate():
+    """
+    Drop the index everywhere: bump the shared version (and the local copy).
+    """
+    global _index
+    _index = None
+    catalog_cache.bump_version(OFFERS_VERSION_KEY)
+
+
+def _pricing(index, amount):
+    offer = index.best_for(amount)
+    discount = min(offer.discount_amount, amount) if offer else Decimal('0')
+    return Pricing(offer, discount, amount - discount)
+
+
+def price(amount):
+    """
+    ``Pricing(offer, discount, amount_due)`` for a cart total.
+    """
+    return _pricing(get_index(), amount)
+
+
+async def aprice(amount):
+    return _pricing(await aget_index(), amount)
@@ -0,0 +1,226 @@
+"""
+Keyset (seek) pagination.
+
+Instead of OFFSET, each page is fetched with a WHERE clause that continues
+after (or before) the sort key of the last row shown, so any page costs
+O(page size) however deep it is, and rows inserted meanwhile never shift or
+duplicate entries on later pages.  The position travels in an opaque
+``?cursor=`` value; ``templates/includes/pagination.html`` renders the links.
+"""
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+PER_PAGE = 20
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder trims datetimes to milliseconds; a seek key needs
+    # the exact stored value or rows sharing that millisecond get skipped.
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPage:
+    """
+    One page of rows plus ready-made cursors.  Holds no queryset, so pages
+    can be cached and pickled cheaply.
+    """
+
+    def __init__(self, items, next_key, previous_key, paginator):
+        self.object_list = items
+        self.next_cursor = paginator.encode_cursor(next_key, False) if next_key else None
+        self.previous_cursor = paginator.encode_cursor(previous_key, True) if previous_key else None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    """
+    Seek through ``queryset`` in ``ordering`` order.
+
+    ``ordering`` is a sequence of local field names, ``-`` prefixed for
+    descending; the last one must be unique (normally ``id``/``-id``) so the
+    key identifies exactly one row.
+    """
+
+    def __init__(self, queryset, ordering, per_page=PER_PAGE):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        opts = queryset.model._meta
+        self._fields = [opts.get_field(name.lstrip('-')) for name in self.ordering]
+
+    # -- hooks (overridden by non-queryset sources such as search) --------
+
+    def fetch(self, key, backwards, limit):
+        """
+        Return up to ``limit`` items after ``key`` (before it if
+        ``backwards``), in page order for forward fetches and reversed
+        order for backward ones.
+        """
+        return list(self._page_queryset(key, backwards, limit))
+
+    async def afetch(self, key, backwards, limit):
+        return [row async for row in self._page_queryset(key, backwards, limit)]
+
+    def _page_queryset(self, key, backwards, limit, queryset=None):
+        ordering = self.ordering
+        if backwards:
+            ordering = tuple(_flip(name) for name in ordering)
+        queryset = (self.queryset if queryset is None else queryset).order_by(*ordering)
+        if key is not None:
+            queryset = queryset.filter(self._seek(ordering, key))
+        return queryset[:limit]
+
+    def key_for(self, item):
+        return tuple(getattr(item, field.attname) for field in self._fields)
+
+    def decode_key(self, values):
+        return tuple(field.to_python(value) for field, value in zip(self._fields, values))
+
+    # -- cursors -----------------------------------------------------------
+
+    def encode_cursor(self, key, backwards):
+        payload = json.dumps({'k': list(key), 'b': int(backwards)}, cls=_CursorEncoder)
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """
+        Return ``(key, backwards)``; ``(None, False)`` for a missing or
+        malformed cursor, which means the first page.
+        """
+        if not cursor:
+            return None, False
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            values = payload['k']
+            if not isinstance(values, list) or len(values) != len(self.ordering):
+                return None, False
+            return self.decode_key(values), bool(payload.get('b'))
+        except (ValueError, KeyError, TypeError, binascii.Error, ValidationError):
+            return None, False
+
+    def canonical_cursor(self, cursor):
+        """
+        ``cursor`` re-encoded from its decoded key, or ``''`` when it means
+        the first page, so variants of one position share a cache key.
+        """
+        key, backwards = self.decode_cursor(cursor)
+        return '' if key is None else self.encode_cursor(key, backwards)
+
+    def get_page(self, cursor=None):
+        key, backwards = self.decode_cursor(cursor)
+        rows = self.fetch(key, backwards, self.per_page + 1)
+        return self._make_page(rows, key, backwards)
+
+    async def aget_page(self, cursor=None):
+        key, backwards = self.decode_cursor(cursor)
+        rows = await self.afetch(key, backwards, self.per_page + 1)
+        return self._make_page(rows, key, backwards)
+
+    def _make_page(self, rows, key, backwards):
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if backwards:
+            rows.reverse()
+            next_key = self.key_for(rows[-1]) if rows else None
+            previous_key = self.key_for(rows[0]) if rows and more else None
+        else:
+            next_key = self.key_for(rows[-1]) if rows and more else None
+            previous_key = self.key_for(rows[0]) if rows and key is not None else None
+        return KeysetPage(rows, next_key, previous_key, self)
+
+    @staticmethod
+    def _seek(ordering, key):
+        """
+        (a, b, c) > (x, y, z) spelled out per column so mixed directions work:
+        a >= x AND (a > x OR (a = x AND (b > y OR (b = y AND c > z))))
+
+        The leading ``a >= x`` is implied by the rest, but an index can seek
+        on it; SQLite can't seek on the OR, and would scan from the start of
+        the range on every page.
+        """
+        condition = None
+        for name, value in reversed(list(zip(ordering, key))):
+            field = name.lstrip('-')
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            beyond = Q(**{f'{field}__{lookup}': value})
+            if condition is None:
+                condition = beyond
+            else:
+                condition = beyond | (Q(**{field: value}) & condition)
+        if len(ordering) > 1:
+            field = ordering[0].lstrip('-')
+            lookup = 'lte' if ordering[0].startswith('-') else 'gte'
+            condition = Q(**{f'{field}__{lookup}': key[0]}) & condition
+        return condition
+
+
+class MergedKeysetPaginator(KeysetPaginator):
+    """
+    Seek through several querysets as if they were one, e.g. a table and
+    its archive.  Each is read with the same seek and limit, so each uses
+    its own index, and the rows are merged on the key.  The models must
+    share the ``ordering`` fields, and a key must not occur in two of them.
+    """
+
+    def __init__(self, querysets, ordering, per_page=PER_PAGE):
+        super().__init__(querysets[0], ordering, per_page)
+        self.querysets = list(querysets)
+
+    def fetch(self, key, backwards, limit):
+        rows = []
+        for queryset in self.querysets:
+            rows += self._page_queryset(key, backwards, limit, queryset)
+        return self._merge(rows, backwards)[:limit]
+
+    async def afetch(self, key, backwards, limit):
+        rows = []
+        for queryset in self.querysets:
+            rows += [row async for row in self._page_queryset(key, backwards, limit, queryset)]
+        return self._merge(rows, backwards)[:limit]
+
+    def _merge(self, rows, backwards):
+        # Stable sorts from the last column to the first give mixed directions
+        for name, field in reversed(list(zip(self.ordering, self._fields))):
+            descending = name.startswith('-') != backwards
+            rows.sort(key=lambda row: getattr(row, field.attname), reverse=descending)
+        return rows
+
+
+def _flip(name):
+    return name[1:] if name.startswith('-') else f'-{name}'
+
+
+def paginate(request, queryset, ordering, per_page=PER_PAGE):
+    """
+    Page of ``queryset`` for the request's ``?cursor=``.
+    """
+    return KeysetPaginator(queryset, ordering, per_page).get_page(request.GET.get('cursor'))
+
+
+async def apaginate(request, queryset, ordering, per_page=PER_PAGE):
+    return await KeysetPaginator(queryset, ordering, per_page).aget_page(request.GET.get('cursor'))
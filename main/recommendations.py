@@ -0,0 +1,268 @@
+"""
+"Frequently ordered together" recommendations.
+
+Every placed order is a basket of foods.  The baskets form a sparse
+order x food matrix ``B`` (SciPy CSR, one nonzero per order line), and
+``B.T @ B`` counts, for every pair of foods, the orders that had both; its
+diagonal is each food's own order count.  A food's neighbours are the foods
+it shares the most orders with, scored as the share of its orders that had
+them (seen in at least ``MIN_ORDERS`` orders), and the top
+``RECOMMENDATIONS_PER_FOOD`` are kept in ``FoodRecommendation``.  The
+product is taken a block of foods at a time, so memory follows the block,
+not the full pair matrix.
+
+A food's row depends only on the orders that contain it, so ``refresh()``
+(``manage.py build_recommendations``) is incremental: it rebuilds the rows
+of the foods in orders changed since its ``JobWatermark``, from just the
+orders containing them, hot and archived.  The first run, or ``full``,
+rebuilds all rows in one pass over every order line.
+
+Pages read the table with one query on its (food, rank) index:
+``for_foods()`` for the cart, ``pairs()`` for a menu.  A menu's pairs are
+cached with it and vouched for by its restaurant's ``updated_at``, so
+``store()`` touches the restaurants whose foods it rewrote.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.db.models import Subquery
+from django.utils import timezone
+from scipy import sparse
+
+from orders.models import ArchivedOrderItem, OrderItem
+from orders.rollups import COUNTED_STATUSES
+from restaurants.models import Restaurant
+from . import catalog_cache
+from .models import FoodItem, FoodRecommendation, JobWatermark
+from .sqlite import retry_on_lock, write_atomic
+from .trending import changed_foods
+
+WATERMARK = 'recommendations'
+DEFAULT_PER_FOOD = 10
+DEFAULT_LAG_SECONDS = 60
+# Pairs seen in fewer orders than this are noise
+MIN_ORDERS = 2
+CHUNK_SIZE = 10000
+FOODS_PER_BLOCK = 2000
+FOODS_PER_QUERY = 500
+
+
+def per_food():
+    return getattr(settings, 'RECOMMENDATIONS_PER_FOOD', DEFAULT_PER_FOOD)
+
+
+def _lines(items):
+    # (order_id, food_id) of every counted line, streamed.  The status is
+    # checked here rather than in the WHERE: without table statistics
+    # SQLite would walk every counted order through order_status_created
+    # instead of looking up the few orders an incremental run asks for.
+    counted = set(COUNTED_STATUSES)
+    return (
+        (order_id, food_id) for order_id, food_id, status in
+        items.filter(food__isnull=False).values_list('order_id', 'food_id', 'order__status')
+        .order_by().iterator(chunk_size=CHUNK_SIZE)
+        if status in counted
+    )
+
+
+def load_baskets(food_ids=None):
+    """
+    The order lines, hot and archived, as parallel arrays of order and food
+    ids: all of them, or those of the orders containing any of
+    ``food_ids``.
+    """
+    chunks = []
+    for model in (OrderItem, ArchivedOrderItem):
+        items = model.objects.all()
+        if food_ids is not None:
+            items = items.filter(order_id__in=Subquery(
+                model.objects.filter(food_id__in=food_ids).values('order_id')))
+        chunk = []
+        for line in _lines(items):
+            chunk.append(line)
+            if len(chunk) == CHUNK_SIZE:
+                chunks.append(np.array(chunk, dtype=np.int64))
+                chunk = []
+        if chunk:
+            chunks.append(np.array(chunk, dtype=np.int64))
+    if not chunks:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    lines = np.concatenate(chunks)
+    return lines[:, 0], lines[:, 1]
+
+
+def neighbours(order_ids, food_ids, for_foods=None, k=None):
+    """
+    Yield ``(food_id, [(neighbour_id, orders, score), ...])``, best first,
+    for each food in ``for_foods`` (default: every food in the baskets).
+    """
+    k = k or per_food()
+    if not len(food_ids):
+        return
+    orders, order_index = np.unique(order_ids, return_inverse=True)
+    foods, food_index = np.unique(food_ids, return_inverse=True)
+    baskets = sparse.csr_matrix(
+        (np.ones(len(food_index), dtype=np.int32), (order_index, food_index)),
+        shape=(len(orders), len(foods)),
+    )
+    baskets.data[:] = 1  # a food twice in one order still counts once
+    by_food = baskets.tocsc()
+    totals = np.diff(by_food.indptr)
+
+    if for_foods is None:
+        rows = np.arange(len(foods))
+    else:
+        wanted = np.asarray(sorted(for_foods), dtype=np.int64)
+        rows = np.searchsorted(foods, wanted)
+        rows = rows[(rows < len(foods)) & (foods[np.minimum(rows, len(foods) - 1)] == wanted)]
+
+    for start in range(0, len(rows), FOODS_PER_BLOCK):
+        block = rows[start:start + FOODS_PER_BLOCK]
+        together = (by_food[:, block].T @ baskets).tocsr()
+        for i, row in enumerate(block):
+            cols = together.indices[together.indptr[i]:together.indptr[i + 1]]
+            counts = together.data[together.indptr[i]:together.indptr[i + 1]]
+            keep = (cols != row) & (counts >= MIN_ORDERS)
+            cols, counts = cols[keep], counts[keep]
+            # Most orders together first, then lowest id, so ties are stable
+            best = np.lexsort((foods[cols], -counts))[:k]
+            yield int(foods[row]), [
+                (int(foods[cols[j]]), int(counts[j]), float(counts[j] / totals[row])) for j in best
+            ]
+
+
+@retry_on_lock
+@write_atomic
+def store(rows, food_ids=None):
+    """
+    Replace the recommendations of ``food_ids`` (None: every food) with
+    ``rows`` from ``neighbours()``, touching their restaurants.  Returns the
+    number written.
+    """
+    existing = FoodRecommendation.objects.all()
+    restaurants = Restaurant.objects.all()
+    if food_ids is not None:
+        existing = existing.filter(food_id__in=food_ids)
+        restaurants = restaurants.filter(
+            pk__in=FoodItem.objects.filter(pk__in=food_ids).values('restaurant_id'))
+    existing.delete()
+    # The menus showing these foods' pairs changed: move their Last-Modified
+    restaurants.update(updated_at=timezone.now())
+    # executemany() of one parameterised INSERT: several times faster than
+    # bulk_create() for the ~1M rows of a full build
+    values = [
+        (food_id, recommended_id, rank, orders, score)
+        for food_id, top in rows
+        for rank, (recommended_id, orders, score) in enumerate(top)
+    ]
+    table = connection.ops.quote_name(FoodRecommendation._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} (food_id, recommended_id, rank, orders, score) '
+            f'VALUES (%s, %s, %s, %s, %s)',
+            values,
+        )
+    return len(values)
+
+
+def refresh(full=False, lag=None):
+    """
+    Bring the recommendations up to date; the first run, or ``full``,
+    rebuilds every food's.  Returns ``(foods rebuilt, rows written, new
+    watermark)``; ``foods rebuilt`` is None for a full build.
+    """
+    if lag is None:
+        lag = getattr(settings, 'RECOMMENDATIONS_LAG_SECONDS', DEFAULT_LAG_SECONDS)
+    until = timezone.now() - timedelta(seconds=lag)
+    watermark = JobWatermark.objects.filter(name=WATERMARK).first()
+    if full or watermark is None:
+        foods = None
+        written = store(neighbours(*load_baskets()))
+    else:
+        foods = changed_foods(watermark.value, until)
+        written = 0
+        for start in range(0, len(foods), FOODS_PER_QUERY):
+            chunk = foods[start:start + FOODS_PER_QUERY]
+            written += store(neighbours(*load_baskets(chunk), for_foods=chunk), chunk)
+
+    JobWatermark.objects.update_or_create(name=WATERMARK, defaults={'value': until})
+    if foods is None or foods:
+        # Menu pages are cached with the catalog; the version is shared, so
+        # web processes see this command's bump
+        catalog_cache.bump_version()
+    return foods, written, until
+
+
+# -- serving ----------------------------------------------------------------
+
+def _rank(recommendations, exclude, limit):
+    # Foods recommended for several of the basket add up
+    scores, foods = {}, {}
+    for rec in recommendations:
+        if rec.recommended_id in exclude:
+            continue
+        scores[rec.recommended_id] = scores.get(rec.recommended_id, 0) + rec.score
+        foods[rec.recommended_id] = rec.recommended
+    return [foods[pk] for pk in sorted(scores, key=lambda pk: (-scores[pk], pk))[:limit]]
+
+
+def _for_foods_query(food_ids):
+    return (FoodRecommendation.objects.filter(food_id__in=food_ids)
+            .select_related('recommended').order_by())
+
+
+def for_foods(food_ids, limit=4):
+    """
+    The foods most often ordered with ``food_ids`` (a cart), not among them.
+    """
+    food_ids = set(food_ids)
+    if not food_ids:
+        return []
+    return _rank(_for_foods_query(food_ids), food_ids, limit)
+
+
+async def afor_foods(food_ids, limit=4):
+    food_ids = set(food_ids)
+    if not food_ids:
+        return []
+    return _rank([rec async for rec in _for_foods_query(food_ids)], food_ids, limit)
+
+
+def _pairs_query(food_ids):
+    # Read through the (food, rank) index, at most per_food() rows a food;
+    # sorted by score in Python, as ORDER BY score across foods would need a
+    # temp B-tree
+    return (FoodRecommendation.objects.filter(food_id__in=food_ids)
+            .select_related('food', 'recommended').order_by())
+
+
+def _distinct_pairs(recommendations, limit):
+    # A -> B and B -> A are the same pair; the stronger one comes first
+    seen, result = set(), []
+    for rec in sorted(recommendations, key=lambda rec: (-rec.score, rec.food_id, rec.rank)):
+        pair = frozenset((rec.food_id, rec.recommended_id))
+        if pair not in seen:
+            seen.add(pair)
+            result.append(rec)
+            if len(result) == limit:
+                break
+    return result
+
+
+def pairs(food_ids, limit=6):
+    """
+    The strongest "ordered together" pairs starting from ``food_ids`` (a
+    menu), as FoodRecommendations with both foods loaded, one per pair.
+    """
+    if not food_ids:
+        return []
+    return _distinct_pairs(_pairs_query(food_ids), limit)
+
+
+async def apairs(food_ids, limit=6):
+    if not food_ids:
+        return []
+    return _distinct_pairs([rec async for rec in _pairs_query(food_ids)], limit)
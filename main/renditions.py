@@ -0,0 +1,136 @@
+"""
+Resized and WebP renditions of uploaded food and restaurant images.
+
+Every original ``food/pizza.jpg`` gets, next to it in the same storage,
+``food/pizza.w320.jpg`` and ``food/pizza.w320.webp`` for each width in
+``IMAGE_RENDITION_WIDTHS``.  Widths wider than the original are saved at the
+original size, so every name always exists once an image is processed and
+the ``{% responsive_image %}`` tag only has to check for one of them.
+
+Saving a FoodItem or Restaurant queues the work on a small thread pool after
+the transaction commits (see ``main.signals``), so uploads never wait on
+Pillow.  ``manage.py build_renditions`` backfills existing media.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WIDTHS = (320, 640, 960)
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+_executor = None
+_executor_lock = threading.Lock()
+_available = set()  # originals known to have renditions; they are never removed
+_queued = set()  # originals with a job on the pool, so a quick re-save doesn't race it
+
+
+def widths():
+    return tuple(sorted(getattr(settings, 'IMAGE_RENDITION_WIDTHS', DEFAULT_WIDTHS)))
+
+
+def rendition_name(name, width, webp=False):
+    root, ext = os.path.splitext(name)
+    return f"{root}.w{width}{'.webp' if webp else ext}"
+
+
+def is_rendition(name):
+    root = os.path.splitext(name)[0]
+    return any(root.endswith(f".w{width}") for width in widths())
+
+
+def available(name, storage=default_storage):
+    """
+    Whether ``name`` has been processed.  The largest WebP is written last,
+    so its presence means the full set is there.
+    """
+    if name in _available:
+        return True
+    if storage.exists(rendition_name(name, widths()[-1], webp=True)):
+        _available.add(name)
+        return True
+    return False
+
+
+def generate(name, storage=default_storage, force=False):
+    """
+    Write every rendition of ``name``.  Returns the number of files written
+    (0 when already done or when the file is not a readable image).
+    """
+    if not force and available(name, storage):
+        return 0
+    try:
+        with storage.open(name, 'rb') as f:
+            original = Image.open(f)
+            original.load()
+    except (OSError, UnidentifiedImageError) as e:
+        logger.warning("Cannot make renditions of %s: %s", name, e)
+        return 0
+
+    original = ImageOps.exif_transpose(original)
+    # The rendition keeps the original's extension, so save in the format it names
+    fmt = Image.registered_extensions().get(os.path.splitext(name)[1].lower(), 'JPEG')
+    written = 0
+    for width in widths():
+        image = original.copy()
+        image.thumbnail((width, image.height))  # keeps the aspect ratio, never upscales
+        for webp in (False, True):
+            written += _save(storage, rendition_name(name, width, webp), image, 'WEBP' if webp else fmt)
+    _available.add(name)
+    return written
+
+
+def _save(storage, name, image, fmt):
+    if fmt == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    options = {'quality': WEBP_QUALITY} if fmt == 'WEBP' else {'optimize': True}
+    if fmt == 'JPEG':
+        options.update(quality=JPEG_QUALITY, progressive=True)
+    image.save(buffer, fmt, **options)
+    # Storage.save() picks a fresh name rather than overwrite
+    storage.delete(name)
+    storage.save(name, ContentFile(buffer.getvalue()))
+    return 1
+
+
+def _run(name, storage):
+    try:
+        generate(name, storage)
+    except Exception:
+        logger.exception("Rendition job for %s failed", name)
+    finally:
+        with _executor_lock:
+            _queued.discard(name)
+
+
+def schedule(name, storage=default_storage):
+    """
+    Queue renditions of ``name`` on the background pool (or run them inline
+    when ``IMAGE_RENDITIONS_BACKGROUND`` is off, e.g. in tests).
+    """
+    if not name or is_rendition(name) or name in _available:
+        return None
+    if not getattr(settings, 'IMAGE_RENDITIONS_BACKGROUND', True):
+        _run(name, storage)
+        return None
+    global _executor
+    with _executor_lock:
+        if name in _queued:
+            return None
+        _queued.add(name)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMAGE_RENDITION_WORKERS', 2),
+                thread_name_prefix='renditions',
+            )
+    return _executor.submit(_run, name, storage)
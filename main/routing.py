@@ -0,0 +1,176 @@
+"""
+Primary/replica database routing.
+
+When ``DATABASES`` has a ``REPLICA_DATABASE_ALIAS`` entry, reads made while
+serving a request go to it if they are catalog reads (``CATALOG_MODELS``) or
+come from a view decorated with ``@replica_reads``.  Everything else, and
+everything outside a request (management commands, the shell, signals run
+by them), stays on the primary.  Writes always go to the primary.
+
+Read-your-writes: a request reads from the primary once it has written
+(the router sees the write), for its whole duration if its method is not
+safe, and inside any transaction on the primary.  ``replica_middleware``
+then sets a cookie that keeps that browser on the primary for the next
+``REPLICA_LAG_SECONDS``, the lag the replica is expected to stay within.
+
+Locally the replica is a second SQLite file that ``manage.py replicate``
+copies the primary into (see ``replicate()``).
+"""
+import sqlite3
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+
+REPLICA_DATABASE_ALIAS = 'replica'
+PIN_COOKIE = 'primary_pin'
+DEFAULT_LAG_SECONDS = 5
+
+# Models whose pages tolerate a few seconds of lag: the public catalog
+CATALOG_MODELS = frozenset({
+    'main.category', 'main.fooditem', 'main.offer', 'restaurants.restaurant',
+})
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+_current = ContextVar('db_routing', default=None)
+
+
+class RequestRouting:
+    __slots__ = ('pinned', 'wrote', 'read_only')
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+        self.read_only = False
+
+
+def lag_seconds():
+    return getattr(settings, 'REPLICA_LAG_SECONDS', DEFAULT_LAG_SECONDS)
+
+
+def replica_alias():
+    """
+    The replica's alias, or None when there is none to read from.  A test
+    mirror opened on the primary's own file is not one: it would only miss
+    the test's uncommitted rows.
+    """
+    if REPLICA_DATABASE_ALIAS not in settings.DATABASES:
+        return None
+    replica = connections[REPLICA_DATABASE_ALIAS].settings_dict
+    if replica['NAME'] == connections[DEFAULT_DB_ALIAS].settings_dict['NAME']:
+        return None
+    return REPLICA_DATABASE_ALIAS
+
+
+def uses_replica(model=None):
+    """
+    Whether a read of ``model`` (any catalog model when omitted) made now
+    goes to the replica.
+    """
+    state = _current.get()
+    if state is None or state.pinned or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+        return False
+    if model is not None and model._meta.label_lower not in CATALOG_MODELS and not state.read_only:
+        return False
+    return replica_alias() is not None
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return REPLICA_DATABASE_ALIAS if uses_replica(model) else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None:
+            state.wrote = state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Same data on both sides
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # The replica gets its schema with the data, from the primary
+        return False if db == REPLICA_DATABASE_ALIAS else None
+
+
+def replica_reads(view):
+    """
+    Mark a view as read-only: all of its reads, not just catalog ones, may
+    go to the replica (unless the request is pinned to the primary).
+    Works on sync and async views.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            state = _current.get()
+            if state is not None:
+                state.read_only = True
+            return await view(request, *args, **kwargs)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            state = _current.get()
+            if state is not None:
+                state.read_only = True
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+def _start(request):
+    return RequestRouting(pinned=request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES)
+
+
+def _finish(response, state):
+    if state.wrote:
+        response.set_cookie(PIN_COOKIE, '1', max_age=lag_seconds(), httponly=True, samesite='Lax')
+    return response
+
+
+@sync_and_async_middleware
+def replica_middleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            if replica_alias() is None:
+                return await get_response(request)
+            state = _start(request)
+            token = _current.set(state)
+            try:
+                response = await get_response(request)
+            finally:
+                _current.reset(token)
+            return _finish(response, state)
+    else:
+        def middleware(request):
+            if replica_alias() is None:
+                return get_response(request)
+            state = _start(request)
+            token = _current.set(state)
+            try:
+                response = get_response(request)
+            finally:
+                _current.reset(token)
+            return _finish(response, state)
+    return middleware
+
+
+def replicate(source, target):
+    """
+    Copy the SQLite database file ``source`` onto ``target`` with the
+    online backup API: a consistent snapshot, taken while the primary
+    stays writable.  Returns the seconds it took.
+    """
+    started = time.perf_counter()
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+    return time.perf_counter() - started
@@ -0,0 +1,337 @@
+"""
+Ranked food search.
+
+Two interchangeable backends index ``FoodItem.name`` and ``description``
+together with the restaurant and category names:
+
+* ``FTS5Backend`` keeps an SQLite FTS5 table (created by migration 0009)
+  ranked with ``bm25()``.
+* ``InvertedIndexBackend`` is a pure-Python token index used when the
+  database has no FTS5 table.  It lives in process memory, so each worker
+  builds its own copy on first use and follows saves made in that worker.
+
+``settings.FOOD_SEARCH_BACKEND`` selects ``'fts5'``, ``'python'`` or
+``'auto'`` (the default: FTS5 when the table exists).  Every query token is
+matched as a prefix and all tokens must match, so results narrow as the
+user types.  ``search_foods()`` pages through results with keyset cursors.
+"""
+import math
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+
+from .models import FoodItem
+from .pagination import PER_PAGE, KeysetPaginator
+
+FTS_TABLE = 'main_fooditem_search'
+
+# Column order of the FTS table and the weight each column adds to a match
+FIELDS = ('name', 'description', 'restaurant', 'category')
+WEIGHTS = {'name': 10.0, 'description': 1.0, 'restaurant': 4.0, 'category': 4.0}
+
+# Default cap for unpaginated ``search()`` calls
+MAX_RESULTS = 500
+
+_TOKEN_RE = re.compile(r'\w+')
+
+
+def tokenize(text):
+    """
+    Lower-case, accent-folded word tokens (matches FTS5 unicode61 rules).
+    """
+    if not text:
+        return []
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _TOKEN_RE.findall(text)
+
+
+def _documents(queryset):
+    """
+    Yield ``(food_id, {field: text})`` without loading model instances.
+    """
+    rows = queryset.order_by().values_list(
+        'id', 'name', 'description', 'restaurant__name', 'category__name'
+    )
+    for food_id, name, description, restaurant, category in rows.iterator(chunk_size=2000):
+        yield food_id, {
+            'name': name or '',
+            'description': description or '',
+            'restaurant': restaurant or '',
+            'category': category or '',
+        }
+
+
+class SearchBackend:
+    """
+    Common interface.  ``ranked()`` returns ``(food_id, rank)`` pairs in
+    ascending ``(rank, food_id)`` order, optionally seeking past ``after``
+    (a ``(rank, food_id)`` key) or, with ``backwards``, before it in
+    descending order.
+    """
+
+    def ranked(self, query, limit=MAX_RESULTS, after=None, backwards=False):
+        raise NotImplementedError
+
+    def search(self, query, limit=MAX_RESULTS):
+        return [food_id for food_id, _ in self.ranked(query, limit)]
+
+
+class FTS5Backend(SearchBackend):
+    """
+    SQLite FTS5 index; the rowid of each entry is the FoodItem id.
+    """
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    @staticmethod
+    def is_available(using='default'):
+        connection = connections[using]
+        if connection.vendor != 'sqlite':
+            return False
+        return FTS_TABLE in connection.introspection.table_names()
+
+    def _execute(self, sql, params=()):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall() if cursor.description else None
+
+    def _upsert(self, docs, batch_size=2000):
+        connection = connections[self.using]
+        columns = ', '.join(FIELDS)
+        placeholders = ', '.join(['%s'] * (len(FIELDS) + 1))
+        docs = iter(docs)
+        with connection.cursor() as cursor:
+            # executemany in batches: one statement prepare per batch, not per row
+            while batch := list(islice(docs, batch_size)):
+                cursor.executemany(
+                    f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [[food_id] for food_id, _ in batch]
+                )
+                cursor.executemany(
+                    f"INSERT INTO {FTS_TABLE} (rowid, {columns}) VALUES ({placeholders})",
+                    [[food_id, *(doc[f] for f in FIELDS)] for food_id, doc in batch],
+                )
+
+    def index(self, queryset):
+        self._upsert(_documents(queryset))
+
+    def remove(self, food_ids):
+        for food_id in food_ids:
+            self._execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [food_id])
+
+    def rebuild(self):
+        with transaction.atomic(using=self.using):
+            self._execute(f"DELETE FROM {FTS_TABLE}")
+            self.index(FoodItem.objects.using(self.using).all())
+
+    def ranked(self, query, limit=MAX_RESULTS, after=None, backwards=False):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        # Quote every token so user input can't inject FTS operators
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        weights = ', '.join(str(WEIGHTS[f]) for f in FIELDS)
+        rank = f"bm25({FTS_TABLE}, {weights})"
+
+        sql = f"SELECT rowid, {rank} FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+        params = [match]
+        if after is not None:
+            # bm25 is lower-is-better, so rank order is (bm25, rowid) ascending
+            op = '<' if backwards else '>'
+            sql += f" AND ({rank} {op} %s OR ({rank} = %s AND rowid {op} %s))"
+            params += [after[0], after[0], after[1]]
+        direction = 'DESC' if backwards else 'ASC'
+        sql += f" ORDER BY {rank} {direction}, rowid {direction} LIMIT %s"
+        params.append(limit)
+        return [(food_id, score) for food_id, score in self._execute(sql, params)]
+
+
+class InvertedIndexBackend(SearchBackend):
+    """
+    In-memory inverted index: token -> {food_id: weighted term frequency}.
+
+    A sorted vocabulary answers prefix lookups with a binary search.
+    Built lazily from the database on first search.
+    """
+
+    def __init__(self, using='default'):
+        self.using = using
+        self._lock = threading.RLock()
+        self._built = False
+        self._postings = defaultdict(dict)
+        self._doc_tokens = {}
+        self._vocabulary = []
+
+    def _add(self, food_id, doc):
+        self._drop(food_id)
+        weights = defaultdict(float)
+        for field in FIELDS:
+            for token in tokenize(doc[field]):
+                weights[token] += WEIGHTS[field]
+        for token, weight in weights.items():
+            postings = self._postings[token]
+            if not postings:
+                i = bisect_left(self._vocabulary, token)
+                self._vocabulary.insert(i, token)
+            postings[food_id] = weight
+        self._doc_tokens[food_id] = tuple(weights)
+
+    def _drop(self, food_id):
+        for token in self._doc_tokens.pop(food_id, ()):
+            postings = self._postings[token]
+            postings.pop(food_id, None)
+            if not postings:
+                del self._postings[token]
+                i = bisect_left(self._vocabulary, token)
+                del self._vocabulary[i]
+
+    def _ensure_built(self):
+        if not self._built:
+            self.rebuild()
+
+    def rebuild(self):
+        with self._lock:
+            self._postings.clear()
+            self._doc_tokens.clear()
+            self._vocabulary.clear()
+            for food_id, doc in _documents(FoodItem.objects.using(self.using).all()):
+                self._add(food_id, doc)
+            self._built = True
+
+    def index(self, queryset):
+        docs = list(_documents(queryset))
+
+        def apply():
+            with self._lock:
+                if self._built:
+                    for food_id, doc in docs:
+                        self._add(food_id, doc)
+
+        # Memory isn't transactional: only apply what actually committed
+        transaction.on_commit(apply, using=self.using)
+
+    def remove(self, food_ids):
+        food_ids = list(food_ids)
+
+        def apply():
+            with self._lock:
+                for food_id in food_ids:
+                    self._drop(food_id)
+
+        transaction.on_commit(apply, using=self.using)
+
+    def _expand(self, prefix):
+        i = bisect_left(self._vocabulary, prefix)
+        while i < len(self._vocabulary) and self._vocabulary[i].startswith(prefix):
+            yield self._vocabulary[i]
+            i += 1
+
+    def ranked(self, query, limit=MAX_RESULTS, after=None, backwards=False):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+
+        with self._lock:
+            self._ensure_built()
+            total_docs = len(self._doc_tokens) or 1
+            scores = None
+            for term in tokens:
+                term_scores = {}
+                for token in self._expand(term):
+                    postings = self._postings[token]
+                    idf = math.log(1 + total_docs / len(postings))
+                    for food_id, weight in postings.items():
+                        score = weight * idf
+                        if score > term_scores.get(food_id, 0.0):
+                            term_scores[food_id] = score
+                if scores is None:
+                    scores = term_scores
+                else:
+                    # Every term must match
+                    scores = {
+                        food_id: score + term_scores[food_id]
+                        for food_id, score in scores.items()
+                        if food_id in term_scores
+                    }
+                if not scores:
+                    return []
+
+        # Same ascending (rank, id) convention as FTS5: negate the score
+        keyed = [(-score, food_id) for food_id, score in scores.items()]
+        if after is not None:
+            after = tuple(after)
+            keyed = [k for k in keyed if (k < after if backwards else k > after)]
+        keyed.sort(reverse=backwards)
+        return [(food_id, rank) for rank, food_id in keyed[:limit]]
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend(using=None):
+    """
+    Return the configured backend for a database alias (one per process).
+    """
+    using = using or router.db_for_read(FoodItem)
+    with _backends_lock:
+        backend = _backends.get(using)
+        if backend is None:
+            choice = getattr(settings, 'FOOD_SEARCH_BACKEND', 'auto')
+            if choice == 'fts5' or (choice == 'auto' and FTS5Backend.is_available(using)):
+                backend = FTS5Backend(using)
+            else:
+                # The index follows the saves this process makes, and those
+                # all go to the primary: a read replica shares its index
+                backend = _backends.get(DEFAULT_DB_ALIAS) or InvertedIndexBackend(DEFAULT_DB_ALIAS)
+                _backends[DEFAULT_DB_ALIAS] = backend
+            _backends[using] = backend
+    return backend
+
+
+class SearchPaginator(KeysetPaginator):
+    """
+    Keyset pagination over ranked search results, keyed by (rank, food id).
+    Ranks shift slightly as the index grows, so a cursor guarantees no
+    duplicates across pages rather than a frozen ordering.
+    """
+
+    def __init__(self, query, per_page=PER_PAGE, backend=None):
+        self.query = query
+        self.per_page = per_page
+        self.ordering = ('rank', 'id')
+        self.backend = backend or get_backend()
+
+    def fetch(self, key, backwards, limit):
+        ranked = self.backend.ranked(self.query, limit, after=key, backwards=backwards)
+        foods = FoodItem.objects.select_related('restaurant').in_bulk(
+            [food_id for food_id, _ in ranked]
+        )
+        results = []
+        # Keep rank order; skip ids deleted since they were indexed
+        for food_id, rank in ranked:
+            if food_id in foods:
+                food = foods[food_id]
+                food.search_rank = rank
+                results.append(food)
+        return results
+
+    def key_for(self, item):
+        return (item.search_rank, item.pk)
+
+    def decode_key(self, values):
+        return (float(values[0]), int(values[1]))
+
+
+def search_foods(query, cursor=None, per_page=PER_PAGE):
+    """
+    Return a keyset page of ranked ``FoodItem`` objects for ``query``.
+    """
+    return SearchPaginator(query, per_page).get_page(cursor)
@@ -0,0 +1,128 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from restaurants.models import Restaurant
+from . import catalog_cache, offers, renditions, sqlite
+from .conditional import favorites_version_key
+from .models import Category, FavoriteItem, FoodItem, Offer
+from .search import get_backend
+
+
+# -------------------------
+# SQLITE CONNECTION TUNING
+# -------------------------
+@receiver(connection_created)
+def tune_sqlite_connection(sender, connection, **kwargs):
+    sqlite.configure_connection(connection)
+
+
+# -------------------------
+# CATALOG CACHE VERSION
+# -------------------------
+@receiver(post_save, sender=FoodItem)
+@receiver(post_save, sender=Restaurant)
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Offer)
+@receiver(post_delete, sender=FoodItem)
+@receiver(post_delete, sender=Restaurant)
+@receiver(post_delete, sender=Category)
+@receiver(post_delete, sender=Offer)
+def bump_catalog_version(sender, using=None, **kwargs):
+    # After commit, so a miss can't rebuild from pre-change rows under the new version
+    transaction.on_commit(catalog_cache.bump_version, using=using)
+
+
+# -------------------------
+# CONDITIONAL GET VALIDATORS
+# -------------------------
+@receiver(post_save, sender=FoodItem)
+@receiver(post_delete, sender=FoodItem)
+def touch_restaurant(sender, instance, raw=False, using=None, **kwargs):
+    # A restaurant's updated_at stands for its whole menu page, deletions included.
+    # Legacy rows may still hold a restaurant name here (see fix_restaurants)
+    if raw or not isinstance(instance.restaurant_id, int):
+        return
+    Restaurant.objects.using(using).filter(pk=instance.restaurant_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=FavoriteItem)
+@receiver(post_delete, sender=FavoriteItem)
+def bump_favorites_version(sender, instance, using=None, **kwargs):
+    transaction.on_commit(
+        partial(catalog_cache.bump_version, favorites_version_key(instance.user_id)), using=using
+    )
+
+
+# -------------------------
+# OFFER INDEX
+# -------------------------
+@receiver(post_save, sender=Offer)
+@receiver(post_delete, sender=Offer)
+def invalidate_offer_index(sender, using=None, **kwargs):
+    transaction.on_commit(offers.invalidate, using=using)
+
+
+# -------------------------
+# SEARCH INDEX MAINTENANCE
+# -------------------------
+@receiver(post_save, sender=FoodItem)
+def index_food(sender, instance, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    get_backend(using).index(FoodItem.objects.using(using).filter(pk=instance.pk))
+
+
+@receiver(post_delete, sender=FoodItem)
+def unindex_food(sender, instance, using=None, **kwargs):
+    get_backend(using).remove([instance.pk])
+
+
+@receiver(post_save, sender=Restaurant)
+def reindex_restaurant_foods(sender, instance, raw=False, using=None, **kwargs):
+    # The restaurant name is part of every one of its foods' documents
+    if raw or kwargs.get('created'):
+        return
+    get_backend(using).index(FoodItem.objects.using(using).filter(restaurant=instance))
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_foods(sender, instance, raw=False, using=None, **kwargs):
+    if raw or kwargs.get('created'):
+        return
+    get_backend(using).index(FoodItem.objects.using(using).filter(category=instance))
+
+
+@receiver(pre_delete, sender=Category)
+def remember_category_foods(sender, instance, using=None, **kwargs):
+    # SET_NULL happens as a bulk UPDATE, so note the foods before it runs
+    instance._search_food_ids = list(
+        FoodItem.objects.using(using).filter(category=instance).values_list('id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Category)
+def reindex_uncategorised_foods(sender, instance, using=None, **kwargs):
+    food_ids = getattr(instance, '_search_food_ids', [])
+    if food_ids:
+        get_backend(using).index(FoodItem.objects.using(using).filter(pk__in=food_ids))
+
+
+# -------------------------
+# IMAGE RENDITIONS
+# -------------------------
+@receiver(post_save, sender=FoodItem)
+@receiver(post_save, sender=Restaurant)
+def queue_image_renditions(sender, instance, raw=False, using=None, **kwargs):
+    # After commit, and then on the background pool: the save never waits on
+    # Pillow. Images that already have renditions are skipped cheaply.
+    if raw or not instance.image:
+        return
+    transaction.on_commit(
+        partial(renditions.schedule, instance.image.name, instance.image.storage), using=using
+    )
+
@@ -0,0 +1,113 @@
+"""
+SQLite tuned for concurrent writers.
+
+* ``configure_connection`` (run on ``connection_created``) applies
+  ``settings.SQLITE_PRAGMAS`` to every new SQLite connection: WAL journaling
+  so readers never block the writer, ``synchronous=NORMAL`` (durable at
+  checkpoints, safe against corruption), memory-mapped reads and a
+  ``busy_timeout`` to wait out another writer instead of failing.
+* ``write_atomic`` is ``transaction.atomic`` that starts with ``BEGIN
+  IMMEDIATE``.  A default (deferred) transaction that reads first and then
+  writes must upgrade its lock, and when another connection wrote in
+  between SQLite fails it at once with "database is locked": the busy
+  timeout can't help.  Taking the write lock up front makes it wait in line
+  instead.  ``select_for_update()`` is a no-op on SQLite, so this is also
+  what serialises read-modify-write paths such as ``Order.save``.
+* ``retry_on_lock`` reruns a function whose transaction still failed on a
+  lock, with jittered exponential backoff, up to ``SQLITE_LOCK_RETRIES``
+  times.
+
+Other database backends are left alone.
+"""
+import logging
+import random
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,
+}
+DEFAULT_LOCK_RETRIES = 4
+BACKOFF_BASE = 0.02  # seconds; the n-th retry sleeps up to BACKOFF_BASE * 2**n
+BACKOFF_MAX = 0.5
+
+
+def configure_connection(connection):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', DEFAULT_PRAGMAS)
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+class _WriteAtomic(transaction.Atomic):
+    def __enter__(self):
+        connection = transaction.get_connection(self.using)
+        if connection.vendor != 'sqlite' or connection.in_atomic_block:
+            # Nested blocks are savepoints inside a transaction already begun
+            return super().__enter__()
+        connection.ensure_connection()  # transaction_mode is read from settings on connect
+        mode = connection.transaction_mode
+        connection.transaction_mode = 'IMMEDIATE'
+        try:
+            return super().__enter__()
+        finally:
+            connection.transaction_mode = mode
+
+
+def write_atomic(using=None, savepoint=True, durable=False):
+    """
+    ``transaction.atomic`` for blocks that will write: on SQLite the
+    outermost one takes the write lock when it begins.  Use it the same way,
+    as a context manager or decorator.
+    """
+    if callable(using):
+        return _WriteAtomic(DEFAULT_DB_ALIAS, savepoint, durable)(using)
+    return _WriteAtomic(using, savepoint, durable)
+
+
+def is_lock_error(exc):
+    message = str(exc)
+    return isinstance(exc, OperationalError) and (
+        'database is locked' in message or 'database table is locked' in message
+    )
+
+
+def retry_on_lock(func=None, *, using=None, retries=None):
+    """
+    Call ``func`` again, after a short randomised sleep, when it fails on a
+    database lock.  Only retries when ``func`` ran its own transaction: inside
+    an outer ``atomic`` block the lock error propagates, since the enclosing
+    transaction is lost anyway.  ``func`` must be safe to rerun after a
+    rollback.
+    """
+    if func is None:
+        return lambda f: retry_on_lock(f, using=using, retries=retries)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        connection = connections[using or DEFAULT_DB_ALIAS]
+        if retries is None:
+            tries = getattr(settings, 'SQLITE_LOCK_RETRIES', DEFAULT_LOCK_RETRIES) + 1
+        else:
+            tries = retries + 1
+        for attempt in range(1, tries + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if attempt == tries or not is_lock_error(e) or connection.in_atomic_block:
+                    raise
+                delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+                logger.info("%s hit a database lock (attempt %d/%d), retrying in %.0f ms",
+                            func.__qualname__, attempt, tries, delay * 1000)
+                time.sleep(delay)
+    return wrapper
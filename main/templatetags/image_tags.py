@@ -0,0 +1,41 @@
+from django import template
+from django.forms.utils import flatatt
+from django.utils.html import format_html, format_html_join
+
+from main import renditions
+
+register = template.Library()
+
+# Cards are a full-width column on phones and roughly 300px wide otherwise
+DEFAULT_SIZES = '(max-width: 600px) 100vw, 320px'
+
+
+@register.simple_tag
+def responsive_image(image, alt='', sizes=DEFAULT_SIZES, **attrs):
+    """
+    ``<picture>`` markup for an ImageField: WebP and original-format
+    ``srcset``s over the renditions, lazily loaded.  Falls back to the
+    original (still lazy) until its renditions exist.
+
+        {% responsive_image food.image food.name style="height:160px" %}
+    """
+    if not image:
+        return ''
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    storage = image.storage
+    if not renditions.available(image.name, storage):
+        return format_html('<img src="{}" alt="{}"{}>', image.url, alt, flatatt(attrs))
+
+    def srcset(webp):
+        return format_html_join(', ', '{} {}w', (
+            (storage.url(renditions.rendition_name(image.name, width, webp)), width)
+            for width in renditions.widths()
+        ))
+
+    fallback = storage.url(renditions.rendition_name(image.name, renditions.widths()[-1]))
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}"{}></picture>',
+        srcset(True), sizes, fallback, srcset(False), sizes, alt, flatatt(attrs),
+    )
@@ -1,3 +1,973 @@
-from django.test import TestCase
+import json
+import sqlite3
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.db import OperationalError, connection, transaction
+from django.db.models import F
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from PIL import Image
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from orders import archive
+from orders.models import Order
+from restaurants.models import Restaurant
+from . import catalog_cache, metrics, offers, recommendations, renditions, routing, sqlite, trending
+from .favorites import favorite_food_ids
+from .management.commands.index_advisor import _shape
+from .models import CacheVersion, Category, FavoriteItem, FoodItem, JobWatermark, Offer
+from .pagination import KeysetPaginator
+from .search import FTS5Backend, InvertedIndexBackend, get_backend
+
+
+class FavoritesMembershipTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice', password='pw')
+        cls.restaurant = Restaurant.objects.create(name='Spice Hub')
+        cls.small = Category.objects.create(name='Snacks')
+        cls.large = Category.objects.create(name='Meals')
+
+        for category, count in ((cls.small, 3), (cls.large, 40)):
+            foods = FoodItem.objects.bulk_create(
+                FoodItem(restaurant=cls.restaurant, category=category,
+                         name=f'{category.name} {i}', price=100)
+                for i in range(count)
+            )
+            FavoriteItem.objects.create(user=cls.user, food_item=foods[0])
+
+    def category_queries(self, category):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('foods_by_category', args=[category.id]))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_independent_of_category_size(self):
+        self.client.force_login(self.user)
+        self.category_queries(self.small)  # creates the shared version rows
+        self.assertEqual(self.category_queries(self.small), self.category_queries(self.large))
+
+    def test_favorite_ids_loaded_once_per_user_instance(self):
+        with self.assertNumQueries(1):
+            ids = favorite_food_ids(self.user)
+            favorite_food_ids(self.user)
+        self.assertEqual(len(ids), 2)
+
+    def test_page_marks_favorites(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('foods_by_category', args=[self.small.id]))
+        self.assertContains(response, 'Remove from Favorites', count=1)
+        self.assertContains(response, 'Add to Favorites', count=2)
+
+
+class FoodSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.biryani_house = Restaurant.objects.create(name='Biryani House')
+        cls.tiffin = Restaurant.objects.create(name='Tiffin Corner')
+        cls.rice = Category.objects.create(name='Rice')
+        cls.chicken_biryani = FoodItem.objects.create(
+            restaurant=cls.tiffin, category=cls.rice, name='Chicken Biryani', price=250)
+        cls.raita = FoodItem.objects.create(
+            restaurant=cls.biryani_house, name='Raita', description='Goes well with biryani', price=40)
+        cls.dosa = FoodItem.objects.create(
+            restaurant=cls.tiffin, name='Masala Dosa', description='Crispy', price=90)
+
+    def backends(self):
+        backends = [InvertedIndexBackend()]
+        if FTS5Backend.is_available():
+            backends.append(FTS5Backend())
+        return backends
+
+    def test_ranks_name_matches_first(self):
+        for backend in self.backends():
+            with self.subTest(backend=type(backend).__name__):
+                self.assertEqual(
+                    backend.search('biryani'), [self.chicken_biryani.id, self.raita.id])
+
+    def test_prefix_and_all_terms_must_match(self):
+        for backend in self.backends():
+            with self.subTest(backend=type(backend).__name__):
+                self.assertEqual(backend.search('mas do'), [self.dosa.id])
+                self.assertEqual(backend.search('masala biryani'), [])
+                self.assertEqual(backend.search('tiffin rice'), [self.chicken_biryani.id])
+
+    def test_index_follows_saves_and_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dosa.name = 'Onion Uttapam'
+            self.dosa.save()
+            self.raita.delete()
+        backend = get_backend()
+        self.assertEqual(backend.search('uttapam'), [self.dosa.id])
+        self.assertEqual(backend.search('raita'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tiffin.name = 'Udupi Express'
+            self.tiffin.save()
+        self.assertEqual(backend.search('udupi'), [self.chicken_biryani.id, self.dosa.id])
+
+    def test_search_view_paginates(self):
+        FoodItem.objects.bulk_create(
+            FoodItem(restaurant=self.tiffin, name=f'Idli {i}', price=30) for i in range(25)
+        )
+        get_backend().rebuild()
+        first = self.client.get(reverse('search_food'), {'q': 'idli'}).context['results']
+        self.assertEqual(len(first), 20)
+        response = self.client.get(reverse('search_food'), {'q': 'idli', 'cursor': first.next_cursor})
+        second = response.context['results']
+        self.assertEqual(len(second), 5)
+        self.assertFalse(second.has_next())
+        self.assertFalse({f.id for f in first} & {f.id for f in second})
+        self.assertContains(response, 'Previous')
+
+
+class CatalogCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurant = Restaurant.objects.create(name='Dhaba', popularity_score=1)
+        cls.food = FoodItem.objects.create(
+            restaurant=cls.restaurant, name='Lassi', price=60, trending_score=1)
+
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        catalog_cache.reset_stats()
+
+    def test_home_served_from_cache(self):
+        self.client.get(reverse('home'))
+        # Only the shared catalog version: once for the validators, once for the entry
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('home'))
+        self.assertContains(response, 'Lassi')
+        self.assertEqual(catalog_cache.stats()['home'], {'hits': 1, 'misses': 1})
+
+    def test_catalog_write_bumps_version(self):
+        self.client.get(reverse('restaurant_detail', args=[self.restaurant.id]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.food.name = 'Mango Lassi'
+            self.food.save()
+        response = self.client.get(reverse('restaurant_detail', args=[self.restaurant.id]))
+        self.assertContains(response, 'Mango Lassi')
+        self.assertEqual(catalog_cache.stats()['restaurant_detail']['misses'], 2)
+
+    def test_version_shared_across_processes(self):
+        self.client.get(reverse('restaurant_detail', args=[self.restaurant.id]))
+        # Another worker or a management command: no signal runs here and
+        # this process's cache keeps its entry, only the shared row moves
+        FoodItem.objects.filter(pk=self.food.pk).update(name='Salt Lassi')
+        CacheVersion.objects.filter(name=catalog_cache.VERSION_KEY).update(value=F('value') + 1)
+        response = self.client.get(reverse('restaurant_detail', args=[self.restaurant.id]))
+        self.assertContains(response, 'Salt Lassi')
+
+    def test_replica_only_trusted_for_cache_after_it_caught_up(self):
+        with mock.patch.object(routing, 'uses_replica', return_value=True):
+            catalog_cache.get_version()
+            # A change made in another process, seen through the shared row
+            CacheVersion.objects.filter(name=catalog_cache.VERSION_KEY).update(changed_at=timezone.now())
+            self.assertTrue(catalog_cache.replica_may_lag())
+            CacheVersion.objects.filter(name=catalog_cache.VERSION_KEY).update(
+                changed_at=timezone.now() - timedelta(seconds=60))
+            self.assertFalse(catalog_cache.replica_may_lag())
+
+    def test_missing_restaurant_is_404(self):
+        response = self.client.get(reverse('restaurant_detail', args=[9999]))
+        self.assertEqual(response.status_code, 404)
+
+
+class TrendingScoreTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('ravi', password='pw')
+        cls.dhaba = Restaurant.objects.create(name='Dhaba')
+        cls.naan = FoodItem.objects.create(restaurant=cls.dhaba, name='Naan', price=30)
+        cls.tikka = FoodItem.objects.create(restaurant=cls.dhaba, name='Tikka', price=180)
+        cls.lassi = FoodItem.objects.create(
+            restaurant=Restaurant.objects.create(name='Lassi Bar'), name='Lassi', price=60)
+
+        now = timezone.now()
+        cls.orders = {}
+        for name, status, age, food, quantity in [
+            ('naan', 'DELIVERED', timedelta(0), cls.naan, 2),
+            ('tikka', 'PREPARING', timedelta(0), cls.tikka, 1),
+            # Six half-lives old: 5 units weigh 5/64
+            ('lassi', 'COMPLETED', 6 * trending.half_life(), cls.lassi, 5),
+            ('cart', 'PENDING', timedelta(0), cls.naan, 9),
+            ('cancelled', 'CANCELLED', timedelta(0), cls.tikka, 10),
+        ]:
+            order = Order.objects.create(user=cls.user, status=status)
+            order.items.create(food=food, price=food.price, quantity=quantity)
+            Order.objects.filter(pk=order.pk).update(created_at=now - age)
+            cls.orders[name] = order.pk
+
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+
+    def score(self, food):
+        return trending.current(FoodItem.objects.get(pk=food.pk).trending_score)
+
+    def home(self):
+        context = self.client.get(reverse('home')).context
+        return ([f.name for f in context['trending_foods']],
+                [r.name for r in context['popular_restaurants']])
+
+    def test_scores_decay_and_rank_the_home_page(self):
+        self.assertEqual(self.home(), ([], []))
+        self.assertEqual(trending.refresh(lag=0)[0], 3)
+        self.assertAlmostEqual(self.score(self.naan), 2, places=3)
+        self.assertAlmostEqual(self.score(self.tikka), 1, places=3)
+        self.assertAlmostEqual(self.score(self.lassi), 5 / 64, places=3)
+        self.assertAlmostEqual(
+            trending.current(Restaurant.objects.get(pk=self.dhaba.pk).popularity_score), 3, places=3)
+        self.assertEqual(self.home(), (['Naan', 'Tikka', 'Lassi'], ['Dhaba', 'Lassi Bar']))
+
+        # Incremental: only the cancelled order's food is rescored
+        self.assertEqual(trending.refresh(lag=0)[0], 0)
+        Order.objects.filter(pk=self.orders['naan']).update(status='CANCELLED', updated_at=timezone.now())
+        with mock.patch.object(trending, 'stream_scores', wraps=trending.stream_scores) as stream:
+            self.assertEqual(trending.refresh(lag=0)[0], 1)
+        self.assertEqual(stream.call_count, 1)
+        self.assertEqual(FoodItem.objects.get(pk=self.naan.pk).trending_score, 0)
+        self.assertAlmostEqual(
+            trending.current(Restaurant.objects.get(pk=self.dhaba.pk).popularity_score), 1, places=3)
+        self.assertEqual(self.home(), (['Tikka', 'Lassi'], ['Dhaba', 'Lassi Bar']))
+
+    def test_command_reaches_the_cached_home_page(self):
+        response = self.client.get(reverse('home'))
+        etag = response['ETag']
+        self.assertEqual(list(response.context['trending_foods']), [])
+
+        call_command('score_trending', '--lag=0', stdout=StringIO())
+        response = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.home(), (['Naan', 'Tikka', 'Lassi'], ['Dhaba', 'Lassi Bar']))
+
+        etag = response['ETag']
+        Order.objects.filter(pk=self.orders['naan']).update(status='CANCELLED', updated_at=timezone.now())
+        call_command('score_trending', '--lag=0', stdout=StringIO())
+        response = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([f.name for f in response.context['trending_foods']], ['Tikka', 'Lassi'])
+
+    def test_epoch_rebases_before_scores_overflow(self):
+        old = timezone.now() - 300 * trending.half_life()
+        JobWatermark.objects.create(name=trending.EPOCH, value=old)
+        out = StringIO()
+        call_command('score_trending', '--lag=0', stdout=out)
+        self.assertIn('Foods rescored: 3', out.getvalue())
+        self.assertGreater(trending.get_epoch(), timezone.now() - trending.half_life())
+        self.assertAlmostEqual(self.score(self.naan), 2, places=3)
+
+
+class RecommendationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('uma', password='pw')
+        cls.dhaba = Restaurant.objects.create(name='Dhaba')
+        cls.naan = FoodItem.objects.create(restaurant=cls.dhaba, name='Naan', price=30)
+        cls.dal = FoodItem.objects.create(restaurant=cls.dhaba, name='Dal', price=120)
+        cls.tikka = FoodItem.objects.create(restaurant=cls.dhaba, name='Tikka', price=180)
+        cls.lassi = FoodItem.objects.create(
+            restaurant=Restaurant.objects.create(name='Lassi Bar'), name='Lassi', price=60)
+        for status, foods in [
+            ('DELIVERED', [cls.naan, cls.dal]),
+            ('DELIVERED', [cls.naan, cls.dal, cls.lassi]),
+            ('PREPARING', [cls.naan, cls.dal]),
+            ('DELIVERED', [cls.naan, cls.tikka]),
+            ('OUT', [cls.naan, cls.lassi]),
+            ('CANCELLED', [cls.tikka, cls.lassi]),
+            ('PENDING', [cls.tikka, cls.lassi]),
+        ]:
+            order = Order.objects.create(user=cls.user, status=status)
+            for food in foods:
+                order.items.create(food=food, price=food.price)
+        # Archived orders count too
+        archive.archive_batch(list(Order.objects.filter(status='DELIVERED').values_list('pk', flat=True)[:1]))
+
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+
+    def neighbours(self):
+        return {
+            food.name: [(rec.recommended.name, rec.orders, round(rec.score, 2))
+                        for rec in food.recommendations.order_by('rank')]
+            for food in FoodItem.objects.order_by('id')
+        }
+
+    def test_build_and_incremental_refresh(self):
+        self.assertIsNone(recommendations.refresh(lag=0)[0])
+        # Naan + Tikka is in one order only: under MIN_ORDERS
+        self.assertEqual(self.neighbours(), {
+            'Naan': [('Dal', 3, 0.6), ('Lassi', 2, 0.4)],
+            'Dal': [('Naan', 3, 1.0)],
+            'Tikka': [],
+            'Lassi': [('Naan', 2, 1.0)],
+        })
+
+        self.assertEqual(recommendations.refresh(lag=0)[0], [])
+        order = Order.objects.create(user=self.user, status='PREPARING')
+        order.items.create(food=self.naan, price=self.naan.price)
+        order.items.create(food=self.tikka, price=self.tikka.price)
+        foods, written, _ = recommendations.refresh(lag=0)
+        self.assertEqual(sorted(foods), [self.naan.pk, self.tikka.pk])
+        self.assertEqual(written, 4)
+        incremental = self.neighbours()
+        # Ties go to the lower id
+        self.assertEqual(incremental['Naan'], [('Dal', 3, 0.5), ('Tikka', 2, 0.33), ('Lassi', 2, 0.33)])
+        self.assertEqual(incremental['Tikka'], [('Naan', 2, 1.0)])
+
+        out = StringIO()
+        call_command('build_recommendations', '--full', stdout=out)
+        self.assertIn('Foods rebuilt: all', out.getvalue())
+        self.assertEqual(self.neighbours(), incremental)
+
+    def test_new_pairs_move_the_menu_validators(self):
+        url = reverse('restaurant_detail', args=[self.dhaba.pk])
+        Restaurant.objects.filter(pk=self.dhaba.pk).update(updated_at=timezone.now() - timedelta(hours=1))
+        response = self.client.get(url)
+        self.assertNotContains(response, 'Dal + Naan')
+        modified, etag = response['Last-Modified'], response['ETag']
+
+        call_command('build_recommendations', stdout=StringIO())
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertContains(response, 'Dal + Naan')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_cart_and_menu_pages(self):
+        recommendations.refresh(lag=0)
+        with self.assertNumQueries(1):
+            self.assertEqual(recommendations.for_foods([self.naan.pk, self.dal.pk]), [self.lassi])
+        self.assertEqual(
+            [(rec.food.name, rec.recommended.name) for rec in recommendations.pairs(
+                [self.naan.pk, self.dal.pk, self.tikka.pk])],
+            [('Dal', 'Naan'), ('Naan', 'Lassi')],
+        )
+
+        response = self.client.get(reverse('restaurant_detail', args=[self.dhaba.pk]))
+        self.assertContains(response, 'Dal + Naan')
+        self.assertContains(response, 'from another restaurant')
+
+        self.client.force_login(User.objects.create_user('vik', password='pw'))
+        self.client.get(reverse('add_to_cart', args=[self.naan.pk]))
+        response = self.client.get(reverse('view_cart'))
+        self.assertEqual(response.context['recommended'], [self.dal, self.lassi])
+        self.assertContains(response, 'Frequently ordered together')
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Duplicate names force the id tie-breaker to do its job
+        Restaurant.objects.bulk_create(
+            Restaurant(name=f'Cafe {i // 2}') for i in range(11)
+        )
+
+    def walk(self, paginator):
+        names, page = [], paginator.get_page()
+        pages = [page]
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            pages.append(page)
+        for page in pages:
+            names += [r.id for r in page]
+        return pages, names
+
+    def test_forward_walk_matches_full_ordering(self):
+        paginator = KeysetPaginator(Restaurant.objects.all(), ('name', '-id'), per_page=4)
+        pages, ids = self.walk(paginator)
+        expected = list(Restaurant.objects.order_by('name', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual([len(p) for p in pages], [4, 4, 3])
+
+        back = paginator.get_page(pages[2].previous_cursor)
+        self.assertEqual([r.id for r in back], [r.id for r in pages[1]])
+        self.assertTrue(back.has_previous())
+        self.assertTrue(back.has_next())
+
+    def test_one_query_per_page_at_any_depth(self):
+        paginator = KeysetPaginator(Restaurant.objects.all(), ('-id',), per_page=2)
+        page = paginator.get_page()
+        while page.has_next():
+            with self.assertNumQueries(1):
+                page = paginator.get_page(page.next_cursor)
+
+    def test_stable_under_concurrent_inserts(self):
+        paginator = KeysetPaginator(Restaurant.objects.all(), ('-id',), per_page=5)
+        first = paginator.get_page()
+        Restaurant.objects.create(name='Newcomer')
+        second = paginator.get_page(first.next_cursor)
+        self.assertEqual(second.object_list[0].id, first.object_list[-1].id - 1)
+
+    def test_bad_cursor_means_first_page(self):
+        paginator = KeysetPaginator(Restaurant.objects.all(), ('-id',), per_page=5)
+        self.assertEqual(
+            [r.id for r in paginator.get_page('not-a-cursor')],
+            [r.id for r in paginator.get_page()],
+        )
+
+    def test_restaurant_list_cursor(self):
+        Restaurant.objects.bulk_create(Restaurant(name=f'Diner {i}') for i in range(15))
+        catalog_cache.get_cache().clear()
+        response = self.client.get(reverse('restaurant_list'))
+        page = response.context['restaurants']
+        self.assertTrue(page.has_next())
+        response = self.client.get(reverse('restaurant_list'), {'cursor': page.next_cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['restaurants'].has_next())
+
+    def test_restaurant_list_caches_by_decoded_cursor(self):
+        Restaurant.objects.bulk_create(Restaurant(name=f'Diner {i}') for i in range(15))
+        cache = catalog_cache.get_cache()
+        cache.clear()
+        next_cursor = self.client.get(reverse('restaurant_list')).context['restaurants'].next_cursor
+        for junk in ('not-a-cursor', 'e30', '!!!'):
+            self.client.get(reverse('restaurant_list'), {'cursor': junk})
+        # Padding is optional, so both spellings name the same page
+        for variant in (next_cursor, next_cursor + '=' * (-len(next_cursor) % 4)):
+            response = self.client.get(reverse('restaurant_list'), {'cursor': variant})
+            self.assertFalse(response.context['restaurants'].has_next())
+        keys = [key for key in cache._cache if ':catalog:restaurant_list:' in key]
+        self.assertEqual(len(keys), 2)
+
+
+class OfferIndexTests(TestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+
+    def offer(self, minimum, discount, **kwargs):
+        return Offer.objects.create(title=f'{discount} off {minimum}', min_order_amount=minimum,
+                                    discount_amount=discount, **kwargs)
+
+    def test_best_applicable_offer(self):
+        self.offer(0, 20)
+        mid = self.offer(300, 60)
+        self.offer(1000, 50)  # bigger threshold, smaller discount: never best
+        top = self.offer(2000, 250)
+        self.offer(100, 500, is_active=False)
+
+        self.assertEqual(offers.price(Decimal('150')).discount, Decimal('20'))
+        self.assertEqual(offers.price(Decimal('300')).offer, mid)
+        self.assertEqual(offers.price(Decimal('1500')).offer, mid)
+        pricing = offers.price(Decimal('2400'))
+        self.assertEqual((pricing.offer, pricing.amount_due), (top, Decimal('2150')))
+
+    def test_discount_never_exceeds_total(self):
+        self.offer(0, 100)
+        pricing = offers.price(Decimal('40'))
+        self.assertEqual((pricing.discount, pricing.amount_due), (Decimal('40'), Decimal('0')))
+
+    def test_time_windows(self):
+        now = timezone.now()
+        self.offer(0, 10)
+        later = self.offer(0, 90, valid_from=now + timedelta(hours=1))
+        ended = self.offer(0, 80, valid_until=now - timedelta(minutes=1))
+        ending = self.offer(0, 70, valid_until=now + timedelta(hours=2))
+
+        candidates = list(Offer.objects.exclude(pk=ended.pk))
+        index = offers.OfferIndex(candidates, now)
+        self.assertEqual(index.best_for(Decimal('50')), ending)
+        self.assertEqual(index.expires_at, later.valid_from)
+
+        index = offers.OfferIndex(candidates, now + timedelta(hours=1, seconds=1))
+        self.assertEqual(index.best_for(Decimal('50')), later)
+        self.assertEqual(index.expires_at, ending.valid_until)
+
+    def test_saving_an_offer_invalidates_the_index(self):
+        offer = self.offer(0, 10)
+        self.assertEqual(offers.price(Decimal('100')).discount, Decimal('10'))
+        # Only the shared offers version is read
+        with self.assertNumQueries(1):
+            offers.price(Decimal('100'))
+
+        offer.discount_amount = Decimal('15')
+        with self.captureOnCommitCallbacks(execute=True):
+            offer.save()
+        self.assertEqual(offers.price(Decimal('100')).discount, Decimal('15'))
+
+    def test_offer_edited_in_another_process(self):
+        offer = self.offer(0, 10)
+        self.assertEqual(offers.price(Decimal('100')).discount, Decimal('10'))
+        # Saved by another worker: its signal only moved the shared version
+        Offer.objects.filter(pk=offer.pk).update(discount_amount=Decimal('25'))
+        CacheVersion.objects.filter(name=offers.OFFERS_VERSION_KEY).update(value=F('value') + 1)
+        self.assertEqual(offers.price(Decimal('100')).discount, Decimal('25'))
+
+
+class SeedAndBenchmarkTests(TestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+
+    def test_seed_data(self):
+        Order.objects.create(user=User.objects.create_user('existing'))
+        call_command('seed_data', restaurants=3, foods_per_restaurant=4, users=5,
+                     orders_per_user=3, favorites_per_user=2, chunk_size=4, stdout=StringIO())
+
+        self.assertEqual(FoodItem.objects.count(), 12)
+        self.assertEqual(FavoriteItem.objects.count(), 10)
+        numbers = sorted(Order.objects.values_list('order_number', flat=True))
+        self.assertEqual(numbers, list(range(1, 17)))
+        out = StringIO()
+        call_command('check_order_totals', stdout=out)
+        self.assertIn('Mismatched: 0', out.getvalue())
+        # Unique usernames on a second run
+        call_command('seed_data', restaurants=1, foods_per_restaurant=1, users=2,
+                     orders_per_user=0, stdout=StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='seed-user-').count(), 7)
+
+    def test_benchmark_baseline_and_regression(self):
+        call_command('seed_data', restaurants=2, foods_per_restaurant=3, users=2,
+                     orders_per_user=2, stdout=StringIO())
+        baseline = Path(tempfile.mkdtemp()) / 'views.json'
+        # Timings are too noisy to assert on here; query counts are exact
+        options = {'baseline': baseline, 'repeat': 2, 'warmup': 1, 'max_slowdown': 100,
+                   'route': ['/restaurants/', '/orders/cart/'], 'stdout': StringIO()}
+
+        call_command('bench_views', update=True, **options)
+        views = json.loads(baseline.read_text())['views']
+        self.assertEqual(views['/restaurants/<int:pk>/']['status'], 200)
+        self.assertEqual(views['/orders/cart/batch/']['method'], 'POST')
+        self.assertEqual(FoodItem.objects.count(), 6)  # nothing left behind
+
+        call_command('bench_views', **options)  # same code: passes
+
+        views['/restaurants/<int:pk>/']['queries'] -= 1
+        baseline.write_text(json.dumps({'views': views}))
+        with self.assertRaisesMessage(CommandError, '1 regression(s)'):
+            call_command('bench_views', **options)
+
+
+class FixRestaurantsTests(TestCase):
+    def setUp(self):
+        self.spice = Restaurant.objects.create(name='Spice Route')
+        self.ok = FoodItem.objects.create(restaurant=self.spice, name='Dal', price=100)
+        self.broken = []
+        for i, value in enumerate(['Spice Route', ' spice  ROUTE', 'SPICE ROUTE', 'Nowhere']):
+            food = FoodItem.objects.create(restaurant=self.spice, name=f"Food {i}", price=100)
+            # Rows written before restaurant became a foreign key held the name
+            with connection.cursor() as cursor:
+                cursor.execute("UPDATE main_fooditem SET restaurant_id = %s WHERE id = %s", [value, food.pk])
+            self.broken.append(food.pk)
+
+    def run_fix(self, *args):
+        out = StringIO()
+        call_command('fix_restaurants', *args, batch_size=2, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_dry_run_then_fix(self):
+        out = self.run_fix('--dry-run')
+        self.assertIn('Fixed: 3', out)
+        self.assertIn("No Restaurant found for 'Nowhere'", out)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM main_fooditem WHERE typeof(restaurant_id) = 'text'")
+            self.assertEqual(cursor.fetchone()[0], 4)
+
+        with CaptureQueriesContext(connection) as captured:
+            out = self.run_fix()
+        self.assertIn('Scanned: 5', out)
+        self.assertIn('Fixed: 3', out)
+        self.assertIn('Not Fixed (Errors): 1', out)
+        # Reads and writes are per batch, not per row
+        self.assertLess(len(captured), 20)
+        fixed = FoodItem.objects.filter(pk__in=self.broken[:3], restaurant=self.spice)
+        self.assertEqual(fixed.count(), 3)
+        self.assertTrue(get_backend().search('spice route'))
+
+        # The unresolvable row would fail the deferred foreign key check
+        FoodItem.objects.filter(pk=self.broken[3]).delete()
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        metrics.reset()
+        catalog_cache.get_cache().clear()
+
+    @override_settings(METRICS_SERVER_TIMING=True, METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_records_sql_and_template_time_per_view(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('home'))
+        queries = len(captured)
+        self.assertRegex(response['Server-Timing'],
+                         rf'^db;dur=[\d.]+;desc="{queries} queries", tpl;dur=[\d.]+, total;dur=[\d.]+$')
+
+        body = self.client.get('/metrics').content.decode()
+        view = 'view="main.views.home"'
+        self.assertIn(f'foodapp_request_duration_seconds_count{{{view}}} 1', body)
+        self.assertIn(f'foodapp_request_sql_queries_sum{{{view}}} {queries}', body)
+        self.assertIn(f'foodapp_request_sql_queries_bucket{{{view},le="+Inf"}} 1', body)
+        self.assertIn('# TYPE foodapp_request_template_duration_seconds histogram', body)
+
+        # Served from the catalog cache the second time: fewer queries
+        self.client.get(reverse('home'))
+        self.assertIn(f'foodapp_request_duration_seconds_count{{{view}}} 2', metrics.render())
+
+    @override_settings(METRICS_SERVER_TIMING=False)
+    def test_server_timing_optional(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('home')))
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('t', 'Test.', (1, 5))
+        for value in (0, 1, 3, 9):
+            histogram.observe('v', value)
+        lines = histogram.render()
+        self.assertIn('t_bucket{view="v",le="1"} 2', lines)
+        self.assertIn('t_bucket{view="v",le="5"} 3', lines)
+        self.assertIn('t_bucket{view="v",le="+Inf"} 4', lines)
+        self.assertIn('t_sum{view="v"} 13', lines)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_endpoint_restricted(self):
+        # Nothing is allowed by address by default, not even localhost
+        self.assertEqual(self.client.get('/metrics').status_code, 404)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 404)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret').status_code, 200)
+        with self.settings(METRICS_TOKEN=''):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 404)
+        staff = User.objects.create_user('ops', password='pw', is_staff=True)
+        self.client.force_login(staff)
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+    def test_overhead_benchmark_runs(self):
+        out = StringIO()
+        # Timings are too noisy to gate on here
+        call_command('bench_metrics', requests=3, rounds=1, max_overhead=100, stdout=out)
+        self.assertIn('overhead', out.getvalue())
+
+
+def _jpeg(width=1200, height=800):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), 'orange').save(buffer, 'JPEG')
+    return SimpleUploadedFile('dish.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+
+@override_settings(IMAGE_RENDITION_WIDTHS=(320, 640), IMAGE_RENDITIONS_BACKGROUND=False)
+class RenditionTests(TestCase):
+    def setUp(self):
+        self.enterContext(override_settings(MEDIA_ROOT=tempfile.mkdtemp()))
+        renditions._available.clear()
+        self.restaurant = Restaurant.objects.create(name='Tandoor')
+
+    def render(self, food):
+        return Template('{% load image_tags %}{% responsive_image food.image food.name %}').render(
+            Context({'food': food}))
+
+    def test_upload_queues_renditions_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            food = FoodItem.objects.create(restaurant=self.restaurant, name='Naan', price=40, image=_jpeg())
+        self.assertFalse(renditions.available(food.image.name))
+        # Until then the original is served, lazily
+        self.assertIn(f'<img src="{food.image.url}" alt="Naan" decoding="async" loading="lazy">',
+                      self.render(food))
+
+        for callback in callbacks:
+            callback()
+        name = food.image.name
+        with default_storage.open(renditions.rendition_name(name, 320, webp=True)) as f:
+            self.assertEqual(Image.open(f).format, 'WEBP')
+        with default_storage.open(renditions.rendition_name(name, 640)) as f:
+            self.assertEqual(Image.open(f).size, (640, 427))
+
+        html = self.render(food)
+        self.assertIn('<source type="image/webp" srcset="', html)
+        self.assertIn(f'{default_storage.url(renditions.rendition_name(name, 320, webp=True))} 320w', html)
+        self.assertIn('loading="lazy"', html)
+
+    def test_small_originals_are_not_upscaled(self):
+        food = FoodItem.objects.create(restaurant=self.restaurant, name='Roti', price=20, image=_jpeg(500, 500))
+        renditions.generate(food.image.name)
+        with default_storage.open(renditions.rendition_name(food.image.name, 640)) as f:
+            self.assertEqual(Image.open(f).size, (500, 500))
+
+    @override_settings(IMAGE_RENDITIONS_BACKGROUND=True)
+    def test_background_pool(self):
+        food = FoodItem.objects.create(restaurant=self.restaurant, name='Kulcha', price=50, image=_jpeg())
+        renditions.schedule(food.image.name).result(timeout=30)
+        self.assertTrue(renditions.available(food.image.name))
+
+    def test_backfill_command(self):
+        foods = [
+            FoodItem.objects.create(restaurant=self.restaurant, name=f"Dish {i}", price=50, image=_jpeg())
+            for i in range(3)
+        ]
+        self.restaurant.image = _jpeg()
+        self.restaurant.save()
+        default_storage.save('food/broken.jpg', SimpleUploadedFile('broken.jpg', b'not an image'))
+        FoodItem.objects.create(restaurant=self.restaurant, name='Broken', price=1, image='food/broken.jpg')
+
+        out = StringIO()
+        # Worker processes log the broken file; they inherit this at fork
+        with mock.patch.object(renditions.logger, 'disabled', True):
+            call_command('build_renditions', workers=2, stdout=out)
+        self.assertIn('Images processed: 5', out.getvalue())
+        self.assertIn('Renditions written: 16', out.getvalue())
+        self.assertIn('Skipped: 1', out.getvalue())
+        for food in foods:
+            self.assertTrue(renditions.available(food.image.name))
+
+        out = StringIO()
+        with mock.patch.object(renditions.logger, 'disabled', True):
+            call_command('build_renditions', workers=2, stdout=out)
+        self.assertIn('1 image(s) to process', out.getvalue())
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        self.restaurant = Restaurant.objects.create(name='Udupi')
+        self.category = Category.objects.create(name='Tiffin')
+        self.dosa = FoodItem.objects.create(restaurant=self.restaurant, name='Dosa', price=60,
+                                            category=self.category)
+        catalog_cache.bump_version()
+
+    def test_home_not_modified_without_queries(self):
+        response = self.client.get(reverse('home'))
+        etag = response['ETag']
+        self.assertTrue(etag.startswith('W/"'))
+        self.assertIn('Last-Modified', response)
+        self.assertIn('Cookie', response['Vary'])
+        self.assertIn('no-cache', response['Cache-Control'])
+
+        # Just the catalog version
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(reverse('home'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        # Any catalog write moves the validator on
+        self.dosa.price = 70
+        with self.captureOnCommitCallbacks(execute=True):
+            self.dosa.save()
+        response = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_validators_follow_changes_from_other_processes(self):
+        response = self.client.get(reverse('home'))
+        etag, modified = response['ETag'], response['Last-Modified']
+        # What a management command or another worker leaves behind
+        CacheVersion.objects.filter(name=catalog_cache.VERSION_KEY).update(
+            value=F('value') + 1, changed_at=timezone.now() + timedelta(seconds=2))
+        response = self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        response = self.client.get(reverse('home'), HTTP_IF_MODIFIED_SINCE=modified)
+        self.assertEqual(response.status_code, 200)
+
+    def test_signed_in_pages_follow_favorites(self):
+        user = User.objects.create_user('uma', password='pw')
+        self.client.force_login(user)
+        url = reverse('foods_by_category', args=[self.category.id])
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('add_to_favorites', args=[self.dosa.id]))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'remove-favorite-btn')
+        # That render showed the "added" message; validators are back now
+        response = self.client.get(url)
+
+        # Another visitor never matches this user's page
+        self.client.logout()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_pending_messages_are_never_a_304(self):
+        self.client.force_login(User.objects.create_user('uma', password='pw'))
+        url = reverse('restaurant_detail', args=[self.restaurant.id])
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(reverse('add_to_cart', args=[self.dosa.id]))
+        self.assertRedirects(response, url, fetch_redirect_response=False)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertContains(response, 'Dosa added to cart!')
+
+        # Shown once; revalidation works again afterwards
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_no_validators_while_replica_may_lag(self):
+        with mock.patch.object(catalog_cache, 'replica_may_lag', return_value=True):
+            response = self.client.get(reverse('home'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('no-cache', response['Cache-Control'])
+
+
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        self.router = routing.PrimaryReplicaRouter()
+        patcher = mock.patch.object(routing, 'replica_alias', return_value='replica')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _serve(self, request, view=None):
+        """
+        Run ``view`` (default: read a FoodItem and a User) through the
+        middleware and return what it recorded plus the response.
+        """
+        seen = []
+
+        def read(request):
+            seen.append((self.router.db_for_read(FoodItem), self.router.db_for_read(User)))
+            return HttpResponse()
+
+        response = routing.replica_middleware(view or read)(request)
+        return seen, response
+
+    def test_outside_requests_everything_reads_the_primary(self):
+        self.assertEqual(self.router.db_for_read(FoodItem), 'default')
+
+    def test_catalog_reads_go_to_the_replica(self):
+        seen, response = self._serve(RequestFactory().get('/'))
+        self.assertEqual(seen, [('replica', 'default')])
+        self.assertNotIn(routing.PIN_COOKIE, response.cookies)
+
+    def test_read_only_views_send_all_reads_to_the_replica(self):
+        seen = []
+
+        @routing.replica_reads
+        def view(request):
+            seen.append(self.router.db_for_read(User))
+            return HttpResponse()
+
+        self._serve(RequestFactory().get('/'), view)
+        self.assertEqual(seen, ['replica'])
+
+    def test_unsafe_methods_and_pinned_browsers_read_the_primary(self):
+        seen, _ = self._serve(RequestFactory().post('/'))
+        self.assertEqual(seen, [('default', 'default')])
+        request = RequestFactory().get('/')
+        request.COOKIES[routing.PIN_COOKIE] = '1'
+        seen, _ = self._serve(request)
+        self.assertEqual(seen, [('default', 'default')])
+
+    def test_a_write_pins_the_rest_of_the_request_and_the_browser(self):
+        seen = []
+
+        def view(request):
+            self.assertEqual(self.router.db_for_write(FoodItem), 'default')
+            seen.append(self.router.db_for_read(FoodItem))
+            return HttpResponse()
+
+        _, response = self._serve(RequestFactory().get('/'), view)
+        self.assertEqual(seen, ['default'])
+        cookie = response.cookies[routing.PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], routing.lag_seconds())
+
+    def test_replicate_copies_a_consistent_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source, target = Path(tmp, 'primary.sqlite3'), Path(tmp, 'replica.sqlite3')
+            with sqlite3.connect(source) as db:
+                db.execute('CREATE TABLE food (name TEXT)')
+                db.executemany('INSERT INTO food VALUES (?)', [('Idli',), ('Vada',)])
+            db.close()
+            routing.replicate(source, target)
+            db = sqlite3.connect(target)
+            self.assertEqual(db.execute('SELECT COUNT(*) FROM food').fetchone(), (2,))
+            db.close()
+
+    def test_replicate_command_needs_a_replica(self):
+        with mock.patch.object(routing, 'replica_alias', return_value=None), \
+                self.assertRaisesMessage(CommandError, 'No replica database'):
+            call_command('replicate', stdout=StringIO())
+
+
+class SQLiteTuningTests(TransactionTestCase):
+    def test_pragmas_applied_to_new_connections(self):
+        connection.close()
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+
+    def test_write_atomic_begins_immediate_once(self):
+        with CaptureQueriesContext(connection) as captured:
+            with sqlite.write_atomic():
+                with sqlite.write_atomic():
+                    Category.objects.create(name='Chaat')
+        sql = [query['sql'] for query in captured.captured_queries]
+        self.assertEqual(sql[0], 'BEGIN IMMEDIATE')
+        self.assertNotIn('BEGIN IMMEDIATE', sql[1:])
+        # Plain atomic blocks keep the default
+        with CaptureQueriesContext(connection) as captured:
+            with transaction.atomic():
+                Category.objects.count()
+        self.assertEqual(captured.captured_queries[0]['sql'], 'BEGIN')
+
+    @mock.patch('main.sqlite.time.sleep')
+    def test_retry_on_lock(self, sleep):
+        calls = []
+
+        def failing(times, message='database is locked'):
+            def func():
+                calls.append(1)
+                if len(calls) <= times:
+                    raise OperationalError(message)
+                return 'done'
+            return func
+
+        self.assertEqual(sqlite.retry_on_lock(failing(2), retries=2)(), 'done')
+        self.assertEqual((len(calls), sleep.call_count), (3, 2))
+
+        calls.clear()
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            sqlite.retry_on_lock(failing(5), retries=2)()
+        self.assertEqual(len(calls), 3)
+
+        # Other errors, and locks inside the caller's transaction, propagate at once
+        calls.clear()
+        with self.assertRaisesMessage(OperationalError, 'no such table'):
+            sqlite.retry_on_lock(failing(1, 'no such table: x'))()
+        calls.clear()
+        with self.assertRaises(OperationalError), transaction.atomic():
+            sqlite.retry_on_lock(failing(1))()
+        self.assertEqual(len(calls), 1)
+
+
+class IndexAdvisorTests(TestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        call_command('seed_data', restaurants=2, foods_per_restaurant=5, users=2,
+                     orders_per_user=3, stdout=StringIO())
+
+    def test_listing_queries_use_indexes(self):
+        out = StringIO()
+        call_command('index_advisor', min_rows=0, repeat=1, all=True, fail=True,
+                     route=['category/', 'restaurants/', 'my-orders/'], stdout=out)
+        self.assertIn('Flagged: 0', out.getvalue())
+        self.assertIn('USING INDEX fooditem_category_name', out.getvalue())
+
+    def test_flags_scans_and_sorts(self):
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, 'scan or sort without an index'):
+            # Category.objects.all()[:10] on the home page reads the whole table
+            call_command('index_advisor', min_rows=0, repeat=1, fail=True, route=['/'], stdout=out)
+        self.assertIn('SCAN main_category', out.getvalue())
+
+    def test_statement_shapes(self):
+        self.assertEqual(
+            _shape("SELECT * FROM t WHERE a = 12 AND b = 'x''y' AND c IN (1, 2, 3)"),
+            _shape("SELECT * FROM t WHERE a = 7 AND b = 'z' AND c IN (4)"),
+        )
 
-# Create your tests here.
@@ -0,0 +1,209 @@
+"""
+Trending foods and popular restaurants, scored from order velocity.
+
+A food's score is its recent order volume with exponential time decay:
+every unit ordered counts 1 when it is ordered, half after
+``TRENDING_HALF_LIFE_HOURS``, a quarter after two half-lives, and so on.  A
+restaurant's score is the sum of its foods'.  The home page reads the top
+of each through the score indexes.
+
+Scores are stored *forward decayed*: a unit ordered at ``t`` is stored as
+``2 ** ((t - epoch) / half_life)``, against a fixed epoch, rather than as its
+weight at the time of the run.  Every stored score would decay by the same
+factor between runs, so the ordering holds without rewriting any row and a
+food's score only changes when it gets orders.  The score as of ``now`` is
+``current()``.  The epoch moves forward (one UPDATE per table, ``rebase()``)
+before the stored numbers get near the float range.
+
+``refresh()`` (``manage.py score_trending``) is incremental: it rescores only
+the foods in orders changed since its ``JobWatermark``, a cancellation
+included, from their items in one streaming pass.  The first run, or
+``full``, scores every food in one pass over all items.  Orders older than
+``HORIZON_HALF_LIVES`` half-lives weigh under 0.1% and are left out, which
+also keeps archived orders (``ORDER_ARCHIVE_AFTER_DAYS``) out of it.
+"""
+import math
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from orders.models import OrderItem
+from orders.rollups import COUNTED_STATUSES
+from restaurants.models import Restaurant
+from . import catalog_cache
+from .models import FoodItem, JobWatermark
+from .sqlite import retry_on_lock, write_atomic
+
+WATERMARK = 'trending'
+EPOCH = 'trending_epoch'
+DEFAULT_HALF_LIFE_HOURS = 72
+DEFAULT_LAG_SECONDS = 60
+HORIZON_HALF_LIVES = 10
+# Stored scores reach 2 ** this before rebase(); floats go to 2 ** 1023
+REBASE_HALF_LIVES = 256
+CHUNK_SIZE = 10000
+IDS_PER_QUERY = 500
+
+
+def half_life():
+    return timedelta(hours=getattr(settings, 'TRENDING_HALF_LIFE_HOURS', DEFAULT_HALF_LIFE_HOURS))
+
+
+def get_epoch():
+    watermark = JobWatermark.objects.filter(name=EPOCH).first()
+    return watermark.value if watermark else None
+
+
+def current(score, epoch=None, now=None):
+    """A stored score as a decayed order count as of ``now``."""
+    epoch = epoch or get_epoch()
+    if epoch is None:
+        return 0.0
+    return score * 2 ** (-((now or timezone.now()) - epoch) / half_life())
+
+
+def stream_scores(items, epoch, since):
+    """
+    One pass over ``items`` (OrderItems), in chunks: the forward-decayed
+    score of every food among them, as ``{food_id: score}``.  Only items of
+    counted orders placed after ``since`` count.
+    """
+    rate = math.log(2) / half_life().total_seconds()
+    origin = epoch.timestamp()
+    rows = (
+        items.filter(order__status__in=COUNTED_STATUSES, order__created_at__gt=since,
+                     food__isnull=False)
+        .values_list('food_id', 'quantity', 'order__created_at')
+        .order_by()
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    food_ids, scores = [], []
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == CHUNK_SIZE:
+            _add_chunk(chunk, rate, origin, food_ids, scores)
+            chunk = []
+    _add_chunk(chunk, rate, origin, food_ids, scores)
+    if not food_ids:
+        return {}
+
+    # Fold the per-chunk sums into one per food
+    ids, index = np.unique(np.concatenate(food_ids), return_inverse=True)
+    totals = np.bincount(index, weights=np.concatenate(scores), minlength=len(ids))
+    return dict(zip(ids.tolist(), totals.tolist()))
+
+
+def _add_chunk(chunk, rate, origin, food_ids, scores):
+    if not chunk:
+        return
+    ids, quantities, placed = zip(*chunk)
+    weights = np.array(quantities, dtype=np.float64) * np.exp(
+        rate * (np.array([t.timestamp() for t in placed]) - origin))
+    ids, index = np.unique(np.array(ids, dtype=np.int64), return_inverse=True)
+    food_ids.append(ids)
+    scores.append(np.bincount(index, weights=weights, minlength=len(ids)))
+
+
+def _write_scores(scores):
+    # executemany() of one parameterised UPDATE: bulk_update()'s CASE over
+    # 500 ids per statement is several times slower for 100k foods
+    table = connection.ops.quote_name(FoodItem._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {table} SET trending_score = %s WHERE id = %s',
+            [(score, food_id) for food_id, score in scores.items()],
+        )
+
+
+def _sum_restaurant_scores(restaurants):
+    restaurants.update(popularity_score=Coalesce(Subquery(
+        FoodItem.objects.filter(restaurant=OuterRef('pk'), trending_score__gt=0).order_by()
+        .values('restaurant').annotate(total=Sum('trending_score')).values('total')
+    ), Value(0.0)))
+
+
+@retry_on_lock
+@write_atomic
+def store(scores, food_ids=None):
+    """
+    Save food scores and their restaurants' sums.  ``food_ids`` are the
+    foods that were rescored: those of them missing from ``scores`` drop to
+    0.  None means every food was.
+    """
+    if food_ids is None:
+        FoodItem.objects.filter(trending_score__gt=0).update(trending_score=0)
+        restaurants = Restaurant.objects.all()
+    else:
+        FoodItem.objects.filter(pk__in=food_ids).update(trending_score=0)
+        restaurants = Restaurant.objects.filter(
+            pk__in=FoodItem.objects.filter(pk__in=food_ids).values('restaurant_id'))
+    _write_scores(scores)
+    _sum_restaurant_scores(restaurants)
+
+
+@retry_on_lock
+@write_atomic
+def rebase(epoch, now):
+    """
+    Move the epoch forward by whole half-lives to just before ``now``,
+    scaling every stored score down to match.  Returns the new epoch.
+    """
+    steps = int((now - epoch) / half_life())
+    factor = 2.0 ** -steps
+    FoodItem.objects.filter(trending_score__gt=0).update(trending_score=F('trending_score') * factor)
+    Restaurant.objects.filter(popularity_score__gt=0).update(popularity_score=F('popularity_score') * factor)
+    epoch += steps * half_life()
+    JobWatermark.objects.update_or_create(name=EPOCH, defaults={'value': epoch})
+    return epoch
+
+
+def changed_foods(since, until):
+    # Carts (PENDING) never count; anything else may have changed a score
+    return list(
+        OrderItem.objects.filter(order__updated_at__gt=since, order__updated_at__lte=until,
+                                 food__isnull=False)
+        .exclude(order__status='PENDING')
+        .order_by().values_list('food_id', flat=True).distinct()
+    )
+
+
+def refresh(full=False, lag=None):
+    """
+    Bring the scores up to date; the first run, or ``full``, scores every
+    food.  Returns ``(foods rescored, new watermark)``.
+    """
+    if lag is None:
+        lag = getattr(settings, 'TRENDING_LAG_SECONDS', DEFAULT_LAG_SECONDS)
+    until = timezone.now() - timedelta(seconds=lag)
+    epoch = get_epoch()
+    if epoch is None:
+        epoch = until
+        JobWatermark.objects.update_or_create(name=EPOCH, defaults={'value': epoch})
+        full = True
+    elif until - epoch > REBASE_HALF_LIVES * half_life():
+        epoch = rebase(epoch, until)
+    since = until - HORIZON_HALF_LIVES * half_life()
+
+    watermark = JobWatermark.objects.filter(name=WATERMARK).first()
+    if full or watermark is None:
+        store(stream_scores(OrderItem.objects.all(), epoch, since))
+        rescored = FoodItem.objects.count()
+    else:
+        food_ids = changed_foods(watermark.value, until)
+        for start in range(0, len(food_ids), IDS_PER_QUERY):
+            chunk = food_ids[start:start + IDS_PER_QUERY]
+            store(stream_scores(OrderItem.objects.filter(food_id__in=chunk), epoch, since), chunk)
+        rescored = len(food_ids)
+
+    JobWatermark.objects.update_or_create(name=WATERMARK, defaults={'value': until})
+    if rescored:
+        # The home page is cached with the catalog; the version is shared,
+        # so web processes see this command's bump
+        catalog_cache.bump_version()
+    return rescored, until
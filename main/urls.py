@@ -23,6 +23,9 @@ urlpatterns = [
     path('cart/', views.view_cart, name='view_cart'),
     path('cart/add/<int:food_id>/', views.add_to_cart, name='add_to_cart'),
     path('cart/remove/<int:food_id>/', views.remove_from_cart, name='remove_from_cart'),
+
+    # METRICS (Prometheus scrape target)
+    path('metrics', views.metrics_view, name='metrics'),
     
     
 
@@ -1,4 +1,8 @@
+import hmac
+
 from django.shortcuts import render, get_object_or_404, redirect
+from django.conf import settings
+from django.http import Http404, HttpResponse
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 
@@ -11,69 +15,92 @@ from .models import (
     Category,
     Offer
 )
+from . import catalog_cache, metrics, offers
+from .conditional import catalog_conditional
+from .favorites import forget_favorite_food_ids
+from .pagination import paginate
+from .routing import replica_reads
+from .search import search_foods
+from restaurants.views import _restaurant_menu, _restaurant_page
 
 
 # -------------------------
 # HOME PAGE
 # -------------------------
+def _home_catalog():
+    return {
+        # Top K off the score indexes (main/trending.py)
+        'trending_foods': list(
+            FoodItem.objects.filter(trending_score__gt=0).order_by('-trending_score', '-id')[:6]
+        ),
+        'popular_restaurants': list(
+            Restaurant.objects.filter(popularity_score__gt=0).order_by('-popularity_score', '-id')[:6]
+        ),
+        'categories': list(Category.objects.all()[:10]),
+        'offers': list(Offer.objects.all()[:6]),
+    }
+
+
+@replica_reads
+@catalog_conditional()
 def home(request):
-    trending_foods = FoodItem.objects.filter(is_trending=True)[:6]
-    popular_restaurants = Restaurant.objects.filter(is_popular=True)[:6]
-    categories = Category.objects.all()[:10]
-    offers = Offer.objects.all()[:6]
-
-    return render(request, 'main/home.html', {
-        'trending_foods': trending_foods,
-        'popular_restaurants': popular_restaurants,
-        'categories': categories,
-        'offers': offers,
-    })
+    context = catalog_cache.get_or_build('home', _home_catalog)
+    return render(request, 'main/home.html', context)
 
 
 # -------------------------
 # RESTAURANT LIST
 # -------------------------
+@replica_reads
 def restaurant_list(request):
-    restaurants = Restaurant.objects.all()
+    restaurants = _restaurant_page(request)
     return render(request, 'main/restaurant_list.html', {'restaurants': restaurants})
 
 
 # -------------------------
 # RESTAURANT DETAIL
 # -------------------------
+@replica_reads
 def restaurant_detail(request, pk):
-    restaurant = get_object_or_404(Restaurant, pk=pk)
-    foods = FoodItem.objects.filter(restaurant=restaurant)
+    # Same cache entry as the restaurants app's page; this one shows no pairs
+    restaurant, foods, _ = catalog_cache.get_or_build(
+        'restaurant_detail', lambda: _restaurant_menu(pk), pk
+    )
+    if restaurant is None:
+        raise Http404("No Restaurant matches the given query.")
 
     return render(request, 'main/restaurant_detail.html', {
         'restaurant': restaurant,
-        'foods': foods
+        'foods': foods,
     })
 
 
 # -------------------------
 # FOODS BY CATEGORY
 # -------------------------
+@replica_reads
+@catalog_conditional()
 def foods_by_category(request, category_id):
     category = get_object_or_404(Category, id=category_id)
-    foods = FoodItem.objects.filter(category=category)
+    foods = paginate(request, FoodItem.objects.filter(category=category), ('name', 'id'))
 
     return render(request, 'main/category_foods.html', {
         'category': category,
-        'foods': foods
+        'foods': foods,
     })
 
 
 # -------------------------
 # FOODS BY OFFER
 # -------------------------
+@replica_reads
 def foods_by_offer(request, offer_id):
     offer = get_object_or_404(Offer, id=offer_id)
-    foods = FoodItem.objects.filter(offer=offer)
+    foods = paginate(request, FoodItem.objects.filter(offer=offer), ('name', 'id'))
 
     return render(request, 'main/offer_foods.html', {
         'offer': offer,
-        'foods': foods
+        'foods': foods,
     })
 
 
@@ -108,23 +135,15 @@ def view_cart(request):
         item.subtotal = item.food_item.price * item.quantity
         total_price += item.subtotal
 
-    # 🔥 Auto apply best offer
-    applied_offer = None
-    discount = 0
-
-    offer = Offer.objects.filter(is_active=True).order_by('-discount_amount').first()
-    if offer and total_price >= offer.min_order_amount:
-        discount = offer.discount_amount
-        applied_offer = offer
-
-    final_total = total_price - discount
+    # 🔥 Auto apply best offer (the biggest discount whose minimum is met)
+    pricing = offers.price(total_price)
 
     return render(request, 'main/cart.html', {
         'cart_items': cart_items,
         'total_price': total_price,
-        'discount': discount,
-        'final_total': final_total,
-        'applied_offer': applied_offer,
+        'discount': pricing.discount,
+        'final_total': pricing.amount_due,
+        'applied_offer': pricing.offer,
     })
 
 
@@ -185,21 +204,10 @@ def place_order(request):
         item.food_item.price * item.quantity for item in cart_items
     )
 
-    applied_offer = None
-    discount = 0
-
-    offer = Offer.objects.filter(is_active=True).order_by('-discount_amount').first()
-    if offer and total_price >= offer.min_order_amount:
-        discount = offer.discount_amount
-        applied_offer = offer
+    pricing = offers.price(total_price)
 
-    final_total = total_price - discount
-
-    order = Order.objects.create(
-        total=final_total,
-        applied_offer=applied_offer,
-        discount=discount
-    )
+    # This Order model keeps no offer/discount columns, only the amount due
+    order = Order.objects.create(total=pricing.amount_due)
 
     for item in cart_items:
         order.items.create(
@@ -218,7 +226,7 @@ def place_order(request):
 # -------------------------
 @login_required(login_url='login')
 def my_orders(request):
-    orders = Order.objects.order_by('-created_at')
+    orders = paginate(request, Order.objects.all(), ('-created_at', '-id'))
     return render(request, 'main/my_orders.html', {'orders': orders})
 
 
@@ -236,13 +244,14 @@ def cancel_order(request, order_id):
 # -------------------------
 # SEARCH FOOD
 # -------------------------
+@replica_reads
 def search_food(request):
-    query = request.GET.get('q', '')
-    results = FoodItem.objects.filter(name__icontains=query)
+    query = request.GET.get('q', '').strip()
+    results = search_foods(query, cursor=request.GET.get('cursor'))
 
     return render(request, 'main/search_results.html', {
         'query': query,
-        'results': results
+        'results': results,
     })
 
 
@@ -253,6 +262,7 @@ def search_food(request):
 def add_to_favorites(request, food_id):
     food = get_object_or_404(FoodItem, id=food_id)
     FavoriteItem.objects.get_or_create(user=request.user, food_item=food)
+    forget_favorite_food_ids(request.user)
     messages.success(request, f"{food.name} added to Favorites!")
     return redirect(request.META.get('HTTP_REFERER', 'restaurant_list'))
 
@@ -261,11 +271,32 @@ def add_to_favorites(request, food_id):
 def remove_favorite(request, food_id):
     food = get_object_or_404(FoodItem, id=food_id)
     FavoriteItem.objects.filter(user=request.user, food_item=food).delete()
+    forget_favorite_food_ids(request.user)
     messages.success(request, f"{food.name} removed from Favorites!")
     return redirect('favorites')
 
 
 @login_required(login_url='login')
 def view_favorites(request):
-    favorites = FavoriteItem.objects.filter(user=request.user)
-    return render(request, "main/favorites.html", {"favorites": favorites})
\ No newline at end of file
+    favorites = paginate(
+        request,
+        FavoriteItem.objects.filter(user=request.user).select_related('food_item__restaurant'),
+        ('-id',),
+    )
+    return render(request, "main/favorites.html", {"favorites": favorites})
+
+
+# -------------------------
+# METRICS (Prometheus)
+# -------------------------
+def _metrics_token_ok(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    scheme, _, given = request.headers.get('Authorization', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(given.encode(), token.encode())
+
+
+def metrics_view(request):
+    allowed = request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ())
+    if not (allowed or _metrics_token_ok(request) or request.user.is_staff):
+        raise Http404
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE)
@@ -0,0 +1,126 @@
+"""
+Hot/cold order storage.
+
+``manage.py archive_orders`` moves finished orders (``FINAL_STATUSES``)
+older than ``settings.ORDER_ARCHIVE_AFTER_DAYS``, with their items, from
+``Order``/``OrderItem`` into ``ArchivedOrder``/``ArchivedOrderItem``, one
+batch per transaction.  Rows keep their ids.  The hot tables, and their
+indexes, then only hold recent and in-flight orders: carts, checkout and
+the newest history.
+
+Reading both: ``history()`` pages a user's orders across the two tables as
+one list, and ``get_order()`` looks in the hot table first and then in the
+archive.  Archived orders are read-only.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from main.pagination import PER_PAGE, MergedKeysetPaginator
+from main.sqlite import retry_on_lock, write_atomic
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+FINAL_STATUSES = ('DELIVERED', 'CANCELLED', 'COMPLETED')
+DEFAULT_ARCHIVE_AFTER_DAYS = 90
+HISTORY_ORDERING = ('-created_at', '-id')
+ARCHIVE_ORDERING = ('created_at', 'id')
+
+# Columns copied across: everything the archive models share with the hot ones
+ORDER_COLUMNS = [f.attname for f in ArchivedOrder._meta.concrete_fields if f.name != 'archived_at']
+ITEM_COLUMNS = [f.attname for f in ArchivedOrderItem._meta.concrete_fields]
+
+
+def cutoff(days=None):
+    if days is None:
+        days = getattr(settings, 'ORDER_ARCHIVE_AFTER_DAYS', DEFAULT_ARCHIVE_AFTER_DAYS)
+    return timezone.now() - timedelta(days=days)
+
+
+def candidates(before, after=None, limit=1000):
+    """
+    Up to ``limit`` archivable orders created before ``before``, oldest
+    first, from the key ``after`` (``(created_at, id)`` of the last one
+    seen) on.  One keyset walk of the order_status_created index per
+    status, merged.
+    """
+    walk = MergedKeysetPaginator([
+        Order.objects.filter(status=status, created_at__lt=before).only('id', 'created_at')
+        for status in FINAL_STATUSES
+    ], ARCHIVE_ORDERING, limit)
+    return walk.fetch(after, False, limit)
+
+
+@retry_on_lock
+@write_atomic
+def archive_batch(order_ids):
+    """
+    Move these orders and their items into the archive in one transaction.
+    Returns ``(orders, items)`` moved.
+    """
+    # Checked again under the write lock: an order may have moved on since
+    rows = list(Order.objects.filter(pk__in=order_ids, status__in=FINAL_STATUSES).values(*ORDER_COLUMNS))
+    ids = [row['id'] for row in rows]
+    items = list(OrderItem.objects.filter(order_id__in=ids).values(*ITEM_COLUMNS))
+
+    ArchivedOrder.objects.bulk_create(ArchivedOrder(**row) for row in rows)
+    ArchivedOrderItem.objects.bulk_create(ArchivedOrderItem(**row) for row in items)
+    # Queryset deletes: OrderItem.delete() would push each subtotal onto the
+    # order's total, and the order goes too
+    OrderItem.objects.filter(order_id__in=ids).delete()
+    Order.objects.filter(pk__in=ids).delete()
+    return len(ids), len(items)
+
+
+def history(user, per_page=PER_PAGE):
+    """
+    Paginator over the user's placed orders, hot and archived, newest first.
+    """
+    return MergedKeysetPaginator([
+        Order.objects.filter(user=user).exclude(status='PENDING'),
+        ArchivedOrder.objects.filter(user=user),
+    ], HISTORY_ORDERING, per_page)
+
+
+def get_order(user, order_id):
+    order = Order.objects.filter(pk=order_id, user=user).first()
+    if order is None:
+        order = ArchivedOrder.objects.filter(pk=order_id, user=user).first()
+    return order
+
+
+async def aget_order(user, order_id):
+    order = await Order.objects.filter(pk=order_id, user=user).afirst()
+    if order is None:
+        order = await ArchivedOrder.objects.filter(pk=order_id, user=user).afirst()
+    return order
+
+
+def table_report(models=(Order, OrderItem)):
+    """
+    ``{table: {'rows': n, 'table_bytes': n, 'index_bytes': {index: n}}}``
+    for the hot tables.  Sizes come from SQLite's ``dbstat`` table (pages
+    in use, not free pages left in the file) and are None elsewhere.
+    """
+    report = {}
+    with connection.cursor() as cursor:
+        for model in models:
+            table = model._meta.db_table
+            entry = report[table] = {
+                'rows': model.objects.count(), 'table_bytes': None, 'index_bytes': {},
+            }
+            if connection.vendor != 'sqlite':
+                continue
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s",
+                           [table])
+            indexes = [row[0] for row in cursor.fetchall()]
+            for name in [table, *indexes]:
+                cursor.execute('SELECT pgsize FROM dbstat WHERE name = %s AND aggregate = TRUE', [name])
+                row = cursor.fetchone()
+                size = row[0] if row else 0
+                if name == table:
+                    entry['table_bytes'] = size
+                else:
+                    entry['index_bytes'][name] = size
+    return report
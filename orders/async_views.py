@@ -0,0 +1,151 @@
+"""
+Native async versions of the hot cart and order endpoints.
+
+Served instead of the sync views in ``orders.views`` when
+``settings.ASYNC_VIEWS`` is on (the ASGI profile, see ``foodapp/asgi.py``).
+They use the async ORM API so a request waiting on the database doesn't hold
+a worker thread.  Everything a template touches is loaded up front: lazy
+queries can't run while rendering inside the event loop.
+"""
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect, render
+from django.views.decorators.http import require_POST
+
+from main import offers, recommendations
+from . import archive, events
+from .cart import get_cart_store, parse_deltas
+from .models import Order
+# Endpoints without an async version are served unchanged
+from .views import (  # noqa: F401
+    _cart_context, _cart_food_ids, _place_order, cancel_order, kitchen_advance, kitchen_queue,
+    kitchen_queue_api, order_detail, sales_dashboard,
+)
+
+
+async def _current_user(request):
+    # Resolve the user once so templates read it without a sync DB lookup
+    request.user = await request.auser()
+    return request.user
+
+
+async def _pending_order(user):
+    return await Order.objects.filter(user=user, status='PENDING').afirst()
+
+
+# ----------------------------
+# View Cart
+# ----------------------------
+@login_required
+async def view_cart(request):
+    user = await _current_user(request)
+    cart = await get_cart_store().aget(user)
+    recommended = await recommendations.afor_foods(_cart_food_ids(cart))
+    return render(request, 'orders/cart.html',
+                  _cart_context(cart, await offers.aprice(cart.total), recommended))
+
+
+# ----------------------------
+# Remove from Cart
+# ----------------------------
+@login_required
+async def remove_from_cart(request, food_id):
+    user = await _current_user(request)
+    if await get_cart_store().aremove(user, food_id):
+        messages.info(request, "Item removed from cart!")
+    return redirect('view_cart')
+
+
+# ----------------------------
+# Increment Quantity
+# ----------------------------
+@login_required
+async def increment_quantity(request, food_id):
+    user = await _current_user(request)
+    await get_cart_store().achange(user, food_id, 1)
+    return redirect('view_cart')
+
+
+# ----------------------------
+# Decrement Quantity
+# ----------------------------
+@login_required
+async def decrement_quantity(request, food_id):
+    user = await _current_user(request)
+    await get_cart_store().achange(user, food_id, -1)
+    return redirect('view_cart')
+
+
+# ----------------------------
+# Batch cart update (JSON)
+# ----------------------------
+@login_required
+@require_POST
+async def cart_batch(request):
+    try:
+        deltas = parse_deltas(request.body)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    user = await _current_user(request)
+    cart = await get_cart_store().aapply(user, deltas)
+    return JsonResponse(cart.summary())
+
+
+# ----------------------------
+# Checkout (Cart Checkout)
+# ----------------------------
+@login_required
+async def checkout(request):
+    user = await _current_user(request)
+    store = get_cart_store()
+    cart = await store.aget(user)
+
+    if not cart:
+        messages.error(request, "Your cart is empty!")
+        return redirect('view_cart')
+
+    # GET → show customer details form
+    if request.method == "GET":
+        return render(request, "restaurants/checkout.html",
+                      _cart_context(cart, await offers.aprice(cart.total)))
+
+    # POST → save customer details and place order
+    if request.method == "POST":
+        # One write transaction, so it runs in a single thread
+        if await sync_to_async(_place_order)(store, user, request.POST) is None:
+            messages.error(request, "Your cart is empty!")
+            return redirect('view_cart')
+        await store.aclear(user)
+
+        messages.success(request, "Order placed successfully!")
+        return redirect("my_orders")
+
+
+# ----------------------------
+# My Orders
+# ----------------------------
+@login_required
+async def my_orders(request):
+    user = await _current_user(request)
+    pending_order = await _pending_order(user)
+    orders = await archive.history(user).aget_page(request.GET.get('cursor'))
+    return render(request, 'orders/my_orders.html', {
+        'pending_order': pending_order,
+        'orders': orders
+    })
+
+
+# ----------------------------
+# Order status events (SSE)
+# ----------------------------
+@login_required
+async def order_events(request):
+    user = await _current_user(request)
+    # EventSource sends back the last id it saw when it reconnects
+    body = events.stream(user.id, last_event_id=request.headers.get('Last-Event-ID'))
+    return StreamingHttpResponse(body, content_type='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # nginx: pass events through as they come
+    })
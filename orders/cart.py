@@ -0,0 +1,544 @@
+"""
+Cart stores.
+
+A user's cart is their PENDING order.  ``get_cart_store()`` returns the store
+named by ``settings.CART_STORE``:
+
+* ``DBCartStore`` (default) writes every click straight to the PENDING
+  ``Order``/``OrderItem`` rows.
+* ``CacheCartStore`` is write-behind: the live cart is a compact dict in the
+  ``settings.CART_CACHE_ALIAS`` cache, and reaches the database at checkout
+  and on periodic flushes.  Each process flushes the dirty carts it can see
+  every ``settings.CART_FLUSH_INTERVAL`` seconds on a background thread
+  (started by its first cart change), never inside a user's request; with
+  a shared cache ``manage.py flush_carts`` can do it from cron instead.
+
+Crash-safety of ``CacheCartStore``:
+
+* The database always holds the cart as of the last flush.  A cache restart,
+  eviction or (for locmem) process crash loses at most the clicks made since
+  then, i.e. about one flush interval; the next read falls back to the
+  flushed rows.
+* A flush writes the whole cart state, not deltas, in one transaction, so it
+  is idempotent and safe to retry; a failed flush leaves the cart dirty and
+  it is picked up by the next run.
+* A cart is only marked clean if nothing changed while it was being flushed.
+"""
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from functools import lru_cache
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.signals import setting_changed
+from django.db import connections
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from main.models import FoodItem
+from main.sqlite import retry_on_lock, write_atomic
+from .models import Order, OrderItem
+
+logger = logging.getLogger(__name__)
+
+
+class CartLine:
+    """
+    One cart row; quacks like ``OrderItem`` for the cart templates.
+    """
+    __slots__ = ('food', 'food_id', 'quantity', 'price')
+
+    def __init__(self, food, quantity, price):
+        self.food = food
+        self.food_id = food.pk
+        self.quantity = quantity
+        self.price = price
+
+    @property
+    def subtotal(self):
+        return self.price * self.quantity
+
+
+class Cart:
+    def __init__(self, lines, order=None):
+        self.lines = lines
+        self.order = order
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    @property
+    def total(self):
+        return sum((line.subtotal for line in self.lines), Decimal('0'))
+
+    @property
+    def count(self):
+        return sum(line.quantity for line in self.lines)
+
+    def summary(self):
+        """
+        Small JSON-ready dict for updating the page without a reload.
+        """
+        return {
+            'items': [
+                {
+                    'food_id': line.food_id,
+                    'name': line.food.name if line.food else None,
+                    'quantity': line.quantity,
+                    'price': str(line.price),
+                    'subtotal': str(line.subtotal),
+                }
+                for line in self.lines
+            ],
+            'count': self.count,
+            'total': str(self.total),
+        }
+
+
+MAX_BATCH_OPS = 100
+# Per operation: a click queue, not a quantity field.  Also keeps sums well
+# inside SQLite's INTEGER
+MAX_DELTA = 99
+
+
+def parse_deltas(body):
+    """
+    ``[{"food_id": 3, "delta": 2}, ...]`` JSON -> ``{3: 2}``, summing
+    repeated foods.  Raises ``ValueError`` on anything else.
+    """
+    ops = json.loads(body)
+    if not isinstance(ops, list) or len(ops) > MAX_BATCH_OPS:
+        raise ValueError(f"expected a list of at most {MAX_BATCH_OPS} operations")
+    deltas = {}
+    for op in ops:
+        if not isinstance(op, dict):
+            raise ValueError("each operation must be an object")
+        food_id, delta = op.get('food_id'), op.get('delta')
+        # type() rather than isinstance() so booleans are rejected
+        if type(food_id) is not int or type(delta) is not int:
+            raise ValueError("food_id and delta must be integers")
+        if abs(delta) > MAX_DELTA:
+            raise ValueError(f"delta must be between -{MAX_DELTA} and {MAX_DELTA}")
+        deltas[food_id] = deltas.get(food_id, 0) + delta
+    return deltas
+
+
+class BaseCartStore:
+    """
+    Interface shared by every store.  The async variants default to running
+    the sync method in a thread; stores override them where they can do
+    better.
+    """
+
+    def get(self, user):
+        """Return the user's ``Cart``."""
+        raise NotImplementedError
+
+    def add(self, user, food):
+        """Add one of ``food`` to the cart."""
+        raise NotImplementedError
+
+    def change(self, user, food_id, delta):
+        """Shift an existing line's quantity; lines reaching 0 are removed."""
+        raise NotImplementedError
+
+    def remove(self, user, food_id):
+        """Drop a line; return whether it existed."""
+        raise NotImplementedError
+
+    def apply(self, user, deltas):
+        """
+        Apply ``{food_id: delta}`` in one go and return the new ``Cart``.
+        Unknown foods are ignored; lines reaching 0 are removed.
+        """
+        raise NotImplementedError
+
+    def persist(self, user):
+        """Make sure the cart is stored as the PENDING order and return it (None if empty)."""
+        raise NotImplementedError
+
+    def clear(self, user):
+        """Forget the live cart after its order left PENDING."""
+
+    def flush(self):
+        """Write every unpersisted cart to the database; return how many."""
+        return 0
+
+    async def aget(self, user):
+        return await sync_to_async(self.get)(user)
+
+    async def aadd(self, user, food):
+        return await sync_to_async(self.add)(user, food)
+
+    async def achange(self, user, food_id, delta):
+        return await sync_to_async(self.change)(user, food_id, delta)
+
+    async def aremove(self, user, food_id):
+        return await sync_to_async(self.remove)(user, food_id)
+
+    async def aapply(self, user, deltas):
+        return await sync_to_async(self.apply)(user, deltas)
+
+    async def apersist(self, user):
+        return await sync_to_async(self.persist)(user)
+
+    async def aclear(self, user):
+        return await sync_to_async(self.clear)(user)
+
+
+# ----------------------------
+# Database-backed store
+# ----------------------------
+class DBCartStore(BaseCartStore):
+    """
+    The cart lives in the PENDING order; every change is a DB write.
+    """
+
+    def _pending(self, user):
+        return Order.objects.filter(user=user, status='PENDING')
+
+    def _item(self, user, food_id):
+        return (
+            OrderItem.objects.filter(order__user=user, order__status='PENDING', food_id=food_id)
+            .select_related('order')
+        )
+
+    def get(self, user):
+        order = self._pending(user).first()
+        lines = list(order.items.select_related('food')) if order else []
+        return Cart(lines, order)
+
+    # Each change is one write transaction, so a lock failure can rerun it whole
+    @retry_on_lock
+    @write_atomic
+    def add(self, user, food):
+        order, _ = Order.objects.get_or_create(
+            user=user, status='PENDING', defaults={'total_price': 0}
+        )
+        order_item, created = OrderItem.objects.get_or_create(
+            order=order,
+            food=food,
+            defaults={'price': food.price, 'quantity': 1}
+        )
+        # OrderItem.save keeps the order total in step
+        if not created:
+            order_item.quantity += 1
+            order_item.save()
+
+    @retry_on_lock
+    @write_atomic
+    def change(self, user, food_id, delta):
+        item = self._item(user, food_id).first()
+        if item:
+            if item.quantity + delta > 0:
+                item.quantity += delta
+                item.save()
+            else:
+                item.delete()
+
+    @retry_on_lock
+    @write_atomic
+    def remove(self, user, food_id):
+        item = self._item(user, food_id).first()
+        if item:
+            item.delete()
+        return item is not None
+
+    @retry_on_lock
+    def apply(self, user, deltas):
+        foods = FoodItem.objects.in_bulk(list(deltas))
+        with write_atomic():
+            order, _ = Order.objects.get_or_create(
+                user=user, status='PENDING', defaults={'total_price': 0}
+            )
+            # Write to the order first so concurrent batches on the same cart
+            # queue up here instead of reading stale quantities
+            Order.objects.filter(pk=order.pk).update(updated_at=timezone.now())
+            current = dict(
+                order.items.filter(food_id__in=list(foods)).values_list('food_id', 'quantity')
+            )
+
+            upserts, emptied = [], []
+            for food_id, delta in deltas.items():
+                if food_id not in foods:
+                    continue
+                quantity = current.get(food_id, 0) + delta
+                if quantity > 0:
+                    upserts.append(OrderItem(order=order, food_id=food_id,
+                                             quantity=quantity, price=foods[food_id].price))
+                elif food_id in current:
+                    emptied.append(food_id)
+
+            # One INSERT ... ON CONFLICT for every surviving line; existing
+            # lines keep the price they were added at
+            OrderItem.objects.bulk_create(
+                upserts,
+                update_conflicts=True,
+                unique_fields=['order', 'food'],
+                update_fields=['quantity'],
+            )
+            if emptied:
+                OrderItem.objects.filter(order=order, food_id__in=emptied).delete()
+            # Bulk writes skip the per-item total deltas
+            order.recalculate_total()
+
+        return Cart(list(order.items.select_related('food')), order)
+
+    def persist(self, user):
+        return self._pending(user).first()
+
+    async def aget(self, user):
+        order = await self._pending(user).afirst()
+        lines = [item async for item in order.items.select_related('food')] if order else []
+        return Cart(lines, order)
+
+    # Changes have no async versions of their own: BaseCartStore runs the
+    # methods above in a thread, inside their write transaction and retry
+
+    async def apersist(self, user):
+        return await self._pending(user).afirst()
+
+    async def aclear(self, user):
+        pass
+
+
+# ----------------------------
+# Write-behind cache store
+# ----------------------------
+class CacheCartStore(BaseCartStore):
+    """
+    Per-user cart state in the cache::
+
+        {'items': {food_id: [quantity, 'price']}, 'rev': int, 'dirty': bool}
+
+    ``rev`` counts changes; ``dirty`` means the DB copy is behind.  Users
+    with dirty carts are listed under ``DIRTY_KEY`` for ``flush()``.
+    """
+    DIRTY_KEY = 'cart:dirty'
+    LOCK_TTL = 5  # seconds before a held lock is presumed abandoned
+
+    def __init__(self, alias=None, flush_interval=None):
+        self.cache = caches[alias or getattr(settings, 'CART_CACHE_ALIAS', 'default')]
+        if flush_interval is None:
+            flush_interval = getattr(settings, 'CART_FLUSH_INTERVAL', 60)
+        self.flush_interval = flush_interval
+        self._flusher = None
+        self._flusher_lock = threading.Lock()
+
+    @staticmethod
+    def _key(user_id):
+        return f'cart:{user_id}'
+
+    @contextmanager
+    def _locked(self, name):
+        key = f'cart:lock:{name}'
+        deadline = time.monotonic() + self.LOCK_TTL
+        while not self.cache.add(key, 1, timeout=self.LOCK_TTL):
+            if time.monotonic() > deadline:
+                # Holder died without releasing; take the lock over
+                self.cache.set(key, 1, timeout=self.LOCK_TTL)
+                break
+            time.sleep(0.002)
+        try:
+            yield
+        finally:
+            self.cache.delete(key)
+
+    def _state(self, user_id):
+        """
+        Cached state, read through to the flushed PENDING order on a miss.
+        """
+        state = self.cache.get(self._key(user_id))
+        if state is None:
+            rows = OrderItem.objects.filter(
+                order__user_id=user_id, order__status='PENDING', food__isnull=False
+            ).values_list('food_id', 'quantity', 'price')
+            state = {
+                'items': {food_id: [quantity, str(price)] for food_id, quantity, price in rows},
+                'rev': 0,
+                'dirty': False,
+            }
+        return state
+
+    def _mutate(self, user_id, change):
+        with self._locked(user_id):
+            state = self._state(user_id)
+            result = change(state['items'])
+            was_dirty = state['dirty']
+            state['rev'] += 1
+            state['dirty'] = True
+            self.cache.set(self._key(user_id), state, timeout=None)
+            if not was_dirty:
+                # Listed under the user's lock, which a flush also holds
+                # while it unlists, so the two can't interleave
+                self._set_listed(user_id, True)
+        self._start_flusher()
+        return result
+
+    def _set_listed(self, user_id, listed):
+        # Lock order: the user's lock, then 'dirty'
+        with self._locked('dirty'):
+            dirty = self.cache.get(self.DIRTY_KEY) or set()
+            if listed:
+                dirty.add(user_id)
+            else:
+                dirty.discard(user_id)
+            self.cache.set(self.DIRTY_KEY, dirty, timeout=None)
+
+    def _start_flusher(self):
+        # Periodic flushes run on a background thread, never inside a click
+        if not self.flush_interval or self._flusher is not None:
+            return
+        with self._flusher_lock:
+            if self._flusher is None:
+                self._flusher = threading.Thread(
+                    target=self._flush_periodically, name='cart-flusher', daemon=True)
+                self._flusher.start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                # Carts stay dirty and listed; the next run retries them
+                logger.exception("Periodic cart flush failed")
+            finally:
+                # This thread's own connection; don't hold it between runs
+                connections.close_all()
+
+    def get(self, user):
+        items = self._state(user.pk)['items']
+        foods = FoodItem.objects.in_bulk(list(items))
+        lines = [
+            CartLine(foods[food_id], quantity, Decimal(price))
+            for food_id, (quantity, price) in items.items()
+            if food_id in foods
+        ]
+        return Cart(lines)
+
+    def add(self, user, food):
+        def change(items):
+            line = items.setdefault(food.pk, [0, str(food.price)])
+            line[0] += 1
+        self._mutate(user.pk, change)
+
+    def change(self, user, food_id, delta):
+        def change(items):
+            line = items.get(food_id)
+            if line:
+                line[0] += delta
+                if line[0] <= 0:
+                    del items[food_id]
+        self._mutate(user.pk, change)
+
+    def remove(self, user, food_id):
+        return self._mutate(user.pk, lambda items: items.pop(food_id, None) is not None)
+
+    def apply(self, user, deltas):
+        foods = FoodItem.objects.in_bulk(list(deltas))
+
+        def change(items):
+            for food_id, delta in deltas.items():
+                if food_id not in foods:
+                    continue
+                line = items.setdefault(food_id, [0, str(foods[food_id].price)])
+                line[0] += delta
+                if line[0] <= 0:
+                    del items[food_id]
+        self._mutate(user.pk, change)
+        return self.get(user)
+
+    def persist(self, user):
+        return self._flush_user(user.pk)
+
+    def clear(self, user):
+        self.cache.delete(self._key(user.pk))
+
+    def flush(self):
+        with self._locked('dirty'):
+            dirty = self.cache.get(self.DIRTY_KEY) or set()
+        for user_id in dirty:
+            self._flush_user(user_id)
+        return len(dirty)
+
+    def _flush_user(self, user_id):
+        state = self.cache.get(self._key(user_id))
+        if state is None:
+            # Nothing live (lost or never changed): the DB copy is the cart
+            order = Order.objects.filter(user_id=user_id, status='PENDING').first()
+        else:
+            order = self._write_order(user_id, state['items'])
+
+        # Marked clean and unlisted in one hold of the user's lock: a change
+        # either lands before (and is seen here) or after (and relists)
+        with self._locked(user_id):
+            current = self.cache.get(self._key(user_id))
+            if current is not None:
+                if state is None or current['rev'] != state['rev']:
+                    return order  # changed mid-flush; stays listed for the next run
+                if current['dirty']:
+                    current['dirty'] = False
+                    self.cache.set(self._key(user_id), current, timeout=None)
+            self._set_listed(user_id, False)
+        return order
+
+    @staticmethod
+    @retry_on_lock
+    def _write_order(user_id, items):
+        """
+        Make the PENDING order's items match ``items`` exactly.
+        """
+        with write_atomic():
+            order = Order.objects.filter(user_id=user_id, status='PENDING').first()
+            if order is None:
+                if not items:
+                    return None
+                order = Order.objects.create(user_id=user_id)
+
+            # Foods deleted since they were added can't be written
+            live = set(FoodItem.objects.filter(pk__in=list(items)).values_list('id', flat=True))
+            wanted = {food_id: line for food_id, line in items.items() if food_id in live}
+            existing = {item.food_id: item for item in order.items.all()}
+
+            OrderItem.objects.filter(order=order).exclude(food_id__in=list(wanted)).delete()
+            new, changed = [], []
+            for food_id, (quantity, price) in wanted.items():
+                item = existing.get(food_id)
+                if item is None:
+                    new.append(OrderItem(order=order, food_id=food_id,
+                                         quantity=quantity, price=Decimal(price)))
+                elif item.quantity != quantity or item.price != Decimal(price):
+                    item.quantity = quantity
+                    item.price = Decimal(price)
+                    changed.append(item)
+            OrderItem.objects.bulk_create(new)
+            OrderItem.objects.bulk_update(changed, ['quantity', 'price'])
+
+            # Bulk writes skip the per-item total deltas
+            order.recalculate_total()
+        return order
+
+
+@lru_cache(maxsize=None)
+def _load_store(path):
+    return import_string(path)()
+
+
+def get_cart_store():
+    return _load_store(getattr(settings, 'CART_STORE', 'orders.cart.DBCartStore'))
+
+
+@receiver(setting_changed)
+def _reset_store(*, setting, **kwargs):
+    if setting in ('CART_STORE', 'CART_CACHE_ALIAS', 'CART_FLUSH_INTERVAL'):
+        _load_store.cache_clear()
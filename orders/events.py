@@ -0,0 +1,246 @@
+"""
+Order status updates, pushed to the customer as Server-Sent Events.
+
+When an order's status changes (``orders.signals``), the change is published
+after commit to ``hub``, an in-process pub/sub keyed by user.  Every open
+``order_events`` stream of that user gets it in its own mailbox, so one
+change fans out to all of them without a query per subscriber.  Streams run
+in the ASGI worker's event loop; publishers may be on any thread.
+
+The hub lives in one process, so it only speeds things up: the database is
+what every worker shares.  Events carry ids, the order's ``updated_at`` in
+microseconds.  A stream starts with a snapshot of the user's open orders and
+of those changed lately, or, when EventSource reconnects with
+``Last-Event-ID``, of every order changed since that id, finished ones
+included.  While a stream is idle it looks up the orders changed since its
+last id once per keepalive interval instead of just sending a comment, so a
+change saved by another worker (the kitchen, the admin) arrives within that
+interval.
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Order
+
+DEFAULT_KEEPALIVE = 15  # seconds between comment lines on an idle stream
+QUEUE_SIZE = 32  # events a slow stream may fall behind before it resyncs
+RETRY_MS = 3000  # EventSource reconnect delay
+OPEN_STATUSES = ('PREPARING', 'OUT')
+# A transaction may commit a little after the updated_at it stamped, so
+# lookups by id reach back this far; a status already sent isn't resent
+LOOKBACK_SECONDS = 5
+# Without Last-Event-ID: changes since the page was rendered, roughly
+RECENT_SECONDS = 60
+
+# What a stream that fell too far behind gets instead of its events: a snapshot
+RESYNC = object()
+
+
+class Subscription:
+    """
+    One stream's mailbox: events wait in ``pending`` until the stream takes
+    them all at once.  A future and a list, rather than an ``asyncio.Queue``
+    (four deques and an Event), as most of these sit idle by the thousand.
+    """
+    __slots__ = ('user_id', 'loop', 'pending', 'waiter')
+
+    def __init__(self, user_id, loop):
+        self.user_id = user_id
+        self.loop = loop
+        self.pending = []
+        self.waiter = None
+
+    def deliver(self, event):
+        # Runs in the subscriber's loop
+        if self.pending is RESYNC:
+            pass
+        elif len(self.pending) >= QUEUE_SIZE:
+            self.pending = RESYNC
+        else:
+            self.pending.append(event)
+        self._wake()
+
+    def _wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    async def take(self, timeout):
+        """
+        Wait up to ``timeout`` seconds for events, and return them all: a
+        list, empty if none came, or RESYNC.
+        """
+        if not self.pending:
+            self.waiter = self.loop.create_future()
+            timer = self.loop.call_later(timeout, self._wake)
+            try:
+                await self.waiter
+            finally:
+                timer.cancel()
+                self.waiter = None
+        pending, self.pending = self.pending, []
+        return pending
+
+
+def _deliver(subscriptions, event):
+    for subscription in subscriptions:
+        subscription.deliver(event)
+
+
+class OrderEventHub:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+
+    def subscribe(self, user_id):
+        """
+        Register a subscriber for ``user_id``'s events; call from the event
+        loop that will ``take()`` them.
+        """
+        subscription = Subscription(user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+
+    def publish(self, user_id, event):
+        """
+        Hand ``event`` to every subscriber of ``user_id``.  Thread-safe and
+        non-blocking; returns how many subscribers it went to.
+        """
+        with self._lock:
+            subscribers = tuple(self._subscribers.get(user_id, ()))
+        # One wake-up per event loop (a worker has one), not per subscriber
+        by_loop = defaultdict(list)
+        for subscription in subscribers:
+            by_loop[subscription.loop].append(subscription)
+        for loop, group in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver, group, event)
+            except RuntimeError:  # the loop has closed
+                for subscription in group:
+                    self.unsubscribe(subscription)
+        return len(subscribers)
+
+    def count(self, user_id=None):
+        with self._lock:
+            if user_id is not None:
+                return len(self._subscribers.get(user_id, ()))
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+hub = OrderEventHub()
+
+
+def status_event(order):
+    return {
+        'id': order.id, 'order_number': order.order_number, 'status': order.status,
+        'updated_at': order.updated_at.isoformat(),
+    }
+
+
+def event_id(updated_at):
+    return str(int(updated_at.timestamp() * 1_000_000))
+
+
+def parse_event_id(value):
+    """``Last-Event-ID`` back to an aware datetime; None if it isn't one of ours."""
+    try:
+        return datetime.fromtimestamp(int(value) / 1_000_000, dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+
+
+def _format(data, cursor, name='status'):
+    return f"id: {event_id(cursor)}\nevent: {name}\ndata: {json.dumps(data)}\n\n"
+
+
+def _orders(user_id, changed_since, with_open=False):
+    since = Q(updated_at__gt=changed_since - timedelta(seconds=LOOKBACK_SECONDS))
+    if with_open:
+        since |= Q(status__in=OPEN_STATUSES)
+    return (Order.objects.filter(since, user_id=user_id).exclude(status='PENDING')
+            .only('id', 'order_number', 'status', 'updated_at').order_by('updated_at', 'id'))
+
+
+async def _snapshot(user_id, since):
+    return [status_event(order) async for order in _orders(user_id, since, with_open=True)]
+
+
+async def _changed(user_id, since):
+    return [status_event(order) async for order in _orders(user_id, since)]
+
+
+class _Position:
+    """
+    What one stream has sent: each order's last status, and how far its
+    lookups have got, which is the id of its latest event.
+    """
+    __slots__ = ('sent', 'cursor')
+
+    def __init__(self, cursor):
+        self.sent = {}
+        self.cursor = cursor
+
+    def advance(self, events, looked_up_at=None):
+        """The events not sent yet, noting them as sent."""
+        fresh = []
+        for event in events:
+            self.cursor = max(self.cursor, datetime.fromisoformat(event['updated_at']))
+            if self.sent.get(event['id']) != event['status']:
+                self.sent[event['id']] = event['status']
+                fresh.append(event)
+        if looked_up_at is not None:
+            self.cursor = max(self.cursor, looked_up_at)
+        return fresh
+
+
+async def stream(user_id, keepalive=None, last_event_id=None):
+    """
+    The SSE body for one subscriber: a snapshot (see the module docstring),
+    then each status change as it is published or found by the idle-time
+    lookup, with a comment line when there is nothing, every ``keepalive``
+    seconds, so proxies keep an idle connection open.
+    """
+    if keepalive is None:
+        keepalive = getattr(settings, 'ORDER_EVENTS_KEEPALIVE', DEFAULT_KEEPALIVE)
+    since = parse_event_id(last_event_id) or timezone.now() - timedelta(seconds=RECENT_SECONDS)
+    position = _Position(since)
+    # Subscribe before the snapshot query, so no change falls in between
+    subscription = hub.subscribe(user_id)
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        batch = RESYNC
+        while True:
+            if batch is RESYNC:
+                looked_up_at = timezone.now()
+                snapshot = await _snapshot(user_id, position.cursor)
+                position.advance(snapshot, looked_up_at)
+                yield _format(snapshot, position.cursor, 'snapshot')
+            else:
+                looked_up_at = None
+                if not batch:
+                    # Idle: pick up changes saved in other workers
+                    looked_up_at = timezone.now()
+                    batch = await _changed(user_id, position.cursor)
+                fresh = position.advance(batch, looked_up_at)
+                if fresh:
+                    yield ''.join(_format(event, position.cursor) for event in fresh)
+                else:
+                    yield ": keepalive\n\n"
+            batch = await subscription.take(keepalive)
+    finally:
+        hub.unsubscribe(subscription)
@@ -0,0 +1,136 @@
+"""
+The kitchen dispatch queue: a restaurant's open orders, oldest first, and
+batched status transitions for them.
+
+Only orders whose every line is from the restaurant are its kitchen's to
+dispatch.  An order mixing restaurants is in no kitchen's queue, and no
+kitchen can move it on: one restaurant marking it OUT would send it while
+another's lines weren't ready.  Staff move those on from the admin.
+
+``queue()`` loads a page of the restaurant's orders and their items in a
+fixed number of queries, however many orders there are.  ``advance()``
+moves a batch of orders on in one transaction: one locked read, then one
+conditional UPDATE, rather than an ``Order.save()`` each.  No order-number
+check, no total bookkeeping, and an order that moved on meanwhile
+(cancelled by the customer, say) is skipped instead of overwritten.  The
+UPDATE bypasses post_save, so the status events for open order pages are
+published here.
+"""
+import json
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Prefetch, prefetch_related_objects
+from django.utils import timezone
+
+from main.pagination import MergedKeysetPaginator
+from main.sqlite import retry_on_lock, write_atomic
+from . import events
+from .models import Order, OrderItem
+
+OPEN_STATUSES = ('PREPARING', 'OUT')
+# The moves a kitchen can make, from each open status
+TRANSITIONS = {
+    'PREPARING': ('OUT', 'CANCELLED'),
+    'OUT': ('DELIVERED',),
+}
+QUEUE_ORDERING = ('created_at', 'id')
+QUEUE_PER_PAGE = 100
+MAX_BATCH_ORDERS = 500
+
+
+def _only_items_from(restaurant_id):
+    # A kitchen only dispatches orders it cooks whole: one with lines from
+    # another restaurant can't go OUT on this kitchen's say-so.  Lines whose
+    # food was deleted belong to no one and don't count either way
+    lines = OrderItem.objects.filter(order=OuterRef('pk'), food__isnull=False)
+    return (Exists(lines.filter(food__restaurant_id=restaurant_id))
+            & ~Exists(lines.exclude(food__restaurant_id=restaurant_id)))
+
+
+def queue(restaurant_id, statuses=OPEN_STATUSES, cursor=None, per_page=QUEUE_PER_PAGE):
+    """
+    A page of the restaurant's orders in ``statuses``, oldest first, each
+    with ``kitchen_items``: its lines, foods loaded.
+    One query per status, each reading the order_status_created index in
+    order, and one for all the items.
+    """
+    page = MergedKeysetPaginator([
+        Order.objects.filter(_only_items_from(restaurant_id), status=status) for status in statuses
+    ], QUEUE_ORDERING, per_page).get_page(cursor)
+    items = (OrderItem.objects.filter(food__restaurant_id=restaurant_id)
+             .select_related('food').order_by('id'))
+    prefetch_related_objects(page.object_list, Prefetch('items', queryset=items, to_attr='kitchen_items'))
+    return page
+
+
+def as_json(order):
+    return {
+        'id': order.id,
+        'order_number': order.order_number,
+        'status': order.status,
+        'created_at': order.created_at.isoformat(),
+        'customer_name': order.customer_name,
+        'items': [
+            {'food_id': item.food_id, 'name': item.food_name, 'quantity': item.quantity}
+            for item in order.kitchen_items
+        ],
+    }
+
+
+def check_transition(from_status, to_status):
+    if to_status not in TRANSITIONS.get(from_status, ()):
+        raise ValueError(f"orders can't move from {from_status} to {to_status}")
+
+
+def parse_transition(body):
+    """
+    ``{"order_ids": [1, 2], "from": "PREPARING", "to": "OUT"}`` JSON ->
+    ``([1, 2], 'PREPARING', 'OUT')``.  Raises ``ValueError`` on anything else.
+    """
+    data = json.loads(body)
+    if not isinstance(data, dict):
+        raise ValueError("expected an object")
+    order_ids = data.get('order_ids')
+    if not isinstance(order_ids, list) or len(order_ids) > MAX_BATCH_ORDERS:
+        raise ValueError(f"order_ids must be a list of at most {MAX_BATCH_ORDERS} ids")
+    # type() rather than isinstance() so booleans are rejected
+    if any(type(order_id) is not int for order_id in order_ids):
+        raise ValueError("order_ids must be integers")
+    check_transition(data.get('from'), data.get('to'))
+    return order_ids, data['from'], data['to']
+
+
+def _publish(rows, status, updated_at):
+    for row in rows:
+        events.hub.publish(row['user_id'], {
+            'id': row['id'], 'order_number': row['order_number'], 'status': status,
+            'updated_at': updated_at.isoformat(),
+        })
+
+
+@retry_on_lock
+@write_atomic
+def advance(restaurant_id, order_ids, from_status, to_status):
+    """
+    Move those of ``order_ids`` that are this restaurant's alone and still
+    in ``from_status`` to ``to_status``, in one transaction.  Returns the ids
+    moved, in id order; the rest are left as they were.
+    """
+    check_transition(from_status, to_status)
+    # Rows are read locked (the write lock is already held on SQLite;
+    # select_for_update for other backends), so the status checked here is
+    # the one the UPDATE overwrites.  Checked here rather than in the WHERE:
+    # without table statistics SQLite would walk the order_status_created
+    # index for the status instead of looking up the ids.
+    rows = [
+        row for row in Order.objects.select_for_update()
+        .filter(_only_items_from(restaurant_id), pk__in=order_ids)
+        .order_by('id').values('id', 'user_id', 'order_number', 'status')
+        if row['status'] == from_status
+    ]
+    ids = [row['id'] for row in rows]
+    now = timezone.now()
+    Order.objects.filter(pk__in=ids).update(status=to_status, updated_at=now)
+    transaction.on_commit(partial(_publish, rows, to_status, now))
+    return ids
@@ -0,0 +1,85 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from orders import archive
+
+
+def _mb(size):
+    return f"{size / 1024 / 1024:,.1f} MB" if size is not None else "n/a"
+
+
+class Command(BaseCommand):
+    help = (
+        "Move finished (delivered/cancelled/completed) orders older than --days, with their "
+        "items, into the archive tables, one batch per transaction"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help="Archive orders created more than this many days ago "
+                                 "(default: settings.ORDER_ARCHIVE_AFTER_DAYS)")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Orders moved per transaction")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Count what would be archived without moving anything")
+        parser.add_argument('--vacuum', action='store_true',
+                            help="VACUUM afterwards (SQLite) so the hot indexes are rebuilt compactly")
+
+    def handle(self, *args, **options):
+        before = archive.cutoff(options['days'])
+        dry_run = options['dry_run']
+        self.stdout.write(f"Archiving {', '.join(archive.FINAL_STATUSES)} orders created before "
+                          f"{before:%Y-%m-%d %H:%M}")
+        report_before = archive.table_report()
+
+        orders = items = batches = 0
+        started = last_report = time.perf_counter()
+        key = None
+        while True:
+            batch = archive.candidates(before, key, options['batch_size'])
+            if not batch:
+                break
+            key = (batch[-1].created_at, batch[-1].pk)
+            ids = [order.pk for order in batch]
+            if dry_run:
+                orders += len(ids)
+            else:
+                moved, moved_items = archive.archive_batch(ids)
+                orders += moved
+                items += moved_items
+            batches += 1
+
+            now = time.perf_counter()
+            if now - last_report >= 5:
+                last_report = now
+                self.stderr.write(f"... {orders} orders, {orders / (now - started):,.0f} orders/sec")
+
+        elapsed = time.perf_counter() - started
+        if options['vacuum'] and not dry_run and connection.vendor == 'sqlite':
+            vacuum_started = time.perf_counter()
+            with connection.cursor() as cursor:
+                cursor.execute('VACUUM')
+            self.stdout.write(f"VACUUM took {time.perf_counter() - vacuum_started:.1f}s")
+
+        self.stdout.write("\n----- SUMMARY -----" + (" (dry run, nothing moved)" if dry_run else ""))
+        self.stdout.write(f"Orders archived: {orders}")
+        self.stdout.write(f"Items archived: {items}")
+        self.stdout.write(f"Batches: {batches}")
+        self.stdout.write(f"Elapsed: {elapsed:.2f}s ({orders / max(elapsed, 1e-9):,.0f} orders/sec)")
+        if not dry_run:
+            self._print_report(report_before, archive.table_report())
+        self.stdout.write("-------------------")
+
+    def _print_report(self, before, after):
+        for table, old in before.items():
+            new = after[table]
+            self.stdout.write(f"{table}: {old['rows']:,} -> {new['rows']:,} rows, "
+                              f"table {_mb(old['table_bytes'])} -> {_mb(new['table_bytes'])}")
+            for index, size in old['index_bytes'].items():
+                self.stdout.write(f"  {index}: {_mb(size)} -> {_mb(new['index_bytes'].get(index))}")
+            if old['table_bytes'] is not None:
+                total_old = old['table_bytes'] + sum(old['index_bytes'].values())
+                total_new = new['table_bytes'] + sum(new['index_bytes'].values())
+                self.stdout.write(f"  total: {_mb(total_old)} -> {_mb(total_new)} "
+                                  f"({1 - total_new / max(total_old, 1):.0%} smaller)")
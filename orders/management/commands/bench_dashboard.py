@@ -0,0 +1,163 @@
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from main import routing
+from orders import rollups
+from orders.models import DailySales, Order, OrderItem
+
+
+def _adhoc(days, top, today):
+    # The dashboard's numbers aggregated straight from the order tables, as
+    # a report without the rollups would
+    end = today
+    start = end - timedelta(days=days - 1)
+    lo, _ = rollups._day_bounds(start)
+    _, hi = rollups._day_bounds(end)
+    items = OrderItem.objects.filter(order__created_at__gte=lo, order__created_at__lt=hi,
+                                     order__status__in=rollups.COUNTED_STATUSES)
+    revenue = Sum(F('price') * F('quantity'), output_field=rollups.MONEY)
+    daily = list(items.annotate(day=TruncDate('order__created_at')).values('day')
+                 .annotate(revenue=revenue).order_by('day'))
+    restaurants = list(items.values('food__restaurant_id').annotate(revenue=revenue)
+                       .order_by('-revenue')[:top])
+    foods = list(items.values('food_id').annotate(units=Sum('quantity'), revenue=revenue)
+                 .order_by('-units')[:top])
+    return daily, restaurants, foods
+
+
+def double_history(step):
+    # Copy every placed order and its items a few minutes later, so each
+    # day has twice the orders
+    orders, items = Order._meta.db_table, OrderItem._meta.db_table
+    order_columns = [f.column for f in Order._meta.concrete_fields if f.column != 'id']
+    item_columns = [f.column for f in OrderItem._meta.concrete_fields if f.column != 'id']
+    copied = {
+        'created_at': f"datetime(created_at, '+{step} minutes')",
+        'updated_at': '%s',
+        'order_number': 'NULL',
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT MAX(id) FROM {orders}')
+        order_offset = cursor.fetchone()[0]
+        cursor.execute(f'SELECT MAX(id) FROM {items}')
+        item_offset = cursor.fetchone()[0] or 0
+        cursor.execute(
+            f"INSERT INTO {orders} (id, {', '.join(order_columns)}) "
+            f"SELECT id + {order_offset}, "
+            f"{', '.join(copied.get(column, column) for column in order_columns)} "
+            f"FROM {orders} WHERE status != 'PENDING'",
+            [timezone.now()],
+        )
+        cursor.execute(
+            f"INSERT INTO {items} (id, {', '.join(item_columns)}) "
+            f"SELECT i.id + {item_offset}, "
+            f"{', '.join('i.order_id + %d' % order_offset if c == 'order_id' else 'i.' + c for c in item_columns)} "
+            f"FROM {items} i JOIN {orders} o ON o.id = i.order_id "
+            f"WHERE o.id <= {order_offset} AND o.status != 'PENDING'"
+        )
+
+
+def _median_time(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples), result
+
+
+class Command(BaseCommand):
+    help = (
+        "Sales dashboard benchmark on a copy of the database: doubles the order history "
+        "a few times and times the rollup-backed dashboard against ad-hoc aggregates over "
+        "the order tables, and the incremental rollup refresh"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doublings', type=int, default=3)
+        parser.add_argument('--days', type=int, default=30, help="Dashboard window")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per measurement (median)")
+        parser.add_argument('--changes', type=int, default=100,
+                            help="Orders changed before each incremental refresh")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("bench_dashboard works on a copy of the SQLite database; this "
+                               f"database is {connection.vendor}")
+        latest = Order.objects.exclude(status='PENDING').order_by('-created_at').first()
+        if latest is None:
+            raise CommandError("No orders in the database; run seed_data first.")
+        today = timezone.localtime(latest.created_at).date()
+
+        tmp = tempfile.mkdtemp(prefix='bench_dashboard_')
+        path = os.path.join(tmp, 'db.sqlite3')
+        routing.replicate(settings.DATABASES['default']['NAME'], path)
+        connection.close()
+        original = connection.settings_dict['NAME']
+        connection.settings_dict['NAME'] = path
+        try:
+            results = self._run(today, options)
+        finally:
+            connection.close()
+            connection.settings_dict['NAME'] = original
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self.stdout.write("\n----- SUMMARY -----")
+        self.stdout.write(f"Window: {options['days']} days to {today}")
+        self.stdout.write(f"{'orders':>10} {'items':>10} {'rollup rows':>12} {'ad-hoc':>10} "
+                          f"{'dashboard':>10} {'speedup':>8} {'refresh':>9} {'full':>9}")
+        for row in results:
+            self.stdout.write(
+                f"{row['orders']:>10,} {row['items']:>10,} {row['rows']:>12,} "
+                f"{row['adhoc'] * 1e3:>8.1f}ms {row['dashboard'] * 1e3:>8.1f}ms "
+                f"{row['adhoc'] / row['dashboard']:>7.1f}x "
+                f"{row['refresh']:>8.2f}s {row['full']:>8.2f}s"
+            )
+        self.stdout.write("refresh: incremental run after changing "
+                          f"{options['changes']} orders; full: the rebuild after the doubling")
+        self.stdout.write("-------------------")
+
+    def _run(self, today, options):
+        days, repeat = options['days'], options['repeat']
+        results = []
+        for step in range(options['doublings'] + 1):
+            if step:
+                double_history(step)
+            started = time.perf_counter()
+            rollups.refresh(lag=0)  # every copied order is new: all their days
+            full = time.perf_counter() - started
+
+            adhoc, (daily, restaurants, _) = _median_time(lambda: _adhoc(days, 10, today), repeat)
+            dashboard, report = _median_time(lambda: rollups.dashboard(days, 10, today), repeat)
+            expected = round(float(sum(row['revenue'] for row in daily)), 2)
+            if abs(expected - report['total_revenue']) > 0.01:
+                raise CommandError(f"Rollups disagree with the order tables: "
+                                   f"{report['total_revenue']} != {expected}")
+
+            changed = list(Order.objects.filter(status='PREPARING')
+                           .values_list('id', flat=True)[:options['changes']])
+            Order.objects.filter(pk__in=changed).update(status='DELIVERED', updated_at=timezone.now())
+            started = time.perf_counter()
+            rollups.refresh(lag=0)
+            refresh = time.perf_counter() - started
+
+            row = {
+                'orders': Order.objects.count(), 'items': OrderItem.objects.count(),
+                'rows': DailySales.objects.count(), 'adhoc': adhoc, 'dashboard': dashboard,
+                'refresh': refresh, 'full': full,
+            }
+            results.append(row)
+            self.stderr.write(f"... {row['orders']:,} orders: ad-hoc {adhoc * 1e3:.1f} ms, "
+                              f"dashboard {dashboard * 1e3:.1f} ms")
+        return results
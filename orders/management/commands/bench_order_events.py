@@ -0,0 +1,131 @@
+import asyncio
+import gc
+import statistics
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from orders import events
+
+
+async def _consume(stream, received):
+    # One idle SSE connection: what the ASGI handler keeps per client
+    async for _ in stream:
+        received[0] += 1
+
+
+async def _wait_for(received, target, timeout=30):
+    deadline = time.perf_counter() + timeout
+    while received[0] < target:
+        if time.perf_counter() > deadline:
+            raise CommandError(f"Only {received[0]} of {target} events arrived within {timeout}s")
+        await asyncio.sleep(0)
+
+
+class Command(BaseCommand):
+    help = (
+        "Memory and fan-out benchmark for the order status SSE hub: thousands of idle "
+        "subscribers, then status changes published to them"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=5000)
+        parser.add_argument('--users', type=int, default=1000,
+                            help="Distinct users the subscribers are spread over")
+        parser.add_argument('--rounds', type=int, default=20, help="Publishes per measurement")
+
+    def handle(self, *args, **options):
+        user_ids = list(User.objects.order_by('id').values_list('id', flat=True)[:options['users']])
+        if not user_ids:
+            raise CommandError("No users in the database; run seed_data first.")
+        polling = self._polling_cost(user_ids[0])
+        connection.close()  # the async side opens its own
+        results = asyncio.run(self._run(user_ids, options['subscribers'], options['rounds']))
+
+        subscribers = options['subscribers']
+        self.stdout.write("\n----- SUMMARY -----")
+        self.stdout.write(f"Subscribers: {subscribers} over {len(user_ids)} users")
+        self.stdout.write(f"Connect (retry + snapshot query): {results['connect']:.2f}s "
+                          f"({results['connect'] / subscribers * 1e3:.2f} ms each)")
+        self.stdout.write(f"Memory: {results['memory'] / 1024 / 1024:.1f} MB traced, "
+                          f"{results['memory'] / subscribers / 1024:.2f} KB per idle subscriber")
+        self.stdout.write(f"One user's change to {results['per_user']} streams: "
+                          f"publish {results['publish_one'] * 1e6:.0f} µs, "
+                          f"all delivered {results['deliver_one'] * 1e3:.2f} ms (median)")
+        self.stdout.write(f"A change for every user ({subscribers} streams): "
+                          f"publish {results['publish_all'] * 1e3:.1f} ms, "
+                          f"all delivered {results['deliver_all'] * 1e3:.1f} ms (median)")
+        self.stdout.write(f"Queries per status change: 0 (a my_orders refresh: {polling[0]} queries, "
+                          f"{polling[1] * 1e3:.1f} ms)")
+        self.stdout.write(f"Subscribers left after disconnect: {results['left']}")
+        self.stdout.write("-------------------")
+
+    @staticmethod
+    def _polling_cost(user_id):
+        # What each refresh of My Orders costs, for comparison
+        client = Client()
+        client.force_login(User.objects.get(pk=user_id))
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            client.get(reverse('my_orders'))
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                client.get(reverse('my_orders'))
+                elapsed = time.perf_counter() - started
+        return len(queries), elapsed
+
+    async def _run(self, user_ids, subscribers, rounds):
+        received = [0]
+        gc.collect()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+
+        started = time.perf_counter()
+        tasks = [
+            asyncio.create_task(_consume(events.stream(user_ids[n % len(user_ids)], keepalive=3600), received))
+            for n in range(subscribers)
+        ]
+        await _wait_for(received, 2 * subscribers, timeout=600)  # retry line + snapshot each
+        connect = time.perf_counter() - started
+        gc.collect()
+        memory = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+
+        per_user = events.hub.count(user_ids[0])
+        publish_one, deliver_one, publish_all, deliver_all = [], [], [], []
+        event = {'id': 0, 'order_number': 0, 'status': 'OUT'}
+        for _ in range(rounds):
+            target = received[0] + per_user
+            started = time.perf_counter()
+            events.hub.publish(user_ids[0], event)
+            publish_one.append(time.perf_counter() - started)
+            await _wait_for(received, target)
+            deliver_one.append(time.perf_counter() - started)
+
+            target = received[0] + subscribers
+            started = time.perf_counter()
+            for user_id in user_ids:
+                events.hub.publish(user_id, event)
+            publish_all.append(time.perf_counter() - started)
+            await _wait_for(received, target)
+            deliver_all.append(time.perf_counter() - started)
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        return {
+            'connect': connect,
+            'memory': memory,
+            'per_user': per_user,
+            'publish_one': statistics.median(publish_one),
+            'deliver_one': statistics.median(deliver_one),
+            'publish_all': statistics.median(publish_all),
+            'deliver_all': statistics.median(deliver_all),
+            'left': events.hub.count(),
+        }
@@ -0,0 +1,56 @@
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from orders.models import Order, OrderItem
+
+
+class Command(BaseCommand):
+    help = "Verify stored Order.total_price values against their items in bulk"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help="Rewrite mismatched totals with the item sum")
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help="Rows fetched and updated per batch")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        money = models.DecimalField(max_digits=10, decimal_places=2)
+
+        # One correlated aggregate per order, evaluated by the database
+        item_total = (
+            OrderItem.objects.filter(order=OuterRef('pk'))
+            .values('order')
+            .annotate(total=Sum(F('price') * F('quantity'), output_field=money))
+            .values('total')
+        )
+        rows = (
+            Order.objects.order_by()
+            .annotate(item_total=Coalesce(Subquery(item_total), Decimal('0'), output_field=money))
+            .values_list('id', 'order_number', 'total_price', 'item_total')
+        )
+
+        checked = 0
+        mismatched = []
+        for order_id, number, stored, expected in rows.iterator(chunk_size=batch_size):
+            checked += 1
+            if stored != expected:
+                mismatched.append(Order(id=order_id, total_price=expected))
+                self.stdout.write(self.style.WARNING(
+                    f"⚠ Order #{number or order_id}: stored {stored}, items sum to {expected}"
+                ))
+
+        if options['fix'] and mismatched:
+            with transaction.atomic():
+                Order.objects.bulk_update(mismatched, ['total_price'], batch_size=batch_size)
+
+        self.stdout.write("\n----- SUMMARY -----")
+        self.stdout.write(f"Checked: {checked}")
+        self.stdout.write(f"Mismatched: {len(mismatched)}")
+        if options['fix']:
+            self.stdout.write(f"Fixed: {len(mismatched)}")
+        self.stdout.write("-------------------")
@@ -0,0 +1,16 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.cart import get_cart_store
+
+
+class Command(BaseCommand):
+    help = "Write carts held by a write-behind cart store (CacheCartStore) to the database"
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        flushed = get_cart_store().flush()
+        self.stdout.write(self.style.SUCCESS(
+            f"Flushed {flushed} cart(s) in {(time.perf_counter() - started) * 1000:.1f} ms."
+        ))
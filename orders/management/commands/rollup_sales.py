@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders import rollups
+from orders.models import DailySales
+
+
+class Command(BaseCommand):
+    help = (
+        "Bring the daily sales rollups up to date: recompute the days with orders changed "
+        "since the last run (all days on the first run, or with --full)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Rebuild every day from scratch")
+        parser.add_argument('--lag', type=int,
+                            help="Leave changes younger than this many seconds for the next run "
+                                 "(default: settings.SALES_ROLLUP_LAG_SECONDS)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        days, rows, watermark = rollups.refresh(full=options['full'], lag=options['lag'])
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write("\n----- SUMMARY -----")
+        if days:
+            self.stdout.write(f"Days rebuilt: {len(days)} ({days[0]} .. {days[-1]})")
+        else:
+            self.stdout.write("Days rebuilt: 0")
+        self.stdout.write(f"Rows written: {rows} ({DailySales.objects.count()} in total)")
+        self.stdout.write(f"Elapsed: {elapsed:.2f}s")
+        self.stdout.write(f"Watermark: {watermark:%Y-%m-%d %H:%M:%S}")
+        self.stdout.write("-------------------")
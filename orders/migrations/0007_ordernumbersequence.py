@@ -0,0 +1,30 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:37
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_sequence(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderNumberSequence = apps.get_model('orders', 'OrderNumberSequence')
+    db = schema_editor.connection.alias
+    last = Order.objects.using(db).aggregate(last=Max('order_number'))['last'] or 0
+    OrderNumberSequence.objects.using(db).create(pk=1, value=last)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_alter_order_order_number'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(seed_sequence, migrations.RunPython.noop),
+    ]
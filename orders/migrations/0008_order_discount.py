@@ -0,0 +1,25 @@
+# Generated by Django 5.2.8 on 2026-10-18 15:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_offer_pricing_fields'),
+        ('orders', '0007_ordernumbersequence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='applied_offer',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='main.offer'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='discount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_fooditem_listing_indexes'),
+        ('orders', '0010_order_archive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='order_status_created'),
+        ),
+    ]
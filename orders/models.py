@@ -1,6 +1,71 @@
-from django.db import models, transaction
+from decimal import Decimal
+
+from django.db import connections, models, router
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
-from main.models import FoodItem
+from django.utils import timezone
+from main.models import FoodItem, Offer
+from restaurants.models import Restaurant
+from main.sqlite import write_atomic
+
+
+class OrderNumberSequence(models.Model):
+    """
+    Single-row counter holding the last order number handed out.
+    """
+    value = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Last order number: {self.value}"
+
+
+def _can_update_returning(connection):
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35, 0)
+    return False
+
+
+def allocate_order_number(using='default', count=1):
+    """
+    Reserve the next order number with one UPDATE on the counter row.
+    With ``count`` > 1 reserves a block and returns its last number.
+
+    Must run inside the transaction that inserts the order: the UPDATE holds
+    the counter's row lock until commit, and a rollback hands the number back,
+    so numbers stay gapless without scanning the orders table.
+    """
+    connection = connections[using]
+    table = connection.ops.quote_name(OrderNumberSequence._meta.db_table)
+
+    with connection.cursor() as cursor:
+        if _can_update_returning(connection):
+            cursor.execute(
+                f"UPDATE {table} SET value = value + %s WHERE id = 1 RETURNING value", [count]
+            )
+            row = cursor.fetchone()
+        else:
+            cursor.execute(f"UPDATE {table} SET value = value + %s WHERE id = 1", [count])
+            row = None
+            if cursor.rowcount:
+                cursor.execute(f"SELECT value FROM {table} WHERE id = 1")
+                row = cursor.fetchone()
+
+    if row is not None:
+        return row[0]
+
+    # Counter row missing (fresh or flushed database): seed it from the
+    # highest number already issued, then allocate again.
+    last_number = (
+        Order.objects.using(using)
+        .aggregate(last=models.Max('order_number'))['last'] or 0
+    )
+    OrderNumberSequence.objects.using(using).get_or_create(
+        pk=1, defaults={'value': last_number}
+    )
+    return allocate_order_number(using, count)
 
 
 class Order(models.Model):
@@ -27,36 +92,98 @@ class Order(models.Model):
     # Sequential order number (fixed)
     order_number = models.PositiveIntegerField(blank=True, null=True)
 
+    # Offer applied at checkout; total_price stays the item sum
+    applied_offer = models.ForeignKey(
+        Offer, on_delete=models.SET_NULL, null=True, blank=True, related_name='orders'
+    )
+    discount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # The user's PENDING order (the cart), on nearly every cart/order page
+            models.Index(fields=['user', 'status', '-created_at'], name='order_user_status_created'),
+            # My Orders history, keyset-paginated on (-created_at, -id)
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created'),
+            # Kitchen queues (open orders, oldest first) and archive_orders.
+            # Not partial: SQLite only uses a partial index when the query
+            # spells out the same literals, and Django binds them as params
+            models.Index(fields=['status', 'created_at', 'id'], name='order_status_created'),
+            # Orders changed since a job's watermark (orders/rollups.py)
+            models.Index(fields=['updated_at'], name='order_updated'),
+        ]
+
+    # Read side by side with ArchivedOrder in the order pages
+    is_archived = False
+    # Status as last read from / written to the database
+    _saved_status = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'status' in field_names:
+            instance._saved_status = instance.status
+        return instance
 
     def __str__(self):
         return f"Order #{self.order_number or self.id} - {self.user.username} ({self.status})"
 
     def save(self, *args, **kwargs):
         """
-        Assign perfect sequential order numbers and recalculate total.
+        Assign perfect sequential order numbers.
         No gaps, no duplicates, no old continuation.
+
+        total_price is maintained by OrderItem deltas, so a plain save() of an
+        existing order never writes it back (the in-memory value may be stale).
+        Pass update_fields=['total_price'] to overwrite it explicitly.
         """
-        # Assign order_number safely
-        if not self.order_number:
-            with transaction.atomic():  # Prevent race conditions
-                last_number = (
-                    Order.objects.select_for_update()
-                    .order_by('-order_number')
-                    .values_list('order_number', flat=True)
-                    .first()
-                )
-                self.order_number = 1 if last_number is None else last_number + 1
-
-        super().save(*args, **kwargs)
-
-        # Calculate total price based on items
-        new_total = sum(item.subtotal for item in self.items.all())
-
-        if self.total_price != new_total:
-            self.total_price = new_total
-            super().save(update_fields=['total_price'])
+        using = kwargs.get('using') or router.db_for_write(Order, instance=self)
+
+        if (not self._state.adding and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'total_price'
+            ]
+
+        # Number allocation and insert commit (or roll back) together; the
+        # write lock is taken up front as select_for_update can't on SQLite
+        with write_atomic(using=using):
+            if not self.order_number:
+                self.order_number = allocate_order_number(using)
+
+            super().save(*args, **kwargs)
+        self._saved_status = self.status
+
+    def adjust_total(self, delta, using=None):
+        """
+        Shift the stored total by ``delta`` with a single F() UPDATE.
+        """
+        if not delta:
+            return
+        Order.objects.using(using or self._state.db).filter(pk=self.pk).update(
+            total_price=F('total_price') + delta,
+            updated_at=timezone.now(),
+        )
+        self.total_price += delta
+
+    def recalculate_total(self):
+        """
+        Recompute the total from the items with one DB-side aggregate.
+        Used after bulk item writes that bypass OrderItem.save/delete.
+        """
+        self.total_price = self.items.aggregate(
+            total=Coalesce(
+                Sum(F('price') * F('quantity')), Decimal('0'),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
+            )
+        )['total']
+        super().save(update_fields=['total_price', 'updated_at'])
+        return self.total_price
+
+    @property
+    def amount_due(self):
+        return self.total_price - self.discount
 
     @property
     def can_cancel(self):
@@ -75,9 +202,131 @@ class OrderItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     price = models.DecimalField(max_digits=10, decimal_places=2)
 
+    # Subtotal as last read from / written to the database; None when the
+    # item was loaded without price or quantity and it has to be fetched
+    _saved_subtotal = Decimal('0')
+
     class Meta:
         unique_together = ['order', 'food']
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'price' in field_names and 'quantity' in field_names:
+            instance._saved_subtotal = instance.subtotal
+        else:
+            instance._saved_subtotal = None
+        return instance
+
+    def __str__(self):
+        if self.food:
+            return f"{self.quantity} × {self.food.name}"
+        return f"{self.quantity} × [Item Removed]"
+
+    @property
+    def subtotal(self):
+        return self.price * self.quantity
+
+    def save(self, *args, **kwargs):
+        """
+        Save the item and push the subtotal change onto the order total.
+        """
+        using = kwargs.get('using') or router.db_for_write(OrderItem, instance=self)
+        with write_atomic(using=using):
+            saved = self._stored_subtotal(using)
+            super().save(*args, **kwargs)
+            self._order_for_update(using).adjust_total(self.subtotal - saved, using)
+        self._saved_subtotal = self.subtotal
+
+    def delete(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(OrderItem, instance=self)
+        with write_atomic(using=using):
+            order = self._order_for_update(using)
+            saved = self._stored_subtotal(using)
+            result = super().delete(*args, **kwargs)
+            order.adjust_total(-saved, using)
+        self._saved_subtotal = Decimal('0')
+        return result
+
+    def _stored_subtotal(self, using):
+        if self._saved_subtotal is not None:
+            return self._saved_subtotal
+        # Read the row as stored: the loaded field may already be edited
+        stored = (
+            OrderItem.objects.using(using).filter(pk=self.pk)
+            .values_list('price', 'quantity').first()
+        )
+        return stored[0] * stored[1] if stored else Decimal('0')
+
+    def _order_for_update(self, using):
+        # Reuse a loaded order so its in-memory total follows along,
+        # otherwise a pk-only stub is enough for the UPDATE.
+        if OrderItem.order.is_cached(self):
+            return self.order
+        return Order(pk=self.order_id, total_price=Decimal('0'))
+
+    @property
+    def food_name(self):
+        return self.food.name if self.food else "Item no longer available"
+
+# ----------------------------
+# Archive (cold storage)
+# ----------------------------
+class ArchivedOrder(models.Model):
+    """
+    A finished order moved out of ``Order`` by ``manage.py archive_orders``
+    (see ``orders.archive``).  Keeps the original id, so order URLs still
+    resolve, and reads like an ``Order`` in the order templates.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_orders')
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    customer_name = models.CharField(max_length=200, blank=True, null=True)
+    customer_phone = models.CharField(max_length=15, blank=True, null=True)
+    customer_address = models.TextField(blank=True, null=True)
+    order_number = models.PositiveIntegerField(blank=True, null=True)
+    applied_offer = models.ForeignKey(
+        Offer, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_orders'
+    )
+    discount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    is_archived = True
+    can_cancel = False
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Same history index as Order, for the merged My Orders pages
+            models.Index(fields=['user', '-created_at', '-id'], name='archivedorder_user_created'),
+            # A day's orders, for the sales rollups
+            models.Index(fields=['created_at'], name='archivedorder_created'),
+        ]
+
+    def __str__(self):
+        return f"Order #{self.order_number or self.id} - archived ({self.status})"
+
+    @property
+    def amount_due(self):
+        return self.total_price - self.discount
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    food = models.ForeignKey(
+        FoodItem,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='archived_order_items'
+    )
+    quantity = models.PositiveIntegerField(default=1)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+
     def __str__(self):
         if self.food:
             return f"{self.quantity} × {self.food.name}"
@@ -89,4 +338,34 @@ class OrderItem(models.Model):
 
     @property
     def food_name(self):
-        return self.food.name if self.food else "Item no longer available"
\ No newline at end of file
+        return self.food.name if self.food else "Item no longer available"
+
+
+# ----------------------------
+# Sales rollups
+# ----------------------------
+class DailySales(models.Model):
+    """
+    One food's sales on one day (in TIME_ZONE), from placed orders, hot and
+    archived.  Maintained by ``manage.py rollup_sales`` (orders/rollups.py);
+    not foreign-key constrained, so history outlives deleted dishes.
+    """
+    day = models.DateField()
+    restaurant = models.ForeignKey(
+        Restaurant, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+'
+    )
+    food = models.ForeignKey(
+        FoodItem, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name='+'
+    )
+    orders = models.PositiveIntegerField(default=0)
+    quantity = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            # Also the index the dashboard's day-range reads use
+            models.UniqueConstraint(fields=['day', 'restaurant', 'food'], name='dailysales_day_restaurant_food'),
+        ]
+
+    def __str__(self):
+        return f"{self.day}: food {self.food_id} × {self.quantity}"
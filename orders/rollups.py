@@ -0,0 +1,209 @@
+"""
+Daily sales rollups and the reports read from them.
+
+``DailySales`` holds one row per (day, restaurant, food).  ``refresh()``
+(``manage.py rollup_sales``) keeps it current incrementally: it looks up
+the orders changed since the ``JobWatermark`` (``Order.updated_at``, via the
+order_updated index) and recomputes just the days those orders were placed
+on, from both the hot and the archived order tables.  Recomputing a whole
+day, rather than patching counts, makes it idempotent: a status change, a
+cancellation or an order seen twice all come out right.
+
+Orders deleted outright (with their user, say) leave no change behind;
+``refresh(full=True)`` rebuilds everything.
+
+The dashboard reads a few days of rollup rows, however long the order
+history, and aggregates them with NumPy.
+"""
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.db import models
+from django.db.models import Count, F, Sum
+from django.utils import timezone
+
+from main.models import FoodItem, JobWatermark
+from main.sqlite import retry_on_lock, write_atomic
+from restaurants.models import Restaurant
+from .models import ArchivedOrder, ArchivedOrderItem, DailySales, Order, OrderItem
+
+WATERMARK = 'daily_sales'
+# Sales: placed and not cancelled
+COUNTED_STATUSES = ('PREPARING', 'OUT', 'DELIVERED', 'COMPLETED')
+# Changes younger than this wait for the next run, so a transaction that
+# stamped updated_at just before the run but commits after it isn't skipped
+DEFAULT_LAG_SECONDS = 60
+MONEY = models.DecimalField(max_digits=12, decimal_places=2)
+
+
+def _day_bounds(day):
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(day, time.min), tz)
+    return start, timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min), tz)
+
+
+def _aggregate(item_model, start, end):
+    return (
+        item_model.objects
+        .filter(order__created_at__gte=start, order__created_at__lt=end,
+                order__status__in=COUNTED_STATUSES)
+        .values('food_id', 'food__restaurant_id')
+        .annotate(orders=Count('id'), units=Sum('quantity'),
+                  revenue=Sum(F('price') * F('quantity'), output_field=MONEY))
+        .order_by()
+    )
+
+
+@retry_on_lock
+@write_atomic
+def rebuild_day(day):
+    """
+    Recompute ``day``'s rollup rows from the orders placed on it.  Returns
+    the number of rows written.
+    """
+    start, end = _day_bounds(day)
+    totals = defaultdict(lambda: [0, 0, Decimal('0')])
+    for item_model in (OrderItem, ArchivedOrderItem):
+        for row in _aggregate(item_model, start, end):
+            entry = totals[row['food__restaurant_id'], row['food_id']]
+            entry[0] += row['orders']
+            entry[1] += row['units']
+            entry[2] += row['revenue']
+
+    DailySales.objects.filter(day=day).delete()
+    DailySales.objects.bulk_create([
+        DailySales(day=day, restaurant_id=restaurant_id, food_id=food_id,
+                   orders=orders, quantity=quantity, revenue=revenue)
+        for (restaurant_id, food_id), (orders, quantity, revenue) in totals.items()
+    ], batch_size=500)
+    return len(totals)
+
+
+def _all_days():
+    days = set(Order.objects.filter(status__in=COUNTED_STATUSES).dates('created_at', 'day'))
+    days.update(ArchivedOrder.objects.dates('created_at', 'day'))
+    return sorted(days)
+
+
+def changed_days(since, until):
+    # Carts (PENDING) change all the time and never count
+    return list(
+        Order.objects.filter(updated_at__gt=since, updated_at__lte=until)
+        .exclude(status='PENDING').dates('created_at', 'day')
+    )
+
+
+def refresh(full=False, lag=None):
+    """
+    Bring the rollups up to date; the first run, or ``full``, rebuilds
+    every day.  Returns ``(days rebuilt, rows written, new watermark)``.
+    """
+    if lag is None:
+        lag = getattr(settings, 'SALES_ROLLUP_LAG_SECONDS', DEFAULT_LAG_SECONDS)
+    until = timezone.now() - timedelta(seconds=lag)
+    watermark = JobWatermark.objects.filter(name=WATERMARK).first()
+    if full or watermark is None:
+        days = _all_days()
+        DailySales.objects.exclude(day__in=days).delete()
+    else:
+        days = changed_days(watermark.value, until)
+
+    rows = sum(rebuild_day(day) for day in days)
+    JobWatermark.objects.update_or_create(name=WATERMARK, defaults={'value': until})
+    return days, rows, until
+
+
+# -- reports ----------------------------------------------------------------
+
+def load(start, end):
+    """
+    Rollup rows for ``start``..``end`` (dates, inclusive) as NumPy columns:
+    ``day`` (days since ``start``), ``restaurant``, ``food``, ``quantity``
+    and ``revenue``.  Missing restaurant/food ids are 0.
+    """
+    rows = list(
+        DailySales.objects.filter(day__gte=start, day__lte=end)
+        .values_list('day', 'restaurant_id', 'food_id', 'quantity', 'revenue')
+    )
+    if not rows:
+        empty = np.zeros(0, dtype=np.int64)
+        return {'day': empty, 'restaurant': empty, 'food': empty, 'quantity': empty,
+                'revenue': np.zeros(0)}
+    days, restaurants, foods, quantities, revenues = zip(*rows)
+    return {
+        'day': np.array([(day - start).days for day in days], dtype=np.int64),
+        'restaurant': np.array([r or 0 for r in restaurants], dtype=np.int64),
+        'food': np.array([f or 0 for f in foods], dtype=np.int64),
+        'quantity': np.array(quantities, dtype=np.int64),
+        'revenue': np.array(revenues, dtype=np.float64),
+    }
+
+
+def _top(weights, k):
+    # Indices of the k largest, largest first
+    k = min(k, len(weights))
+    top = np.argpartition(weights, -k)[-k:] if k else np.zeros(0, dtype=np.int64)
+    return top[np.argsort(weights[top])[::-1]]
+
+
+def dashboard(days=7, top=10, today=None):
+    """
+    The sales dashboard's numbers for the last ``days`` days: revenue per
+    day, the top restaurants with their revenue per day, and the top
+    dishes by quantity.
+    """
+    end = today or timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    frame = load(start, end)
+
+    daily_revenue = np.bincount(frame['day'], weights=frame['revenue'], minlength=days)
+
+    # Restaurants x days in one bincount over the combined index
+    restaurant_ids, restaurant_idx = np.unique(frame['restaurant'], return_inverse=True)
+    by_restaurant = np.bincount(
+        restaurant_idx * days + frame['day'], weights=frame['revenue'],
+        minlength=len(restaurant_ids) * days,
+    ).reshape(len(restaurant_ids), days)
+    top_restaurants = _top(by_restaurant.sum(axis=1), top)
+
+    food_ids, food_idx = np.unique(frame['food'], return_inverse=True)
+    food_quantity = np.bincount(food_idx, weights=frame['quantity'], minlength=len(food_ids))
+    food_revenue = np.bincount(food_idx, weights=frame['revenue'], minlength=len(food_ids))
+    top_foods = _top(food_quantity, top)
+
+    restaurant_names = {
+        pk: restaurant.name for pk, restaurant in
+        Restaurant.objects.only('name').in_bulk([int(restaurant_ids[i]) for i in top_restaurants]).items()
+    }
+    food_names = FoodItem.objects.select_related('restaurant').in_bulk([int(food_ids[i]) for i in top_foods])
+
+    return {
+        'days': [start + timedelta(days=n) for n in range(days)],
+        'daily_revenue': [
+            {'day': start + timedelta(days=n), 'revenue': round(float(v), 2)}
+            for n, v in enumerate(daily_revenue)
+        ],
+        'total_revenue': round(float(daily_revenue.sum()), 2),
+        'top_restaurants': [
+            {
+                'id': int(restaurant_ids[i]),
+                'name': restaurant_names.get(int(restaurant_ids[i]), "Removed restaurant"),
+                'revenue': round(float(by_restaurant[i].sum()), 2),
+                'daily': [round(float(v), 2) for v in by_restaurant[i]],
+            }
+            for i in top_restaurants
+        ],
+        'top_foods': [
+            {
+                'id': int(food_ids[i]),
+                'name': str(food_names[int(food_ids[i])]) if int(food_ids[i]) in food_names
+                else "Removed dish",
+                'quantity': int(food_quantity[i]),
+                'revenue': round(float(food_revenue[i]), 2),
+            }
+            for i in top_foods
+        ],
+    }
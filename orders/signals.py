@@ -0,0 +1,24 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import events
+from .models import Order
+
+
+# -------------------------
+# ORDER STATUS EVENTS
+# -------------------------
+@receiver(post_save, sender=Order)
+def publish_status_change(sender, instance, raw=False, using=None, update_fields=None, **kwargs):
+    # The cart (PENDING) isn't tracked; an order shows up once it is placed
+    if raw or instance.status == 'PENDING' or instance.status == instance._saved_status:
+        return
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    # After commit, so a rolled-back change is never announced
+    transaction.on_commit(
+        partial(events.hub.publish, instance.user_id, events.status_event(instance)), using=using
+    )
@@ -1,3 +1,839 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import path, reverse
+from django.utils import timezone
+
+from main import metrics
+from main.models import FoodItem, Offer
+from foodapp.urls import urlpatterns as sync_urlpatterns
+from restaurants import async_views as restaurant_async_views
+from restaurants.models import Restaurant
+from . import archive, async_views, events, kitchen, rollups
+from .cart import get_cart_store
+from .models import (
+    ArchivedOrder, ArchivedOrderItem, DailySales, Order, OrderItem, OrderNumberSequence,
+)
+
+
+class OrderNumberAllocationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('bob', password='pw')
+
+    def test_numbers_are_sequential(self):
+        numbers = [Order.objects.create(user=self.user).order_number for _ in range(5)]
+        self.assertEqual(numbers, [1, 2, 3, 4, 5])
+        self.assertEqual(OrderNumberSequence.objects.get(pk=1).value, 5)
+
+    def test_counter_seeded_from_existing_orders(self):
+        Order.objects.create(user=self.user, order_number=41)
+        OrderNumberSequence.objects.all().delete()
+        self.assertEqual(Order.objects.create(user=self.user).order_number, 42)
+
+    def test_resave_keeps_number(self):
+        order = Order.objects.create(user=self.user)
+        order.status = 'PREPARING'
+        order.save()
+        self.assertEqual(order.order_number, 1)
+        self.assertEqual(OrderNumberSequence.objects.get(pk=1).value, 1)
+
+
+class ConcurrentOrderNumberTests(TransactionTestCase):
+    threads = 8
+    orders_per_thread = 10
+
+    def test_no_gaps_or_duplicates_under_concurrency(self):
+        user = User.objects.create_user('carol', password='pw')
+        errors = []
+        start = threading.Barrier(self.threads)
+
+        def worker():
+            try:
+                start.wait()
+                for _ in range(self.orders_per_thread):
+                    Order.objects.create(user=user)
+            except Exception as exc:  # surfaced by the assertion below
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+        self.assertEqual(errors, [])
+        total = self.threads * self.orders_per_thread
+        numbers = sorted(Order.objects.values_list('order_number', flat=True))
+        self.assertEqual(numbers, list(range(1, total + 1)))
+
+
+class ConcurrentCartTests(TransactionTestCase):
+    threads = 8
+    adds_per_thread = 5
+
+    def add_concurrently(self, add):
+        user = User.objects.create_user('dev', password='pw')
+        food = FoodItem.objects.create(
+            restaurant=Restaurant.objects.create(name='Chai Point'), name='Chai', price=20)
+        errors = []
+        start = threading.Barrier(self.threads)
+
+        def worker():
+            try:
+                start.wait()
+                for _ in range(self.adds_per_thread):
+                    add(user, food)
+            except Exception as exc:  # surfaced by the assertion below
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+
+        self.assertEqual(errors, [])
+        order = Order.objects.get(user=user, status='PENDING')
+        quantity = self.threads * self.adds_per_thread
+        self.assertEqual(order.items.get().quantity, quantity)
+        self.assertEqual(order.total_price, quantity * 20)
+
+    def test_concurrent_adds_to_one_cart_all_land(self):
+        # Read-then-write on one PENDING order from many connections: each
+        # change takes the write lock up front, so none fails or is lost
+        self.add_concurrently(get_cart_store().add)
+
+    def test_concurrent_async_adds_to_one_cart_all_land(self):
+        # What the ASGI views call; one event loop per thread, like workers
+        self.add_concurrently(async_to_sync(get_cart_store().aadd))
+
+
+class OrderTotalTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('dave', password='pw')
+        restaurant = Restaurant.objects.create(name='Curry Point')
+        cls.dosa = FoodItem.objects.create(restaurant=restaurant, name='Dosa', price=Decimal('80.50'))
+        cls.idli = FoodItem.objects.create(restaurant=restaurant, name='Idli', price=Decimal('40'))
+
+    def stored_total(self, order):
+        return Order.objects.values_list('total_price', flat=True).get(pk=order.pk)
+
+    def test_item_writes_adjust_total(self):
+        order = Order.objects.create(user=self.user)
+        item = OrderItem.objects.create(order=order, food=self.dosa, price=self.dosa.price, quantity=2)
+        OrderItem.objects.create(order=order, food=self.idli, price=self.idli.price)
+        self.assertEqual(self.stored_total(order), Decimal('201.00'))
+
+        item = OrderItem.objects.get(pk=item.pk)
+        item.quantity = 1
+        item.save()
+        self.assertEqual(self.stored_total(order), Decimal('120.50'))
+
+        item.delete()
+        self.assertEqual(self.stored_total(order), Decimal('40.00'))
+
+    def test_partly_loaded_items_adjust_total(self):
+        order = Order.objects.create(user=self.user)
+        dosa = OrderItem.objects.create(order=order, food=self.dosa, price=self.dosa.price, quantity=2)
+        idli = OrderItem.objects.create(order=order, food=self.idli, price=self.idli.price)
+
+        item = OrderItem.objects.only('id', 'order', 'quantity').get(pk=dosa.pk)
+        item.quantity = 3
+        item.save()
+        self.assertEqual(self.stored_total(order), Decimal('281.50'))
+
+        OrderItem.objects.defer('quantity').get(pk=idli.pk).delete()
+        self.assertEqual(self.stored_total(order), Decimal('241.50'))
+
+    def test_order_save_does_not_clobber_total(self):
+        order = Order.objects.create(user=self.user)
+        OrderItem.objects.create(order=order, food=self.dosa, price=self.dosa.price)
+        order.status = 'PREPARING'
+        order.save()
+        self.assertEqual(self.stored_total(order), Decimal('80.50'))
+
+    def test_cart_views_keep_total(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('add_to_cart', args=[self.dosa.id]))
+        self.client.get(reverse('add_to_cart', args=[self.dosa.id]))
+        self.client.get(reverse('increment_quantity', args=[self.dosa.id]))
+        self.client.get(reverse('decrement_quantity', args=[self.dosa.id]))
+        order = Order.objects.get(user=self.user, status='PENDING')
+        self.assertEqual(order.total_price, Decimal('161.00'))
+
+        self.client.get(reverse('remove_from_cart', args=[self.dosa.id]))
+        self.assertEqual(self.stored_total(order), Decimal('0.00'))
+
+    def test_check_command_finds_and_fixes_drift(self):
+        order = Order.objects.create(user=self.user)
+        OrderItem.objects.create(order=order, food=self.idli, price=self.idli.price, quantity=3)
+        Order.objects.filter(pk=order.pk).update(total_price=5)
+
+        out = StringIO()
+        call_command('check_order_totals', '--fix', stdout=out)
+        self.assertIn('Mismatched: 1', out.getvalue())
+        self.assertEqual(self.stored_total(order), Decimal('120.00'))
+
+
+class OfferPricingTests(TestCase):
+    def test_cart_and_checkout_apply_best_offer(self):
+        caches['catalog'].clear()
+        user = User.objects.create_user('ivy', password='pw')
+        restaurant = Restaurant.objects.create(name='Thali Co')
+        thali = FoodItem.objects.create(restaurant=restaurant, name='Thali', price=Decimal('180'))
+        Offer.objects.create(title='Big', min_order_amount=1000, discount_amount=200)
+        small = Offer.objects.create(title='Small', min_order_amount=300, discount_amount=40)
+
+        self.client.force_login(user)
+        self.client.get(reverse('add_to_cart', args=[thali.id]))
+        self.assertIsNone(self.client.get(reverse('view_cart')).context['applied_offer'])
+
+        self.client.get(reverse('increment_quantity', args=[thali.id]))
+        response = self.client.get(reverse('view_cart'))
+        self.assertEqual(response.context['applied_offer'], small)
+        self.assertContains(response, 'To Pay: ₹320.00')
+
+        self.client.post(reverse('checkout'), {
+            'customer_name': 'Ivy', 'customer_phone': '1', 'customer_address': 'Home'})
+        order = Order.objects.get(user=user)
+        self.assertEqual((order.applied_offer, order.discount, order.amount_due),
+                         (small, Decimal('40.00'), Decimal('320.00')))
+
+
+class MyOrdersPaginationTests(TestCase):
+    def test_history_is_paged_newest_first(self):
+        user = User.objects.create_user('erin', password='pw')
+        for _ in range(25):
+            Order.objects.create(user=user, status='DELIVERED')
+        Order.objects.create(user=user)  # the cart is never listed
+        self.client.force_login(user)
+
+        first = self.client.get(reverse('my_orders')).context['orders']
+        second = self.client.get(reverse('my_orders'), {'cursor': first.next_cursor}).context['orders']
+        numbers = [o.order_number for o in first] + [o.order_number for o in second]
+        self.assertEqual(numbers, list(range(25, 0, -1)))
+
+
+class OrderArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('gita', password='pw')
+        self.dosa = FoodItem.objects.create(
+            restaurant=Restaurant.objects.create(name='Udupi'), name='Dosa', price=Decimal('60'))
+        now = timezone.now()
+        # Old and recent orders interleaved, so the history pages mix both tables
+        for n in range(30):
+            order = Order.objects.create(user=self.user, status='PREPARING' if n == 4 else 'DELIVERED')
+            OrderItem.objects.create(order=order, food=self.dosa, price=self.dosa.price, quantity=n % 3 + 1)
+            days = 100 + n if n % 2 == 0 else n
+            Order.objects.filter(pk=order.pk).update(created_at=now - timedelta(days=days, minutes=n))
+        Order.objects.create(user=self.user)  # the cart
+
+    def archive(self, *args):
+        out = StringIO()
+        call_command('archive_orders', '--batch-size=4', *args, stdout=out)
+        return out.getvalue()
+
+    def test_moves_old_finished_orders_with_their_items(self):
+        self.assertIn('Orders archived: 14', self.archive('--dry-run'))
+        self.assertFalse(ArchivedOrder.objects.exists())
+
+        totals = dict(Order.objects.values_list('order_number', 'total_price'))
+        out = self.archive()
+        self.assertIn('Orders archived: 14', out)
+        self.assertIn('orders_order: 31 -> 17 rows', out)
+        self.assertEqual(ArchivedOrderItem.objects.count(), 14)
+        # The old order still being prepared stays hot
+        self.assertTrue(Order.objects.filter(status='PREPARING').exists())
+        for archived in ArchivedOrder.objects.all():
+            self.assertEqual(archived.total_price, totals[archived.order_number])
+            self.assertFalse(Order.objects.filter(pk=archived.pk).exists())
+        self.assertIn('Orders archived: 0', self.archive())
+
+    def test_history_and_detail_read_both_tables(self):
+        expected = list(
+            Order.objects.filter(user=self.user).exclude(status='PENDING')
+            .order_by('-created_at', '-id').values_list('order_number', flat=True)
+        )
+        self.archive()
+        self.client.force_login(self.user)
+
+        first = self.client.get(reverse('my_orders')).context['orders']
+        second = self.client.get(reverse('my_orders'), {'cursor': first.next_cursor}).context['orders']
+        self.assertEqual([o.order_number for o in first] + [o.order_number for o in second], expected)
+        back = self.client.get(reverse('my_orders'), {'cursor': second.previous_cursor}).context['orders']
+        self.assertEqual([o.order_number for o in back], expected[:20])
+
+        archived = ArchivedOrder.objects.first()
+        response = self.client.get(reverse('order_detail', args=[archived.pk]))
+        self.assertContains(response, 'Dosa')
+        self.assertEqual(response.context['order'], archived)
+        self.assertEqual(self.client.get(reverse('cancel_order', args=[archived.pk])).status_code, 404)
+        other = User.objects.create_user('hari', password='pw')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('order_detail', args=[archived.pk])).status_code, 404)
+
+
+class KitchenQueueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('chef', password='pw', is_staff=True)
+        cls.customer = User.objects.create_user('kavi', password='pw')
+        cls.tandoor = Restaurant.objects.create(name='Tandoor')
+        cls.naan = FoodItem.objects.create(restaurant=cls.tandoor, name='Naan', price=Decimal('30'))
+        cls.tikka = FoodItem.objects.create(restaurant=cls.tandoor, name='Tikka', price=Decimal('180'))
+        cls.lassi = FoodItem.objects.create(
+            restaurant=Restaurant.objects.create(name='Lassi Bar'), name='Lassi', price=Decimal('60'))
+
+        now = timezone.now()
+        cls.orders = {}
+        for n, (name, status, foods) in enumerate([
+            ('newest', 'PREPARING', [cls.naan]),
+            ('mixed', 'PREPARING', [cls.tikka, cls.lassi]),
+            ('out', 'OUT', [cls.naan]),
+            ('oldest', 'PREPARING', [cls.naan, cls.tikka]),
+            ('elsewhere', 'PREPARING', [cls.lassi]),
+            ('delivered', 'DELIVERED', [cls.naan]),
+        ]):
+            order = Order.objects.create(user=cls.customer, status=status)
+            for food in foods:
+                OrderItem.objects.create(order=order, food=food, price=food.price)
+            Order.objects.filter(pk=order.pk).update(created_at=now - timedelta(minutes=n))
+            cls.orders[name] = order.pk
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def ids(self, *names):
+        return [self.orders[name] for name in names]
+
+    def advance(self, order_ids, from_status='PREPARING', to_status='OUT'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                reverse('kitchen_advance', args=[self.tandoor.pk]),
+                json.dumps({'order_ids': order_ids, 'from': from_status, 'to': to_status}),
+                content_type='application/json',
+            )
+
+    def test_queue_lists_open_orders_oldest_first_with_their_items(self):
+        # One query per status plus the items, however many orders
+        with self.assertNumQueries(3):
+            queue = kitchen.queue(self.tandoor.pk)
+            lines = {order.pk: [item.food_name for item in order.kitchen_items] for order in queue}
+        self.assertEqual([order.pk for order in queue], self.ids('oldest', 'out', 'newest'))
+        first = kitchen.queue(self.tandoor.pk, per_page=2)
+        second = kitchen.queue(self.tandoor.pk, cursor=first.next_cursor, per_page=2)
+        self.assertEqual([order.pk for order in second], self.ids('newest'))
+        self.assertEqual(lines[self.orders['oldest']], ['Naan', 'Tikka'])
+
+        response = self.client.get(reverse('kitchen_queue_api', args=[self.tandoor.pk]), {'status': 'OUT'})
+        self.assertEqual([order['id'] for order in response.json()['orders']], self.ids('out'))
+        response = self.client.get(reverse('kitchen_queue', args=[self.tandoor.pk]))
+        self.assertContains(response, 'Tikka')
+        self.assertNotContains(response, 'Lassi')
+
+    def test_batch_advance_is_conditional(self):
+        before = dict(Order.objects.values_list('pk', 'total_price'))
+        order_ids = self.ids('oldest', 'mixed', 'out', 'elsewhere', 'delivered')
+        with mock.patch.object(events.hub, 'publish') as publish:
+            response = self.advance(order_ids)
+        self.assertEqual(response.json(), {
+            'advanced': self.ids('oldest'),
+            'skipped': self.ids('mixed', 'out', 'elsewhere', 'delivered'),
+        })
+        statuses = dict(Order.objects.values_list('pk', 'status'))
+        self.assertEqual([statuses[pk] for pk in order_ids],
+                         ['OUT', 'PREPARING', 'OUT', 'PREPARING', 'DELIVERED'])
+        self.assertEqual(dict(Order.objects.values_list('pk', 'total_price')), before)
+        self.assertEqual([call.args[1]['id'] for call in publish.call_args_list], self.ids('oldest'))
+
+        # Already moved on: nothing left to do
+        self.assertEqual(self.advance(self.ids('oldest')).json()['advanced'], [])
+
+    def test_mixed_restaurant_orders_belong_to_no_kitchen(self):
+        lassi_bar = self.lassi.restaurant_id
+        self.assertEqual([order.pk for order in kitchen.queue(lassi_bar)], self.ids('elsewhere'))
+        for restaurant_id in (self.tandoor.pk, lassi_bar):
+            self.assertEqual(kitchen.advance(restaurant_id, self.ids('mixed'), 'PREPARING', 'OUT'), [])
+        self.assertEqual(Order.objects.get(pk=self.orders['mixed']).status, 'PREPARING')
+
+    def test_form_advance(self):
+        response = self.client.post(reverse('kitchen_advance', args=[self.tandoor.pk]), {
+            'order_ids': self.ids('out'), 'from': 'OUT', 'to': 'DELIVERED'})
+        self.assertRedirects(response, reverse('kitchen_queue', args=[self.tandoor.pk]))
+        self.assertEqual(Order.objects.get(pk=self.orders['out']).status, 'DELIVERED')
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.advance(self.ids('oldest'), 'PREPARING', 'DELIVERED').status_code, 400)
+        self.assertEqual(self.advance(['x']).status_code, 400)
+        response = self.client.get(reverse('kitchen_queue_api', args=[self.tandoor.pk]), {'status': 'PENDING'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.get(pk=self.orders['oldest']).status, 'PREPARING')
+
+        self.client.force_login(self.customer)
+        self.assertEqual(self.client.get(reverse('kitchen_queue', args=[self.tandoor.pk])).status_code, 404)
+        self.assertEqual(self.advance(self.ids('oldest')).status_code, 404)
+
+
+class SalesRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('owner', password='pw', is_staff=True)
+        cls.customer = User.objects.create_user('meera', password='pw')
+        tandoor = Restaurant.objects.create(name='Tandoor')
+        cls.naan = FoodItem.objects.create(restaurant=tandoor, name='Naan', price=Decimal('30'))
+        cls.tikka = FoodItem.objects.create(restaurant=tandoor, name='Tikka', price=Decimal('180'))
+        cls.lassi = FoodItem.objects.create(
+            restaurant=Restaurant.objects.create(name='Lassi Bar'), name='Lassi', price=Decimal('60'))
+
+        cls.today = timezone.localdate()
+        noon = rollups._day_bounds(cls.today)[0] + timedelta(hours=12)
+        cls.orders = {}
+        for name, status, days_ago, lines in [
+            ('preparing', 'PREPARING', 0, [(cls.naan, 2), (cls.tikka, 1)]),
+            ('delivered', 'DELIVERED', 0, [(cls.lassi, 3)]),
+            ('cancelled', 'CANCELLED', 0, [(cls.tikka, 4)]),
+            ('cart', 'PENDING', 0, [(cls.naan, 9)]),
+            ('yesterday', 'DELIVERED', 1, [(cls.naan, 1)]),
+        ]:
+            order = Order.objects.create(user=cls.customer, status=status)
+            for food, quantity in lines:
+                OrderItem.objects.create(order=order, food=food, price=food.price, quantity=quantity)
+            Order.objects.filter(pk=order.pk).update(created_at=noon - timedelta(days=days_ago))
+            cls.orders[name] = order.pk
+        # Yesterday's order lives in the archive; it still counts
+        archive.archive_batch([cls.orders['yesterday']])
+
+    def revenue(self, day):
+        return DailySales.objects.filter(day=day).aggregate(total=Sum('revenue'))['total']
+
+    def test_refresh_rebuilds_changed_days_only(self):
+        days, rows, _ = rollups.refresh(lag=0)
+        yesterday = self.today - timedelta(days=1)
+        self.assertEqual(days, [yesterday, self.today])
+        self.assertEqual(rows, 4)
+        # Carts and cancelled orders don't count
+        self.assertEqual(self.revenue(self.today), Decimal('420'))
+        self.assertEqual(self.revenue(yesterday), Decimal('30'))
+        naan = DailySales.objects.get(day=self.today, food=self.naan)
+        self.assertEqual((naan.orders, naan.quantity, naan.restaurant_id), (1, 2, self.naan.restaurant_id))
+
+        self.assertEqual(rollups.refresh(lag=0)[0], [])
+        # A cancellation rebuilds just the day the order was placed on
+        order = Order.objects.get(pk=self.orders['preparing'])
+        order.status = 'CANCELLED'
+        order.save()
+        self.assertEqual(rollups.refresh(lag=0)[0], [self.today])
+        self.assertEqual(self.revenue(self.today), Decimal('180'))
+        self.assertFalse(DailySales.objects.filter(food=self.tikka).exists())
+
+        # Changes inside the lag wait for a later run
+        Order.objects.filter(pk=self.orders['cancelled']).update(status='DELIVERED', updated_at=timezone.now())
+        self.assertEqual(rollups.refresh(lag=3600)[0], [])
+        self.assertEqual(rollups.refresh(lag=0)[0], [self.today])
+        self.assertEqual(self.revenue(self.today), Decimal('900'))
+
+        out = StringIO()
+        call_command('rollup_sales', '--full', stdout=out)
+        self.assertIn('Days rebuilt: 2', out.getvalue())
+        self.assertEqual(self.revenue(self.today), Decimal('900'))
+
+    def test_dashboard(self):
+        rollups.refresh(lag=0)
+        report = rollups.dashboard(days=2)
+        self.assertEqual([row['revenue'] for row in report['daily_revenue']], [30.0, 420.0])
+        self.assertEqual(report['total_revenue'], 450.0)
+        self.assertEqual([(r['name'], r['revenue'], r['daily']) for r in report['top_restaurants']],
+                         [('Tandoor', 270.0, [30.0, 240.0]), ('Lassi Bar', 180.0, [0.0, 180.0])])
+        foods = [(f['name'], f['quantity'], f['revenue']) for f in report['top_foods']]
+        # Naan and Lassi tie on quantity
+        self.assertCountEqual(foods[:2], [('Lassi (Lassi Bar)', 3, 180.0), ('Naan (Tandoor)', 3, 90.0)])
+        self.assertEqual(foods[2], ('Tikka (Tandoor)', 1, 180.0))
+        self.assertEqual(len(rollups.dashboard(days=2, top=1)['top_foods']), 1)
+
+        self.client.force_login(self.customer)
+        self.assertEqual(self.client.get(reverse('sales_dashboard')).status_code, 404)
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('sales_dashboard'), {'days': 'all'})
+        self.assertEqual(response.context['window'], 7)
+        self.assertContains(response, 'Lassi Bar')
+
+
+@override_settings(CART_STORE='orders.cart.CacheCartStore', CART_FLUSH_INTERVAL=0)
+class CacheCartStoreTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('gus', password='pw')
+        cls.restaurant = Restaurant.objects.create(name='Tiffin Room')
+        cls.vada = FoodItem.objects.create(restaurant=cls.restaurant, name='Vada', price=Decimal('30'))
+        cls.upma = FoodItem.objects.create(restaurant=cls.restaurant, name='Upma', price=Decimal('45'))
+
+    def setUp(self):
+        caches['carts'].clear()
+        self.client.force_login(self.user)
+
+    def click(self, name, food):
+        self.client.get(reverse(name, args=[food.id]))
+
+    def test_clicks_stay_out_of_the_database_until_checkout(self):
+        self.click('add_to_cart', self.vada)
+        self.click('add_to_cart', self.upma)
+        self.click('increment_quantity', self.vada)
+        self.click('decrement_quantity', self.upma)
+        self.click('add_to_cart', self.upma)
+        self.assertFalse(Order.objects.exists())
+
+        response = self.client.get(reverse('view_cart'))
+        self.assertEqual(response.context['total'], Decimal('105'))
+
+        self.client.post(reverse('checkout'), {
+            'customer_name': 'Gus', 'customer_phone': '1', 'customer_address': 'There'})
+        order = Order.objects.get(user=self.user)
+        self.assertEqual(order.status, 'PREPARING')
+        self.assertEqual(order.total_price, Decimal('105.00'))
+        self.assertEqual(
+            sorted(order.items.values_list('food__name', 'quantity')), [('Upma', 1), ('Vada', 2)])
+        self.assertEqual(len(self.client.get(reverse('view_cart')).context['items']), 0)
+
+    def test_flush_writes_dirty_carts_once(self):
+        self.click('add_to_cart', self.vada)
+        self.click('add_to_cart', self.upma)
+
+        out = StringIO()
+        call_command('flush_carts', stdout=out)
+        self.assertIn('Flushed 1 cart', out.getvalue())
+        order = Order.objects.get(user=self.user, status='PENDING')
+        self.assertEqual(order.total_price, Decimal('75.00'))
+
+        call_command('flush_carts', stdout=out)
+        self.assertIn('Flushed 0 cart', out.getvalue())
+
+        self.click('remove_from_cart', self.upma)
+        self.click('increment_quantity', self.vada)
+        call_command('flush_carts', stdout=StringIO())
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, Decimal('60.00'))
+        self.assertEqual(list(order.items.values_list('food_id', 'quantity')), [(self.vada.id, 2)])
+
+    def test_change_during_a_flush_is_flushed_next_time(self):
+        store = get_cart_store()
+        self.click('add_to_cart', self.vada)
+        write_order = store._write_order
+
+        def click_meanwhile(user_id, items):
+            order = write_order(user_id, items)
+            self.click('add_to_cart', self.upma)
+            return order
+
+        with mock.patch.object(store, '_write_order', click_meanwhile):
+            self.assertEqual(store.flush(), 1)
+        self.assertEqual(caches['carts'].get(store.DIRTY_KEY), {self.user.pk})
+        store.flush()
+        order = Order.objects.get(user=self.user, status='PENDING')
+        self.assertEqual(order.total_price, Decimal('75.00'))
+        self.assertEqual(caches['carts'].get(store.DIRTY_KEY), set())
+
+        # A clean cart changed after its flush is listed again
+        self.click('remove_from_cart', self.upma)
+        self.assertEqual(caches['carts'].get(store.DIRTY_KEY), {self.user.pk})
+
+    @override_settings(CART_FLUSH_INTERVAL=60)
+    def test_clicks_never_flush_inline(self):
+        store = get_cart_store()
+        with mock.patch.object(threading.Thread, 'start') as start, \
+                mock.patch.object(store, 'flush') as flush:
+            self.click('add_to_cart', self.vada)
+            self.click('add_to_cart', self.upma)
+        self.assertEqual(start.call_count, 1)
+        flush.assert_not_called()
+
+    def test_lost_cache_falls_back_to_last_flush(self):
+        self.click('add_to_cart', self.vada)
+        call_command('flush_carts', stdout=StringIO())
+        self.click('add_to_cart', self.upma)  # never flushed
+        caches['carts'].clear()
+
+        items = self.client.get(reverse('view_cart')).context['items']
+        self.assertEqual([(line.food.name, line.quantity) for line in items], [('Vada', 1)])
+
+
+class CartBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('hal', password='pw')
+        cls.restaurant = Restaurant.objects.create(name='Biryani House')
+        cls.biryani = FoodItem.objects.create(restaurant=cls.restaurant, name='Biryani', price=Decimal('200'))
+        cls.raita = FoodItem.objects.create(restaurant=cls.restaurant, name='Raita', price=Decimal('25'))
+
+    def setUp(self):
+        caches['carts'].clear()
+        self.client.force_login(self.user)
+
+    def batch(self, ops):
+        return self.client.post(reverse('cart_batch'), json.dumps(ops), content_type='application/json')
+
+    def test_batch_upserts_and_returns_summary(self):
+        self.client.get(reverse('add_to_cart', args=[self.biryani.id]))
+        FoodItem.objects.filter(pk=self.biryani.pk).update(price=Decimal('250'))
+
+        response = self.batch([
+            {'food_id': self.biryani.id, 'delta': 2},
+            {'food_id': self.raita.id, 'delta': 1},
+            {'food_id': self.raita.id, 'delta': 1},
+            {'food_id': 999999, 'delta': 1},
+        ])
+        self.assertEqual(response.status_code, 200)
+        summary = response.json()
+        self.assertEqual((summary['count'], summary['total']), (5, '650.00'))
+
+        order = Order.objects.get(user=self.user, status='PENDING')
+        self.assertEqual(order.total_price, Decimal('650.00'))
+        # The existing line keeps the price it was added at
+        self.assertEqual(order.items.get(food=self.biryani).price, Decimal('200.00'))
+
+        summary = self.batch([{'food_id': self.biryani.id, 'delta': -3}]).json()
+        self.assertEqual([item['name'] for item in summary['items']], ['Raita'])
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, Decimal('50.00'))
+
+    def test_rejects_malformed_payloads(self):
+        for body in ['{"food_id": 1}', '[{"food_id": "1", "delta": 1}]',
+                     '[{"food_id": 1, "delta": true}]', 'not json',
+                     '[{"food_id": 1, "delta": 100000000000000000000}]',
+                     '[{"food_id": 1, "delta": -100}]']:
+            response = self.client.post(reverse('cart_batch'), body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+        self.assertEqual(self.client.get(reverse('cart_batch')).status_code, 405)
+        self.assertFalse(Order.objects.exists())
+
+    @override_settings(CART_STORE='orders.cart.CacheCartStore', CART_FLUSH_INTERVAL=0)
+    def test_cache_store(self):
+        summary = self.batch([{'food_id': self.raita.id, 'delta': 3}]).json()
+        self.assertEqual(summary['total'], '75.00')
+        self.assertFalse(Order.objects.exists())
+
+
+# The ASGI profile's routing: async views shadow the sync ones (first match wins)
+class AsyncURLConf:
+    urlpatterns = [
+        path('restaurants/<int:pk>/', restaurant_async_views.restaurant_detail),
+        path('restaurants/add-to-cart/<int:food_id>/', restaurant_async_views.add_to_cart),
+        path('orders/cart/', async_views.view_cart),
+        path('orders/cart/batch/', async_views.cart_batch),
+        path('orders/increase/<int:food_id>/', async_views.increment_quantity),
+        path('orders/decrease/<int:food_id>/', async_views.decrement_quantity),
+        path('orders/remove-from-cart/<int:food_id>/', async_views.remove_from_cart),
+        path('orders/checkout/', async_views.checkout),
+        path('orders/my-orders/', async_views.my_orders),
+        path('orders/events/', async_views.order_events),
+        *sync_urlpatterns,
+    ]
+
+
+@override_settings(ROOT_URLCONF=AsyncURLConf)
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('fay', password='pw')
+        cls.restaurant = Restaurant.objects.create(name='Chaat Street')
+        cls.pani_puri = FoodItem.objects.create(
+            restaurant=cls.restaurant, name='Pani Puri', price=Decimal('50'))
+
+    async def test_cart_flow(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(f'/restaurants/add-to-cart/{self.pani_puri.id}/')
+        self.assertRedirects(response, f'/restaurants/{self.restaurant.id}/', fetch_redirect_response=False)
+        await self.async_client.get(f'/orders/increase/{self.pani_puri.id}/')
+        await self.async_client.get(f'/orders/increase/{self.pani_puri.id}/')
+        await self.async_client.get(f'/orders/decrease/{self.pani_puri.id}/')
+
+        order = await Order.objects.aget(user=self.user, status='PENDING')
+        self.assertEqual(order.total_price, Decimal('100.00'))
+
+        response = await self.async_client.get('/orders/checkout/')
+        self.assertContains(response, 'Pani Puri')
+        await self.async_client.post('/orders/checkout/', {
+            'customer_name': 'Fay', 'customer_phone': '123', 'customer_address': 'Here'})
+        order = await Order.objects.aget(pk=order.pk)
+        self.assertEqual(order.status, 'PREPARING')
+
+        response = await self.async_client.get('/orders/my-orders/')
+        self.assertContains(response, f'Order #{order.order_number}')
+
+    async def test_restaurant_detail_renders_favorites(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(f'/restaurants/{self.restaurant.id}/')
+        self.assertContains(response, 'Pani Puri')
+        self.assertContains(response, 'Add to Favorites')
+
+    async def test_restaurant_detail_conditional_get(self):
+        url = f'/restaurants/{self.restaurant.id}/'
+        response = await self.async_client.get(url)
+        self.assertIn('Last-Modified', response)
+        response = await self.async_client.get(url, headers={'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('private', response['Cache-Control'])
+
+    async def test_remove_from_cart(self):
+        await self.async_client.aforce_login(self.user)
+        await self.async_client.get(f'/restaurants/add-to-cart/{self.pani_puri.id}/')
+        await self.async_client.get(f'/orders/remove-from-cart/{self.pani_puri.id}/')
+        order = await Order.objects.aget(user=self.user, status='PENDING')
+        self.assertEqual(order.total_price, Decimal('0.00'))
+
+    @override_settings(CART_STORE='orders.cart.CacheCartStore', CART_FLUSH_INTERVAL=0)
+    async def test_cache_cart_store(self):
+        caches['carts'].clear()
+        await self.async_client.aforce_login(self.user)
+        await self.async_client.get(f'/restaurants/add-to-cart/{self.pani_puri.id}/')
+        await self.async_client.get(f'/orders/increase/{self.pani_puri.id}/')
+        self.assertFalse(await Order.objects.filter(user=self.user).aexists())
+
+        response = await self.async_client.get('/orders/cart/')
+        self.assertEqual(response.context['total'], Decimal('100'))
+        await self.async_client.post('/orders/checkout/', {
+            'customer_name': 'Fay', 'customer_phone': '123', 'customer_address': 'Here'})
+        order = await Order.objects.aget(user=self.user)
+        self.assertEqual((order.status, order.total_price), ('PREPARING', Decimal('100.00')))
+
+    async def test_cart_batch(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.post(
+            '/orders/cart/batch/', json.dumps([{'food_id': self.pani_puri.id, 'delta': 4}]),
+            content_type='application/json')
+        self.assertEqual(response.json()['total'], '200.00')
+        order = await Order.objects.aget(user=self.user, status='PENDING')
+        self.assertEqual(order.total_price, Decimal('200.00'))
+
+    async def test_metrics_cover_async_views(self):
+        metrics.reset()
+        await self.async_client.aforce_login(self.user)
+        await self.async_client.get('/orders/cart/')
+        with metrics._lock:
+            series = metrics.SQL_QUERIES.series['orders.async_views.view_cart']
+        # One request, and its queries ran in sync_to_async threads
+        self.assertEqual(sum(series[:-1]), 1)
+        self.assertGreater(series[-1], 0)
+
+
+@override_settings(ROOT_URLCONF=AsyncURLConf)
+class OrderEventsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.ira = User.objects.create_user('ira', password='pw')
+        cls.jay = User.objects.create_user('jay', password='pw')
+        cls.order = Order.objects.create(user=cls.ira, status='PREPARING')
+
+    async def open_stream(self, user):
+        await self.async_client.aforce_login(user)
+        response = await self.async_client.get('/orders/events/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        self.assertTrue((await anext(stream)).startswith(b'retry:'))
+        return stream, await anext(stream)
+
+    async def read(self, stream):
+        return await asyncio.wait_for(anext(stream), 1)
+
+    async def disconnect(self, stream):
+        # What the ASGI handler does when the client goes away
+        pending = asyncio.ensure_future(anext(stream))
+        await asyncio.sleep(0)
+        pending.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await pending
+
+    def set_status(self, status):
+        with self.captureOnCommitCallbacks(execute=True):
+            order = Order.objects.get(pk=self.order.pk)
+            order.status = status
+            order.save()
+
+    async def test_status_changes_fan_out_to_the_users_streams(self):
+        first, snapshot = await self.open_stream(self.ira)
+        self.assertIn(b'event: snapshot', snapshot)
+        self.assertIn(b'"status": "PREPARING"', snapshot)
+        second, _ = await self.open_stream(self.ira)
+        other, snapshot = await self.open_stream(self.jay)
+        self.assertIn(b'data: []', snapshot)
+        self.assertEqual(events.hub.count(), 3)
+        self.assertEqual(events.hub.count(self.ira.id), 2)
+
+        await sync_to_async(self.set_status)('OUT')
+        for stream in (first, second):
+            self.assertIn(b'"status": "OUT"', await self.read(stream))
+        # Saves that don't change the status aren't announced
+        await sync_to_async(self.set_status)('OUT')
+        await sync_to_async(self.set_status)('DELIVERED')
+        for stream in (first, second):
+            self.assertIn(b'"status": "DELIVERED"', await self.read(stream))
+
+        await self.disconnect(other)
+        await self.disconnect(first)
+        self.assertEqual(events.hub.count(self.jay.id), 0)
+        self.assertEqual(events.hub.count(self.ira.id), 1)
+        await self.disconnect(second)
+        self.assertEqual(events.hub.count(), 0)
+
+    @override_settings(ORDER_EVENTS_KEEPALIVE=0.01)
+    async def test_idle_stream_keepalive(self):
+        stream, _ = await self.open_stream(self.jay)
+        self.assertEqual(await self.read(stream), b': keepalive\n\n')
+        await self.disconnect(stream)
+
+    async def test_slow_stream_resyncs(self):
+        stream, _ = await self.open_stream(self.ira)
+        for n in range(events.QUEUE_SIZE + 1):
+            events.hub.publish(self.ira.id, {'id': self.order.id, 'status': f'S{n}'})
+        await asyncio.sleep(0)
+        self.assertIn(b'event: snapshot', await self.read(stream))
+        await self.disconnect(stream)
+
+    @override_settings(ORDER_EVENTS_KEEPALIVE=0.01)
+    async def test_changes_from_other_workers_and_reconnects(self):
+        stream, snapshot = await self.open_stream(self.ira)
+        self.assertTrue(snapshot.startswith(b'id: '))
+        first_id = snapshot.split(b'\n')[0][4:].decode()
+
+        # Saved by another worker: nothing reaches this process's hub
+        await Order.objects.filter(pk=self.order.pk).aupdate(status='DELIVERED', updated_at=timezone.now())
+        event = await self.read(stream)
+        self.assertIn(b'event: status', event)
+        self.assertIn(b'"status": "DELIVERED"', event)
+        self.assertEqual(await self.read(stream), b': keepalive\n\n')
+        await self.disconnect(stream)
+
+        # EventSource reconnects with the last id it saw: finished orders included
+        response = await self.async_client.get('/orders/events/', headers={'Last-Event-ID': first_id})
+        stream = response.streaming_content
+        await anext(stream)
+        snapshot = await anext(stream)
+        self.assertIn(b'event: snapshot', snapshot)
+        self.assertIn(b'"status": "DELIVERED"', snapshot)
+        await self.disconnect(stream)
+
+    def test_wsgi_profile_declines_to_stream(self):
+        self.client.force_login(self.ira)
+        with self.settings(ROOT_URLCONF='foodapp.urls'):
+            self.assertEqual(self.client.get(reverse('order_events')).status_code, 204)
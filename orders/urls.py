@@ -1,8 +1,14 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+if settings.ASYNC_VIEWS:
+    # ASGI profile: hot endpoints run as native async views
+    from . import async_views as views
+
 urlpatterns = [
     path('cart/', views.view_cart, name='view_cart'),
+    path('cart/batch/', views.cart_batch, name='cart_batch'),
     path('remove-from-cart/<int:food_id>/', views.remove_from_cart, name='remove_from_cart'),
     path('increase/<int:food_id>/', views.increment_quantity, name='increment_quantity'),
     path('decrease/<int:food_id>/', views.decrement_quantity, name='decrement_quantity'),
@@ -10,5 +16,10 @@ urlpatterns = [
     path('my-orders/', views.my_orders, name='my_orders'),
     path('cancel_order/<int:order_id>/', views.cancel_order, name='cancel_order'),
     path('order/<int:order_id>/', views.order_detail, name='order_detail'),
+    path('events/', views.order_events, name='order_events'),
+    path('kitchen/<int:restaurant_id>/', views.kitchen_queue, name='kitchen_queue'),
+    path('kitchen/<int:restaurant_id>/queue/', views.kitchen_queue_api, name='kitchen_queue_api'),
+    path('kitchen/<int:restaurant_id>/advance/', views.kitchen_advance, name='kitchen_advance'),
+    path('dashboard/', views.sales_dashboard, name='sales_dashboard'),
 ]
 
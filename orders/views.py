@@ -1,22 +1,40 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from .models import Order, OrderItem
-from main.models import FoodItem
+from django.http import Http404, HttpResponse, JsonResponse
+from django.views.decorators.http import require_POST
+from restaurants.models import Restaurant
+from . import archive, kitchen, rollups
+from .cart import get_cart_store, parse_deltas
+from .models import Order
+from main import offers, recommendations
+from main.sqlite import retry_on_lock, write_atomic
+
+
+def _cart_context(cart, pricing, recommended=()):
+    return {
+        'order': cart.order,
+        'items': cart.lines,
+        'total': cart.total,
+        'applied_offer': pricing.offer,
+        'discount': pricing.discount,
+        'amount_due': pricing.amount_due,
+        'recommended': recommended,
+    }
+
+
+def _cart_food_ids(cart):
+    return [line.food_id for line in cart.lines if line.food_id]
+
 
 # ----------------------------
 # View Cart
 # ----------------------------
 @login_required
 def view_cart(request):
-    order = Order.objects.filter(user=request.user, status='PENDING').first()
-    items = order.items.all() if order else []
-    total = order.total_price if order else 0
-    return render(request, 'orders/cart.html', {
-        'order': order,
-        'items': items,
-        'total': total
-    })
+    cart = get_cart_store().get(request.user)
+    recommended = recommendations.for_foods(_cart_food_ids(cart))
+    return render(request, 'orders/cart.html', _cart_context(cart, offers.price(cart.total), recommended))
 
 
 # ----------------------------
@@ -24,13 +42,8 @@ def view_cart(request):
 # ----------------------------
 @login_required
 def remove_from_cart(request, food_id):
-    order = Order.objects.filter(user=request.user, status='PENDING').first()
-    if order:
-        item = OrderItem.objects.filter(order=order, food_id=food_id).first()
-        if item:
-            item.delete()
-            order.save()
-            messages.info(request, "Item removed from cart!")
+    if get_cart_store().remove(request.user, food_id):
+        messages.info(request, "Item removed from cart!")
     return redirect('view_cart')
 
 
@@ -39,13 +52,7 @@ def remove_from_cart(request, food_id):
 # ----------------------------
 @login_required
 def increment_quantity(request, food_id):
-    order = Order.objects.filter(user=request.user, status='PENDING').first()
-    if order:
-        item = OrderItem.objects.filter(order=order, food_id=food_id).first()
-        if item:
-            item.quantity += 1
-            item.save()
-            order.save()
+    get_cart_store().change(request.user, food_id, 1)
     return redirect('view_cart')
 
 
@@ -54,49 +61,76 @@ def increment_quantity(request, food_id):
 # ----------------------------
 @login_required
 def decrement_quantity(request, food_id):
-    order = Order.objects.filter(user=request.user, status='PENDING').first()
-    if order:
-        item = OrderItem.objects.filter(order=order, food_id=food_id).first()
-        if item:
-            if item.quantity > 1:
-                item.quantity -= 1
-                item.save()
-            else:
-                item.delete()
-            order.save()
+    get_cart_store().change(request.user, food_id, -1)
     return redirect('view_cart')
 
 
+# ----------------------------
+# Batch cart update (JSON)
+# ----------------------------
+@login_required
+@require_POST
+def cart_batch(request):
+    """
+    Apply ``[{"food_id", "delta"}, ...]`` in one transaction and return the
+    cart summary, so the menu page can update without a reload.
+    """
+    try:
+        deltas = parse_deltas(request.body)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    cart = get_cart_store().apply(request.user, deltas)
+    return JsonResponse(cart.summary())
+
+
 # ----------------------------
 # Checkout (Cart Checkout)
 # ----------------------------
+@retry_on_lock
+@write_atomic
+def _place_order(store, user, details):
+    """
+    Turn the user's cart into a PREPARING order in one write transaction
+    (rerun whole on a lock error).  None when the cart is empty.
+    """
+    # Write-behind stores hold the cart outside the DB until now
+    order = store.persist(user)
+    if order is None:
+        return None
+    order.customer_name = details.get("customer_name")
+    order.customer_phone = details.get("customer_phone")
+    order.customer_address = details.get("customer_address")
+
+    # Price against the stored total, as of placing the order
+    pricing = offers.price(order.total_price)
+    order.applied_offer = pricing.offer
+    order.discount = pricing.discount
+
+    order.status = "PREPARING"
+    order.save()
+    return order
+
+
 @login_required
 def checkout(request):
-    order = Order.objects.filter(user=request.user, status='PENDING').first()
+    store = get_cart_store()
+    cart = store.get(request.user)
 
-    if not order:
+    if not cart:
         messages.error(request, "Your cart is empty!")
         return redirect('view_cart')
 
-    items = order.items.all()
-    total = order.total_price
-
     # GET → show customer details form
     if request.method == "GET":
-        return render(request, "restaurants/checkout.html", {
-            "order": order,
-            "items": items,
-            "total": total
-        })
+        return render(request, "restaurants/checkout.html",
+                      _cart_context(cart, offers.price(cart.total)))
 
     # POST → save customer details and place order
     if request.method == "POST":
-        order.customer_name = request.POST.get("customer_name")
-        order.customer_phone = request.POST.get("customer_phone")
-        order.customer_address = request.POST.get("customer_address")
-
-        order.status = "PREPARING"
-        order.save()
+        if _place_order(store, request.user, request.POST) is None:
+            messages.error(request, "Your cart is empty!")
+            return redirect('view_cart')
+        store.clear(request.user)
 
         messages.success(request, "Order placed successfully!")
         return redirect("my_orders")
@@ -108,7 +142,8 @@ def checkout(request):
 @login_required
 def my_orders(request):
     pending_order = Order.objects.filter(user=request.user, status='PENDING').first()
-    orders = Order.objects.filter(user=request.user).exclude(status='PENDING')
+    # Recent orders and the archive, merged into one history
+    orders = archive.history(request.user).get_page(request.GET.get('cursor'))
     return render(request, 'orders/my_orders.html', {
         'pending_order': pending_order,
         'orders': orders
@@ -126,7 +161,7 @@ def cancel_order(request, order_id):
         return redirect('my_orders')
 
     order.status = 'CANCELLED'
-    order.save()
+    retry_on_lock(order.save)()
     messages.success(request, "Order cancelled successfully!")
     return redirect('my_orders')
 
@@ -136,10 +171,114 @@ def cancel_order(request, order_id):
 # ----------------------------
 @login_required
 def order_detail(request, order_id):
-    order = get_object_or_404(Order, id=order_id, user=request.user)
-    items = order.items.all()
+    order = archive.get_order(request.user, order_id)
+    if order is None:
+        raise Http404("No Order matches the given query.")
+    items = order.items.select_related('food')
 
     return render(request, "orders/order_detail.html", {
         "order": order,
         "items": items
-    })
\ No newline at end of file
+    })
+
+
+# ----------------------------
+# Kitchen queue (staff)
+# ----------------------------
+def _kitchen_restaurant(request, restaurant_id):
+    if not request.user.is_staff:
+        raise Http404
+    return get_object_or_404(Restaurant, pk=restaurant_id)
+
+
+@login_required
+def kitchen_queue(request, restaurant_id):
+    restaurant = _kitchen_restaurant(request, restaurant_id)
+    return render(request, 'orders/kitchen.html', {
+        'restaurant': restaurant,
+        'orders': kitchen.queue(restaurant.id, cursor=request.GET.get('cursor')),
+        'transitions': kitchen.TRANSITIONS,
+    })
+
+
+@login_required
+def kitchen_queue_api(request, restaurant_id):
+    """
+    The queue as JSON, a page at a time (``?cursor=<next_cursor>``);
+    ``?status=PREPARING`` narrows it to one status.
+    """
+    restaurant = _kitchen_restaurant(request, restaurant_id)
+    statuses = kitchen.OPEN_STATUSES
+    if 'status' in request.GET:
+        if request.GET['status'] not in statuses:
+            return JsonResponse({'error': f"status must be one of {', '.join(statuses)}"}, status=400)
+        statuses = [request.GET['status']]
+    orders = kitchen.queue(restaurant.id, statuses, request.GET.get('cursor'))
+    return JsonResponse({
+        'restaurant': restaurant.id,
+        'orders': [kitchen.as_json(order) for order in orders],
+        'next_cursor': orders.next_cursor,
+    })
+
+
+@login_required
+@require_POST
+def kitchen_advance(request, restaurant_id):
+    """
+    Move a batch of orders to their next status: JSON
+    ``{"order_ids", "from", "to"}`` from the API, or the queue page's form.
+    """
+    restaurant = _kitchen_restaurant(request, restaurant_id)
+    as_json = request.content_type == 'application/json'
+    try:
+        if as_json:
+            order_ids, from_status, to_status = kitchen.parse_transition(request.body)
+        else:
+            order_ids = [int(order_id) for order_id in request.POST.getlist('order_ids')]
+            from_status, to_status = request.POST.get('from'), request.POST.get('to')
+            kitchen.check_transition(from_status, to_status)
+    except ValueError as e:
+        if as_json:
+            return JsonResponse({'error': str(e)}, status=400)
+        messages.error(request, f"Nothing changed: {e}.")
+        return redirect('kitchen_queue', restaurant.id)
+
+    moved = kitchen.advance(restaurant.id, order_ids, from_status, to_status)
+    moved_ids = set(moved)
+    skipped = [order_id for order_id in order_ids if order_id not in moved_ids]
+    if as_json:
+        return JsonResponse({'advanced': moved, 'skipped': skipped})
+    messages.success(request, f"{len(moved)} order(s) moved to {to_status}.")
+    if skipped:
+        messages.warning(request, f"{len(skipped)} order(s) had already moved on and were left as they are.")
+    return redirect('kitchen_queue', restaurant.id)
+
+# ----------------------------
+# Sales dashboard (staff)
+# ----------------------------
+@login_required
+def sales_dashboard(request):
+    """
+    Revenue and top dishes from the daily rollups (``manage.py
+    rollup_sales``); ``?days=`` picks the window, up to 90 days.
+    """
+    if not request.user.is_staff:
+        raise Http404
+    try:
+        days = min(max(int(request.GET.get('days', 7)), 1), 90)
+    except ValueError:
+        days = 7
+    return render(request, 'orders/sales_dashboard.html', {'report': rollups.dashboard(days), 'window': days})
+
+# ----------------------------
+# Order status events
+# ----------------------------
+@login_required
+def order_events(request):
+    """
+    Status updates are streamed by the ASGI profile only (async_views): a
+    stream would hold a WSGI worker thread for as long as the page is open.
+    204 tells EventSource not to reconnect; the pages still show the status
+    as of their last load.
+    """
+    return HttpResponse(status=204)
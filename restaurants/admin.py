@@ -12,7 +12,7 @@ class FoodItemInline(admin.TabularInline):
 # Register Restaurant with inline
 @admin.register(Restaurant)
 class RestaurantAdmin(admin.ModelAdmin):
-    list_display = ("name", "location", "is_popular")
+    list_display = ("name", "location", "is_popular", "popularity_score")
     list_filter = ("is_popular",)
     search_fields = ("name", "location")
     inlines = [FoodItemInline]  # attach the FoodItems inline
@@ -0,0 +1,69 @@
+"""
+Native async versions of the restaurant menu and add-to-cart endpoints.
+
+Served instead of the sync views in ``restaurants.views`` when
+``settings.ASYNC_VIEWS`` is on (the ASGI profile, see ``foodapp/asgi.py``).
+"""
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import Http404
+from django.shortcuts import aget_object_or_404, redirect, render
+
+from main import catalog_cache, recommendations
+from main.conditional import catalog_conditional
+from main.favorites import afavorite_food_ids
+from main.models import FoodItem
+from main.routing import replica_reads
+from orders.cart import get_cart_store
+from .models import Restaurant
+# Endpoints without an async version are served unchanged
+from .views import order_now, restaurant_last_modified, restaurant_list  # noqa: F401
+
+
+async def _restaurant_menu(pk):
+    restaurant = await Restaurant.objects.filter(pk=pk).afirst()
+    if restaurant is None:
+        return None, [], []
+    foods = [food async for food in FoodItem.objects.filter(restaurant=restaurant).order_by('name')]
+    return restaurant, foods, await recommendations.apairs([food.pk for food in foods])
+
+
+# ----------------------------
+# Restaurant detail + foods
+# ----------------------------
+@replica_reads
+@catalog_conditional(last_modified=restaurant_last_modified)
+async def restaurant_detail(request, pk):
+    """
+    Show details of a single restaurant, including its food items.
+    """
+    restaurant, foods, pairs = await catalog_cache.aget_or_build(
+        'restaurant_detail', lambda: _restaurant_menu(pk), pk
+    )
+    if restaurant is None:
+        raise Http404("No Restaurant matches the given query.")
+
+    # Warm the memo the user_has_favorite filter reads; it can't query from here
+    await afavorite_food_ids(request.user)
+    return render(request, 'restaurants/restaurant_detail.html', {
+        'restaurant': restaurant,
+        'foods': foods,
+        'pairs': pairs,
+    })
+
+
+# ----------------------------
+# Add food to cart
+# ----------------------------
+@login_required
+async def add_to_cart(request, food_id):
+    """
+    Add a food item to the user's pending order (cart).
+    """
+    user = request.user = await request.auser()
+    food = await aget_object_or_404(FoodItem, id=food_id)
+
+    await get_cart_store().aadd(user, food)
+
+    messages.success(request, f"{food.name} added to cart!")
+    return redirect('restaurant_detail', pk=food.restaurant_id)
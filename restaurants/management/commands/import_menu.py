@@ -0,0 +1,262 @@
+import csv
+import io
+import json
+import sys
+import time
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from main import catalog_cache
+from main.models import Category, FoodItem
+from main.search import get_backend
+from restaurants.models import Restaurant
+
+UPDATE_FIELDS = ['price', 'description', 'category', 'is_trending']
+TRUE_VALUES = {'1', 'true', 'yes', 'y'}
+MAX_PRICE = Decimal('999999.99')  # FoodItem.price is max_digits=8, decimal_places=2
+
+
+class RowError(ValueError):
+    pass
+
+
+def _key(name):
+    # Names match case- and whitespace-insensitively
+    return ' '.join(name.split()).casefold()
+
+
+def _read_csv(stream):
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield reader.line_num, row
+
+
+def _read_jsonl(stream):
+    for line_no, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_no, RowError(f"invalid JSON: {e.msg}")
+            continue
+        yield line_no, row if isinstance(row, dict) else RowError("expected a JSON object")
+
+
+def _clean(row):
+    """
+    Validate one input row; returns (restaurant, name, fields).
+    """
+    if isinstance(row, RowError):
+        raise row
+    restaurant = str(row.get('restaurant') or '').strip()
+    name = ' '.join(str(row.get('name') or '').split())
+    if not restaurant or not name:
+        raise RowError("restaurant and name are required")
+    if len(name) > 100 or len(restaurant) > 100:
+        raise RowError("restaurant and name must be at most 100 characters")
+    try:
+        price = Decimal(str(row.get('price', '')).strip()).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise RowError(f"invalid price {row.get('price')!r}")
+    if not price.is_finite():
+        raise RowError(f"invalid price {row.get('price')!r}")
+    if not 0 <= price <= MAX_PRICE:
+        raise RowError(f"price {price} out of range")
+    trending = row.get('is_trending')
+    return restaurant, name, {
+        'price': price,
+        'description': str(row.get('description') or '').strip(),
+        'category': str(row.get('category') or '').strip(),
+        'is_trending': trending is True or str(trending or '').strip().lower() in TRUE_VALUES,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream a CSV or JSONL menu (restaurant, name, price[, description, category, "
+        "is_trending]) into FoodItems, upserting by restaurant + food name"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or - for stdin")
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help="Input format; default from the file extension")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Rows per transaction / bulk write")
+        parser.add_argument('--no-create', action='store_true',
+                            help="Reject rows for unknown restaurants/categories instead of creating them")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Validate and count what would change without writing")
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('jsonl' if options['path'].endswith(('.jsonl', '.ndjson')) else 'csv')
+        self.options = options
+        self.counts = dict(read=0, created=0, updated=0, unchanged=0, errors=0,
+                           restaurants_created=0, categories_created=0)
+        self.error_lines = []
+
+        # Name -> id maps, built once; lowest id wins on duplicate names
+        self.restaurant_ids = {}
+        for pk, name in Restaurant.objects.order_by('-id').values_list('id', 'name'):
+            self.restaurant_ids[_key(name)] = pk
+        self.category_ids = {}
+        for pk, name in Category.objects.order_by('-id').values_list('id', 'name'):
+            self.category_ids[_key(name)] = pk
+        self._placeholder = 0  # dry-run stand-in ids for rows that would be created
+        # (restaurant id, name key) -> food id, filled a restaurant at a time
+        self.food_ids = {}
+        self.loaded_restaurants = set()
+
+        if options['path'] == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+        else:
+            try:
+                stream = open(options['path'], encoding='utf-8-sig', newline='')
+            except OSError as e:
+                raise CommandError(str(e))
+
+        started = last_report = time.perf_counter()
+        with stream:
+            rows = _read_jsonl(stream) if fmt == 'jsonl' else _read_csv(stream)
+            while batch := list(islice(rows, options['batch_size'])):
+                self._import_batch(batch)
+                now = time.perf_counter()
+                if now - last_report >= 5:
+                    last_report = now
+                    self.stderr.write(f"... {self.counts['read']} rows, "
+                                      f"{self.counts['read'] / (now - started):,.0f} rows/sec")
+
+        if not options['dry_run'] and (self.counts['created'] or self.counts['updated']):
+            catalog_cache.bump_version()
+        self._summary(time.perf_counter() - started)
+
+    def _import_batch(self, batch):
+        cleaned = {}
+        for line_no, row in batch:
+            self.counts['read'] += 1
+            try:
+                restaurant, name, fields = _clean(row)
+            except RowError as e:
+                self._error(line_no, str(e))
+                continue
+            # A food repeated within the batch: the last row wins
+            cleaned[(_key(restaurant), _key(name))] = (line_no, restaurant, name, fields)
+
+        if self.options['dry_run']:
+            self._apply(cleaned)
+        else:
+            with transaction.atomic():
+                self._apply(cleaned)
+
+    def _apply(self, cleaned):
+        dry_run = self.options['dry_run']
+        rows = []
+        for line_no, restaurant, name, fields in cleaned.values():
+            restaurant_id = self._resolve(self.restaurant_ids, Restaurant, restaurant, 'restaurants_created')
+            category_id = None
+            if fields['category']:
+                category_id = self._resolve(self.category_ids, Category, fields['category'], 'categories_created')
+            if restaurant_id is None or (fields['category'] and category_id is None):
+                self._error(line_no, f"unknown restaurant or category ({restaurant!r}, {fields['category']!r})")
+                continue
+            rows.append((restaurant_id, name, fields, category_id))
+
+        # Existing foods for just this batch's names, matched on _key() as
+        # every other name is: SQL's LOWER() neither casefolds nor collapses
+        # whitespace, so the keys are computed here, once per restaurant
+        self._load_food_ids({r[0] for r in rows if r[0] > 0})
+        pks = {self.food_ids.get((restaurant_id, _key(name))) for restaurant_id, name, _, _ in rows}
+        pks.discard(None)
+        existing = {
+            (food.restaurant_id, _key(food.name)): food
+            for food in FoodItem.objects.filter(pk__in=pks).only('id', 'restaurant_id', 'name', *UPDATE_FIELDS)
+        }
+
+        new, changed = [], []
+        for restaurant_id, name, fields, category_id in rows:
+            values = {
+                'price': fields['price'],
+                'description': fields['description'],
+                'category_id': category_id,
+                'is_trending': fields['is_trending'],
+            }
+            food = existing.get((restaurant_id, _key(name)))
+            if food is None:
+                new.append(FoodItem(restaurant_id=restaurant_id, name=name, **values))
+            elif any(getattr(food, attr) != value for attr, value in values.items()):
+                for attr, value in values.items():
+                    setattr(food, attr, value)
+                changed.append(food)
+            else:
+                self.counts['unchanged'] += 1
+
+        self.counts['created'] += len(new)
+        self.counts['updated'] += len(changed)
+        if dry_run:
+            return
+
+        FoodItem.objects.bulk_create(new)
+        for food in new:
+            self.food_ids[(food.restaurant_id, _key(food.name))] = food.pk
+        # bulk_update skips auto_now, and the signal that touches each restaurant
+        now = timezone.now()
+        for food in changed:
+            food.updated_at = now
+        FoodItem.objects.bulk_update(changed, [*UPDATE_FIELDS, 'updated_at'])
+        Restaurant.objects.filter(pk__in={food.restaurant_id for food in new + changed}).update(updated_at=now)
+        # Bulk writes skip the post_save signal that maintains the search index
+        touched = [food.pk for food in new + changed]
+        if touched:
+            get_backend().index(FoodItem.objects.filter(pk__in=touched))
+
+    def _load_food_ids(self, restaurant_ids):
+        restaurant_ids -= self.loaded_restaurants
+        if not restaurant_ids:
+            return
+        foods = (FoodItem.objects.filter(restaurant_id__in=restaurant_ids).order_by('-id')
+                 .values_list('id', 'restaurant_id', 'name'))
+        for pk, restaurant_id, name in foods.iterator(chunk_size=2000):
+            self.food_ids[(restaurant_id, _key(name))] = pk
+        self.loaded_restaurants |= restaurant_ids
+
+    def _resolve(self, ids, model, name, counter):
+        key = _key(name)
+        if key in ids:
+            return ids[key]
+        if self.options['no_create']:
+            return None
+        self.counts[counter] += 1
+        if self.options['dry_run']:
+            self._placeholder -= 1
+            ids[key] = self._placeholder
+        else:
+            ids[key] = model.objects.create(name=name).pk
+        return ids[key]
+
+    def _error(self, line_no, message):
+        self.counts['errors'] += 1
+        if len(self.error_lines) < 20:
+            self.error_lines.append(f"line {line_no}: {message}")
+
+    def _summary(self, elapsed):
+        counts = self.counts
+        for line in self.error_lines:
+            self.stdout.write(self.style.WARNING(f"⚠ {line}"))
+        if counts['errors'] > len(self.error_lines):
+            self.stdout.write(self.style.WARNING(f"⚠ ... {counts['errors'] - len(self.error_lines)} more"))
+
+        self.stdout.write("\n----- SUMMARY -----" + (" (dry run, nothing written)" if self.options['dry_run'] else ""))
+        self.stdout.write(f"Rows read: {counts['read']}")
+        self.stdout.write(f"Foods created: {counts['created']}")
+        self.stdout.write(f"Foods updated: {counts['updated']}")
+        self.stdout.write(f"Foods unchanged: {counts['unchanged']}")
+        self.stdout.write(f"Restaurants created: {counts['restaurants_created']}")
+        self.stdout.write(f"Categories created: {counts['categories_created']}")
+        self.stdout.write(f"Errors: {counts['errors']}")
+        self.stdout.write(f"Elapsed: {elapsed:.2f}s ({counts['read'] / max(elapsed, 1e-9):,.0f} rows/sec)")
+        self.stdout.write("-------------------")
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-18 16:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0004_restaurant_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['name', 'id'], name='restaurant_name_id'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(condition=models.Q(('is_popular', True)), fields=['id'], name='restaurant_popular'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.8 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0005_restaurant_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='restaurant',
+            name='restaurant_popular',
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='popularity_score',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['-popularity_score', '-id'], name='restaurant_popularity'),
+        ),
+    ]
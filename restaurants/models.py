@@ -7,6 +7,18 @@ class Restaurant(models.Model):
     location = models.CharField(max_length=200, blank=True)
     image = models.ImageField(upload_to='restaurants/', blank=True, null=True)
     is_popular = models.BooleanField(default=False)
+    # Sum of its foods' trending scores (main/trending.py)
+    popularity_score = models.FloatField(default=0, editable=False)
+    # Also touched when one of its foods changes (main.signals): the menu page's Last-Modified
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Restaurant list, keyset-paginated on (name, id)
+            models.Index(fields=['name', 'id'], name='restaurant_name_id'),
+            # Home page: the top restaurants by score
+            models.Index(fields=['-popularity_score', '-id'], name='restaurant_popularity'),
+        ]
 
     def __str__(self):
         return self.name
\ No newline at end of file
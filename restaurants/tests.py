@@ -1,3 +1,124 @@
+import json
+import tempfile
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+
+from main import catalog_cache
+from main.models import Category, FoodItem
+from main.search import get_backend
+from .models import Restaurant
+
+
+class ImportMenuTests(TestCase):
+    def setUp(self):
+        self.dir = Path(tempfile.mkdtemp())
+        self.spice = Restaurant.objects.create(name='Spice Route')
+        self.tikka = Category.objects.create(name='Tikka')
+        FoodItem.objects.create(restaurant=self.spice, name='Paneer Tikka', price=200, category=self.tikka)
+
+    def run_import(self, name, content, *args):
+        path = self.dir / name
+        path.write_text(content)
+        out = StringIO()
+        call_command('import_menu', str(path), *args, batch_size=2, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_csv_upsert(self):
+        out = self.run_import('menu.csv', (
+            "restaurant,name,price,description,category,is_trending\n"
+            "spice route,paneer  TIKKA,240,Smoky,Tikka,yes\n"
+            "Spice Route,Dal Makhani,180,,Curry,\n"
+            "Hill Cafe,Momos,90,,,\n"
+            "Hill Cafe,Thukpa,abc,,,\n"
+        ))
+        self.assertIn('Foods created: 2', out)
+        self.assertIn('Foods updated: 1', out)
+        self.assertIn('line 5: invalid price', out)
+
+        paneer = FoodItem.objects.get(restaurant=self.spice, name='Paneer Tikka')
+        self.assertEqual((paneer.price, paneer.description, paneer.is_trending), (Decimal('240.00'), 'Smoky', True))
+        self.assertEqual(FoodItem.objects.get(name='Dal Makhani').category.name, 'Curry')
+        self.assertTrue(Restaurant.objects.filter(name='Hill Cafe').exists())
+        # Bulk writes still reach the search index
+        self.assertTrue(get_backend().search('momos'))
+
+        out = self.run_import('menu.csv', (self.dir / 'menu.csv').read_text())
+        self.assertIn('Foods unchanged: 3', out)
+
+    def test_non_finite_prices_are_row_errors(self):
+        out = self.run_import('menu.csv', (
+            "restaurant,name,price\n"
+            "Spice Route,Dosa,NaN\n"
+            "Spice Route,Idli,sNaN\n"
+            "Spice Route,Vada,Infinity\n"
+            "Spice Route,Upma,60\n"
+        ))
+        self.assertIn('Errors: 3', out)
+        self.assertIn('line 2: invalid price', out)
+        self.assertIn('Foods created: 1', out)
+        self.assertTrue(FoodItem.objects.filter(name='Upma').exists())
+
+    def test_matches_existing_names_like_input_names(self):
+        # Irregular spacing, and a name where casefold() and lower() differ
+        FoodItem.objects.create(restaurant=self.spice, name='Masala   Dosa', price=80)
+        FoodItem.objects.create(restaurant=self.spice, name='Straße Kebab', price=150)
+        out = self.run_import('menu.csv', (
+            "restaurant,name,price\n"
+            "Spice Route,masala dosa,90\n"
+            "Spice Route,STRASSE KEBAB,160\n"
+        ))
+        self.assertIn('Foods created: 0', out)
+        self.assertIn('Foods updated: 2', out)
+        self.assertEqual(FoodItem.objects.get(name='Straße Kebab').price, Decimal('160.00'))
+        self.assertEqual(FoodItem.objects.filter(restaurant=self.spice).count(), 3)
+
+    def test_jsonl_dry_run_writes_nothing(self):
+        rows = [
+            {'restaurant': 'Spice Route', 'name': 'Paneer Tikka', 'price': 260},
+            {'restaurant': 'New Place', 'name': 'Idli', 'price': '40', 'category': 'Breakfast'},
+            {'restaurant': 'New Place', 'name': 'Vada', 'price': 35},
+        ]
+        content = '\n'.join(json.dumps(row) for row in rows) + '\n[1, 2]\n'
+        out = self.run_import('menu.jsonl', content, '--dry-run')
+        self.assertIn('Foods created: 2', out)
+        self.assertIn('Foods updated: 1', out)
+        self.assertIn('Restaurants created: 1', out)
+        self.assertIn('expected a JSON object', out)
+        self.assertEqual(FoodItem.objects.count(), 1)
+        self.assertFalse(Restaurant.objects.filter(name='New Place').exists())
+
+    def test_no_create_rejects_unknown_names(self):
+        out = self.run_import('menu.csv', "restaurant,name,price\nNowhere,Dosa,50\n", '--no-create')
+        self.assertIn('Errors: 1', out)
+        self.assertFalse(Restaurant.objects.filter(name='Nowhere').exists())
+
+
+class RestaurantDetailLastModifiedTests(TestCase):
+    def setUp(self):
+        catalog_cache.get_cache().clear()
+        self.restaurant = Restaurant.objects.create(name='Meghana')
+        self.biryani = FoodItem.objects.create(restaurant=self.restaurant, name='Biryani', price=300)
+        self.url = reverse('restaurant_detail', args=[self.restaurant.pk])
+
+    def test_menu_changes_move_last_modified(self):
+        before = Restaurant.objects.get(pk=self.restaurant.pk).updated_at
+        response = self.client.get(self.url)
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+        self.biryani.delete()
+        self.assertGreater(Restaurant.objects.get(pk=self.restaurant.pk).updated_at, before)
+
+    def test_import_touches_restaurants(self):
+        before = Restaurant.objects.get(pk=self.restaurant.pk).updated_at
+        path = Path(tempfile.mkdtemp()) / 'menu.csv'
+        path.write_text("restaurant,name,price\nMeghana,Biryani,320\n")
+        call_command('import_menu', str(path), stdout=StringIO(), stderr=StringIO())
+        self.assertGreater(Restaurant.objects.get(pk=self.restaurant.pk).updated_at, before)
+        self.assertGreater(FoodItem.objects.get(pk=self.biryani.pk).updated_at, before)
 
-# Create your tests here.
@@ -1,6 +1,11 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+if settings.ASYNC_VIEWS:
+    # ASGI profile: hot endpoints run as native async views
+    from . import async_views as views
+
 urlpatterns = [
     path('', views.restaurant_list, name='restaurant_list'),
     path('<int:pk>/', views.restaurant_detail, name='restaurant_detail'),
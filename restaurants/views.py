@@ -1,42 +1,75 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.http import Http404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 
 from .models import Restaurant
+from orders.cart import get_cart_store
 from orders.models import Order, OrderItem
+from main import catalog_cache, recommendations
+from main.conditional import catalog_conditional
 from main.models import FoodItem
+from main.pagination import KeysetPaginator
+from main.routing import replica_reads
 
 # ----------------------------
 # List all restaurants
 # ----------------------------
+def _restaurant_page(request):
+    """
+    Page of restaurants for the request's ``?cursor=``, cached under the
+    decoded cursor so junk cursors all share the first page's entry.
+    """
+    paginator = KeysetPaginator(Restaurant.objects.all(), ('name', 'id'))
+    cursor = paginator.canonical_cursor(request.GET.get('cursor'))
+    return catalog_cache.get_or_build('restaurant_list', lambda: paginator.get_page(cursor), cursor)
+
+@replica_reads
+@catalog_conditional()
 def restaurant_list(request):
     """
     Display all restaurants.
     """
-    restaurants = Restaurant.objects.all()
+    restaurants = _restaurant_page(request)
     return render(request, 'restaurants/restaurant_list.html', {'restaurants': restaurants})
 
 # ----------------------------
 # Restaurant detail + foods
 # ----------------------------
+def _restaurant_menu(pk):
+    """
+    Restaurant, its food items by name and the pairs of them most often
+    ordered together, or (None, [], []) if it doesn't exist.
+    """
+    restaurant = Restaurant.objects.filter(pk=pk).first()
+    if restaurant is None:
+        return None, [], []
+    foods = list(FoodItem.objects.filter(restaurant=restaurant).order_by('name'))
+    return restaurant, foods, recommendations.pairs([food.pk for food in foods])
+
+def restaurant_last_modified(request, pk):
+    """
+    The restaurant's updated_at, which also moves when one of its foods changes.
+    """
+    return Restaurant.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+
+@replica_reads
+@catalog_conditional(last_modified=restaurant_last_modified)
 def restaurant_detail(request, pk):
     """
     Show details of a single restaurant, including its food items.
     """
-    restaurant = get_object_or_404(Restaurant, pk=pk)
-    
-    # Fetch all FoodItems for this restaurant
-    foods = FoodItem.objects.filter(restaurant=restaurant).order_by('name')
-
-    # Get pending order if user is logged in
-    pending_order = None
-    if request.user.is_authenticated:
-        pending_order = Order.objects.filter(user=request.user, status='PENDING').first()
+    # Restaurant + menu come from the catalog cache; only per-user data is queried
+    restaurant, foods, pairs = catalog_cache.get_or_build(
+        'restaurant_detail', lambda: _restaurant_menu(pk), pk
+    )
+    if restaurant is None:
+        raise Http404("No Restaurant matches the given query.")
 
     return render(request, 'restaurants/restaurant_detail.html', {
         'restaurant': restaurant,
         'foods': foods,
-        'pending_order': pending_order
+        'pairs': pairs,
     })
 
 # ----------------------------
@@ -49,25 +82,7 @@ def add_to_cart(request, food_id):
     """
     food = get_object_or_404(FoodItem, id=food_id)
 
-    # Get or create pending order for user
-    order, _ = Order.objects.get_or_create(
-        user=request.user, status='PENDING', defaults={'total_price': 0}
-    )
-
-    # Add or update OrderItem
-    order_item, created = OrderItem.objects.get_or_create(
-        order=order,
-        food=food,
-        defaults={'price': food.price, 'quantity': 1}
-    )
-
-    if not created:
-        order_item.quantity += 1
-        order_item.save()
-
-    # Update total price of order
-    order.total_price = sum(item.subtotal for item in order.items.all())
-    order.save()
+    get_cart_store().add(request.user, food)
 
     messages.success(request, f"{food.name} added to cart!")
     return redirect('restaurant_detail', pk=food.restaurant.pk)
@@ -88,11 +103,10 @@ def order_now(request, food_id):
         customer_phone = request.POST.get("customer_phone")
         customer_address = request.POST.get("customer_address")
 
-        # Create completed order
+        # Create completed order (total follows from its item)
         order = Order.objects.create(
             user=request.user,
             status='COMPLETED',
-            total_price=food.price,
             customer_name=customer_name,
             customer_phone=customer_phone,
             customer_address=customer_address,